@@ -0,0 +1,3 @@
+"""
+Benchmarks reproducibles de CrossCounter. Ver `benchmarks/run.py`.
+"""
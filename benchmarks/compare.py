@@ -0,0 +1,67 @@
+"""
+Compara dos ejecuciones de `benchmarks.run` y muestra la variación de cada métrica.
+
+Uso:
+    python -m benchmarks.compare benchmarks/results/antes.json benchmarks/results/despues.json
+"""
+import argparse
+import json
+
+
+def _flatten(data, prefix=""):
+    """
+    Aplana un diccionario anidado a claves con notación de puntos, solo valores numéricos.
+    """
+    flat = {}
+    for key, value in data.items():
+        path = f"{prefix}.{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare(baseline, candidate):
+    """
+    Calcula la variación relativa entre dos informes.
+
+    Args:
+        baseline (dict): Informe de referencia.
+        candidate (dict): Informe a comparar.
+
+    Returns:
+        list: Tuplas (métrica, valor base, valor nuevo, variación en %).
+    """
+    before = _flatten(baseline["results"])
+    after = _flatten(candidate["results"])
+    rows = []
+    for key in sorted(before.keys() & after.keys()):
+        old, new = before[key], after[key]
+        delta = (new - old) / old * 100 if old else None
+        rows.append((key, old, new, delta))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara dos resultados de benchmarks")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--filter", default="", help="Mostrar solo métricas que contengan este texto")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline, encoding="utf-8") as file:
+        baseline = json.load(file)
+    with open(args.candidate, encoding="utf-8") as file:
+        candidate = json.load(file)
+
+    print(f"{'métrica':60} {'base':>14} {'nuevo':>14} {'Δ %':>9}")
+    for key, old, new, delta in compare(baseline, candidate):
+        if args.filter not in key:
+            continue
+        delta_text = f"{delta:+.1f}" if delta is not None else "n/a"
+        print(f"{key:60} {old:>14.4g} {new:>14.4g} {delta_text:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+"""
+Sustitutos locales de servicios externos para ejecutar los benchmarks sin red.
+
+`InMemoryCollection` imita el subconjunto de la API de `pymongo.collection.Collection`
+que usa la aplicación (inserciones, `find`, `distinct`, `update_one`, `delete_many` y
+las etapas de agregación empleadas por `get_inference_statistics`) y contabiliza el
+coste de escritura.
+"""
+import copy
+import time
+from collections import defaultdict
+
+try:
+    import bson
+except ImportError:  # pymongo no instalado: se estima el tamaño con repr()
+    bson = None
+
+try:
+    from pymongo.errors import AutoReconnect, ServerSelectionTimeoutError
+except ImportError:
+    AutoReconnect = ServerSelectionTimeoutError = ConnectionError
+
+
+def _document_size(document):
+    """
+    Estima el tamaño en bytes de un documento tal como viajaría a MongoDB.
+    """
+    if bson is not None:
+        return len(bson.encode({k: v for k, v in document.items() if k != "_id"}))
+    return len(repr(document).encode("utf-8"))
+
+
+def _get_path(document, path):
+    """
+    Obtiene el valor de un campo con notación de puntos ("a.b.c").
+    """
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def _evaluate(expression, document):
+    """
+    Evalúa una expresión de agregación sobre un documento.
+    Soporta rutas ("$campo"), constantes, objetos y los operadores de fecha usados por la app.
+    """
+    if isinstance(expression, str) and expression.startswith("$"):
+        return _get_path(document, expression[1:])
+    if isinstance(expression, dict):
+        if len(expression) == 1:
+            operator, argument = next(iter(expression.items()))
+            if operator in _DATE_OPERATORS:
+                value = _evaluate(argument, document)
+                return _DATE_OPERATORS[operator](value) if value is not None else None
+            if operator == "$ifNull":
+                values = (_evaluate(value, document) for value in argument)
+                return next((value for value in values if value is not None), None)
+        return {key: _evaluate(value, document) for key, value in expression.items()}
+    return expression
+
+
+_DATE_OPERATORS = {
+    "$year": lambda d: d.year,
+    "$month": lambda d: d.month,
+    "$dayOfMonth": lambda d: d.day,
+    "$hour": lambda d: d.hour,
+    "$dayOfWeek": lambda d: d.isoweekday() % 7 + 1,
+}
+
+
+def _matches(document, query):
+    """
+    Comprueba si un documento cumple un filtro de `find`/`$match`.
+    Soporta igualdad y los operadores $gt, $gte, $lt, $lte, $in, $ne y $exists.
+    """
+    for field, condition in query.items():
+        if field == "$and":
+            if not all(_matches(document, sub) for sub in condition):
+                return False
+            continue
+        if field == "$or":
+            if not any(_matches(document, sub) for sub in condition):
+                return False
+            continue
+
+        value = _get_path(document, field)
+        if isinstance(condition, dict) and any(key.startswith("$") for key in condition):
+            for operator, operand in condition.items():
+                if operator == "$exists":
+                    if (value is not None) != bool(operand):
+                        return False
+                elif operator == "$in":
+                    if value not in operand:
+                        return False
+                elif operator == "$ne":
+                    if value == operand:
+                        return False
+                elif value is None:
+                    return False
+                elif operator == "$gt" and not value > operand:
+                    return False
+                elif operator == "$gte" and not value >= operand:
+                    return False
+                elif operator == "$lt" and not value < operand:
+                    return False
+                elif operator == "$lte" and not value <= operand:
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _indexed(query):
+    """
+    Copia del filtro con los operandos de `$in` como conjuntos (búsqueda en O(1)).
+    """
+    indexed = {}
+    for field, condition in (query or {}).items():
+        if isinstance(condition, dict) and isinstance(condition.get("$in"), list):
+            try:
+                condition = {**condition, "$in": frozenset(condition["$in"])}
+            except TypeError:  # Valores no hashables: se deja la lista
+                pass
+        indexed[field] = condition
+    return indexed
+
+
+def _group(documents, spec):
+    """
+    Implementa la etapa `$group` con los acumuladores $sum, $min, $max, $avg y $first.
+    """
+    groups = {}
+    for document in documents:
+        key = _evaluate(spec["_id"], document)
+        hashable_key = repr(key)
+        if hashable_key not in groups:
+            groups[hashable_key] = {"_id": key, "_values": defaultdict(list)}
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            operator, argument = next(iter(accumulator.items()))
+            groups[hashable_key]["_values"][field].append(_evaluate(argument, document))
+
+    results = []
+    for group in groups.values():
+        row = {"_id": group["_id"]}
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            operator = next(iter(accumulator))
+            values = [v for v in group["_values"][field] if v is not None]
+            if operator == "$sum":
+                row[field] = sum(values)
+            elif operator == "$min":
+                row[field] = min(values) if values else None
+            elif operator == "$max":
+                row[field] = max(values) if values else None
+            elif operator == "$avg":
+                row[field] = sum(values) / len(values) if values else None
+            elif operator == "$first":
+                row[field] = values[0] if values else None
+            else:
+                raise NotImplementedError(f"Acumulador no soportado: {operator}")
+        results.append(row)
+    return results
+
+
+class _Cursor:
+    """
+    Cursor mínimo compatible con `find().limit()`, `sort()` y `batch_size()`.
+    """
+
+    def __init__(self, documents):
+        self._documents = documents
+
+    def limit(self, count):
+        if count:
+            self._documents = self._documents[:count]
+        return self
+
+    def sort(self, key, direction=1):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for field, field_direction in reversed(keys):
+            self._documents = sorted(
+                self._documents, key=lambda d: _get_path(d, field), reverse=field_direction < 0
+            )
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def __iter__(self):
+        return iter(self._documents)
+
+
+class InMemoryCollection:
+    """
+    Colección en memoria que sustituye a MongoDB en los benchmarks.
+
+    Para simular un servidor caído, `available = False` hace fallar todas las
+    operaciones; `fail_after_write = n` hace que las próximas n escrituras se guarden
+    pero respondan con error (como un timeout tras escribir).
+
+    Args:
+        write_latency_s (float): Latencia simulada por operación de escritura
+            (p. ej. 0.03 para aproximar el RTT a MongoDB Atlas).
+    """
+
+    def __init__(self, write_latency_s=0.0):
+        self.documents = []
+        self.write_latency_s = write_latency_s
+        self.available = True
+        self.fail_after_write = 0
+        self._next_id = 0
+        self.reset_stats()
+
+    def _new_id(self):
+        # Sin reutilizar identificadores tras un borrado
+        self._next_id = max(self._next_id, len(self.documents)) + 1
+        return self._next_id - 1
+
+    def _check_available(self):
+        if not self.available:
+            raise ServerSelectionTimeoutError("Servidor no disponible (simulado)")
+
+    def reset_stats(self):
+        """
+        Reinicia los contadores de coste de escritura.
+        """
+        self.stats = {
+            "write_ops": 0,
+            "documents_written": 0,
+            "bytes_written": 0,
+            "write_seconds": 0.0,
+        }
+
+    def _record_write(self, documents, start):
+        if self.write_latency_s:
+            time.sleep(self.write_latency_s)
+        self.stats["write_ops"] += 1
+        self.stats["documents_written"] += len(documents)
+        self.stats["bytes_written"] += sum(_document_size(d) for d in documents)
+        self.stats["write_seconds"] += time.perf_counter() - start
+        if self.fail_after_write > 0:
+            self.fail_after_write -= 1
+            raise AutoReconnect("Conexión cerrada tras escribir (simulado)")
+
+    def insert_one(self, document):
+        self._check_available()
+        start = time.perf_counter()
+        document.setdefault("_id", self._new_id())
+        self.documents.append(copy.deepcopy(document))
+        self._record_write([document], start)
+
+    def insert_many(self, documents, ordered=True):
+        self._check_available()
+        start = time.perf_counter()
+        documents = list(documents)
+        for document in documents:
+            document.setdefault("_id", self._new_id())
+            self.documents.append(copy.deepcopy(document))
+        self._record_write(documents, start)
+
+    def bulk_write(self, requests, ordered=True):
+        """
+        Aplica operaciones `UpdateOne` con `upsert` y `$setOnInsert` (las que usa
+        `utils.mongodb.write_documents`) y `ReplaceOne` con `upsert` (las de
+        `utils.retention` y `utils.mongodb.save_window_results`), filtradas por una
+        única clave.
+        """
+        self._check_available()
+        start = time.perf_counter()
+        # Claves ya guardadas, como el índice único del servidor
+        existing = {}
+        positions = {}
+        written = []
+        for request in requests:
+            (field, value), = request._filter.items()
+            if "$setOnInsert" not in request._doc:
+                # Reemplazo: se conserva el _id y la posición del documento anterior
+                if field not in positions:
+                    positions[field] = {_get_path(d, field): i for i, d in enumerate(self.documents)}
+                document = copy.deepcopy(request._doc)
+                position = positions[field].get(value)
+                if position is None:
+                    # Como en el servidor, un upsert por _id conserva el del filtro
+                    document["_id"] = value if field == "_id" else self._new_id()
+                    positions[field][value] = len(self.documents)
+                    self.documents.append(document)
+                else:
+                    document["_id"] = self.documents[position]["_id"]
+                    self.documents[position] = document
+                existing.pop(field, None)
+                written.append(document)
+                continue
+            if field not in existing:
+                existing[field] = {_get_path(document, field) for document in self.documents}
+            if value in existing[field]:
+                continue
+            document = copy.deepcopy(request._doc.get("$setOnInsert", {}))
+            document.setdefault("_id", self._new_id())
+            self.documents.append(document)
+            existing[field].add(value)
+            written.append(document)
+        self._record_write(written, start)
+
+    def find(self, query=None, projection=None):
+        query = _indexed(query)
+        documents = [copy.deepcopy(d) for d in self.documents if _matches(d, query)]
+        return _Cursor(documents)
+
+    def distinct(self, key, query=None):
+        self._check_available()
+        values = []
+        for document in self.documents:
+            value = _get_path(document, key)
+            if _matches(document, query or {}) and value not in values:
+                values.append(value)
+        return values
+
+    def update_one(self, query, update, upsert=False):
+        start = time.perf_counter()
+        for document in self.documents:
+            if _matches(document, query):
+                document.update(copy.deepcopy(update.get("$set", {})))
+                break
+        else:
+            if upsert:
+                document = {k: v for k, v in query.items() if not isinstance(v, dict)}
+                document.update(copy.deepcopy(update.get("$set", {})))
+                self.documents.append(document)
+        self._record_write([query], start)
+
+    def delete_many(self, query):
+        self._check_available()
+        start = time.perf_counter()
+        query = _indexed(query)
+        deleted = [d for d in self.documents if _matches(d, query)]
+        if deleted:
+            removed = {id(d) for d in deleted}
+            self.documents = [d for d in self.documents if id(d) not in removed]
+        self._record_write([query], start)
+        return len(deleted)
+
+    def count_documents(self, query):
+        return sum(1 for d in self.documents if _matches(d, query))
+
+    def aggregate(self, pipeline, **kwargs):
+        documents = self.documents
+        for stage in pipeline:
+            operator, spec = next(iter(stage.items()))
+            if operator == "$match":
+                documents = [d for d in documents if _matches(d, spec)]
+            elif operator == "$group":
+                documents = _group(documents, spec)
+            elif operator == "$sort":
+                for key, direction in reversed(list(spec.items())):
+                    documents = sorted(
+                        documents, key=lambda d: _get_path(d, key), reverse=direction < 0
+                    )
+            else:
+                raise NotImplementedError(f"Etapa de agregación no soportada: {operator}")
+        return iter(copy.deepcopy(documents))
+
+    def create_index(self, keys, **kwargs):
+        return "_".join(f"{k}_{v}" for k, v in (keys if isinstance(keys, list) else [(keys, 1)]))
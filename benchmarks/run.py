@@ -0,0 +1,773 @@
+"""
+Suite de benchmarks reproducibles de CrossCounter.
+
+Mide throughput de extremo a extremo, latencia por etapa, pico de memoria (RSS) y
+coste de escritura en MongoDB para `process_image`, `process_video` y la consulta
+de estadísticas, además del tiempo de arranque de la aplicación. Funciona sin red: MongoDB se sustituye por `InMemoryCollection`
+y los videos se generan de forma sintética y determinista.
+
+Uso:
+    python -m benchmarks.run
+    python -m benchmarks.run --cases video --profiles short-720p,medium-720p --frame-interval 30
+    python -m benchmarks.compare benchmarks/results/a.json benchmarks/results/b.json
+
+Cada caso se ejecuta en un proceso nuevo para que el pico de RSS sea el del caso.
+El caso `concurrent` usa el planificador de inferencia si se define
+CROSSCOUNTER_INFERENCE_WORKERS (y CROSSCOUNTER_SCHEDULER_PROFILE).
+Requiere el modelo en `models/best.pt` (o la ruta indicada en CROSSCOUNTER_MODEL_PATH).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+SAMPLE_IMAGE = ROOT / "media" / "scene00199test.jpg"
+
+
+def _prepare_environment():
+    """
+    Configura un entorno offline: credenciales ficticias (la conexión real nunca se usa)
+    y el directorio de trabajo en la raíz del repositorio.
+    """
+    os.environ.setdefault("MONGO_URI", "mongodb://127.0.0.1:27017/?connect=false&serverSelectionTimeoutMS=100")
+    os.environ.setdefault("YOUTUBE_API_KEY", "offline-benchmark")
+    # Spool propio de cada proceso: los documentos de prueba nunca llegan al spool real
+    os.environ["CROSSCOUNTER_SPOOL_PATH"] = os.path.join(
+        tempfile.gettempdir(), f"crosscounter-benchmark-spool-{os.getpid()}.sqlite3"
+    )
+    # Réplica analítica y mapas de calor propios de cada proceso, fuera de los reales
+    os.environ["CROSSCOUNTER_ANALYTICS_DIR"] = os.path.join(
+        tempfile.gettempdir(), f"crosscounter-benchmark-analytics-{os.getpid()}"
+    )
+    os.environ["CROSSCOUNTER_HEATMAP_DIR"] = os.path.join(
+        tempfile.gettempdir(), f"crosscounter-benchmark-heatmaps-{os.getpid()}"
+    )
+    os.chdir(ROOT)
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+
+
+def install_fake_mongo(write_latency_s=0.0):
+    """
+    Sustituye las colecciones de `utils.mongodb` (detecciones, registro de cámaras y
+    ventanas en streaming) por colecciones en memoria.
+
+    Returns:
+        InMemoryCollection: La colección instalada.
+    """
+    from benchmarks.fakes import InMemoryCollection
+    from utils import mongodb
+
+    fake = InMemoryCollection(write_latency_s=write_latency_s)
+    mongodb.collection = fake
+    mongodb.sources = InMemoryCollection()
+    mongodb.window_stats = InMemoryCollection()
+    return fake
+
+
+def peak_rss_mb():
+    """
+    Pico de memoria residente del proceso actual en MB.
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KB y macOS bytes
+    return round(usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024, 1)
+
+
+def percentiles(values):
+    """
+    Resume una lista de latencias en segundos con p50, p95 y máximo en ms.
+    """
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000, 3)
+
+    return {"p50_ms": pick(0.5), "p95_ms": pick(0.95), "max_ms": round(ordered[-1] * 1000, 3), "n": len(ordered)}
+
+
+def _flushed_stats(fake):
+    """
+    Coste de escritura en la colección en memoria, tras vaciar el spool de resultados.
+    """
+    from utils import mongodb
+
+    mongodb.flush_spool(timeout=60)
+    return fake.stats
+
+
+def bench_spool(params):
+    """
+    Simula una caída de MongoDB: mide la latencia de guardar resultados con el servidor
+    caído (van al spool local), que el cortacircuitos se abre y que al volver el
+    servidor se escribe cada resultado exactamente una vez, también cuando una
+    escritura falla después de haberse guardado o se guarda de nuevo una inferencia.
+    """
+    fake = install_fake_mongo()
+    from utils import mongodb
+
+    mongodb.breaker.reset_timeout_s = 0.5
+    drainer = mongodb.get_spool_drainer()
+    drainer.min_backoff_s = 0.05
+    drainer.max_backoff_s = 0.5
+
+    origin = datetime(2024, 1, 1)
+    batches = params["repeats"] * 10
+    frames = [{"timestamp": origin + timedelta(seconds=i), "frame_idx": i, "motorcycle_count": i % 5} for i in range(100)]
+
+    fake.available = False
+    latencies = []
+    for batch in range(batches):
+        start = time.perf_counter()
+        mongodb.save_inference_result_video(f"spool-{batch}", frames)
+        latencies.append(time.perf_counter() - start)
+    # Esperar a que los reintentos fallidos abran el circuito
+    deadline = time.perf_counter() + 10
+    while mongodb.breaker.state == "closed" and time.perf_counter() < deadline:
+        time.sleep(0.05)
+    circuit_during_outage = mongodb.breaker.state
+    pending_during_outage = drainer.spool.pending()
+
+    # Vuelve el servidor; la primera escritura se guarda pero responde con error
+    fake.available = True
+    fake.fail_after_write = 1
+    start = time.perf_counter()
+    flushed = mongodb.flush_spool(timeout=60)
+    drain_s = time.perf_counter() - start
+
+    # Guardar de nuevo una inferencia ya escrita no debe duplicar sus documentos
+    mongodb.save_inference_result_video("spool-0", frames)
+    mongodb.flush_spool(timeout=60)
+
+    detection_ids = [document["detection_id"] for document in fake.documents]
+    expected = batches * len(frames)
+    return {
+        "documents": expected,
+        "save_latency_during_outage": percentiles(latencies),
+        "circuit_during_outage": circuit_during_outage,
+        "pending_during_outage": pending_during_outage,
+        "drain_s": round(drain_s, 3),
+        "flushed": flushed,
+        "written": len(set(detection_ids)),
+        "duplicates": len(detection_ids) - len(set(detection_ids)),
+        "lost": expected - len(set(detection_ids)),
+        "drainer": drainer.stats,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _import_pipeline():
+    """
+    Importa el pipeline de inferencia y carga el modelo midiendo el tiempo total.
+    """
+    start = time.perf_counter()
+    from utils import inference
+    inference.get_inference_model("benchmark")
+    return inference, round(time.perf_counter() - start, 3)
+
+
+def bench_image(params):
+    """
+    Latencia de `process_image` sobre la imagen de ejemplo y coste de guardar el resultado.
+    """
+    fake = install_fake_mongo(params["write_latency_s"])
+    inference, import_s = _import_pipeline()
+    from utils.helpers import generate_inference_id
+    from utils.mongodb import detection_key, save_inference_result_image
+
+    tiling_options = {"mode": params["tiling"]}
+    inference.process_image(str(SAMPLE_IMAGE), tiling_options=tiling_options)  # Calentamiento
+
+    latencies = []
+    stage_totals = {}
+    for _ in range(params["repeats"]):
+        start = time.perf_counter()
+        detections = inference.process_image(str(SAMPLE_IMAGE), tiling_options=tiling_options)
+        latencies.append(time.perf_counter() - start)
+        for name, stage in detections["metrics"]["stages"].items():
+            stage_totals[name] = stage_totals.get(name, 0.0) + stage["total_s"]
+
+        inference_id = generate_inference_id()
+        save_inference_result_image({
+            "type": "image",
+            "inference_id": inference_id,
+            "detection_id": detection_key(inference_id),
+            "motorcycle_count": len(detections["predictions"]),
+            "timestamp": datetime.now(),
+        })
+
+    return {
+        "import_s": import_s,
+        "latency": percentiles(latencies),
+        "images_per_s": round(len(latencies) / sum(latencies), 3),
+        "stages_mean_ms": {k: round(v / len(latencies) * 1000, 3) for k, v in stage_totals.items()},
+        "tiling": detections["tiling"],
+        "mongo": _flushed_stats(fake),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_video(params):
+    """
+    Throughput de `process_video` sobre un video sintético y coste de guardar sus resultados.
+    """
+    fake = install_fake_mongo(params["write_latency_s"])
+    inference, import_s = _import_pipeline()
+    from utils.mongodb import save_inference_result_video
+
+    video = params["video"]
+
+    def run():
+        return inference.process_video(
+            video["video_path"],
+            frame_interval=params["frame_interval"],
+            total_frames=video["total_frames"],
+            output_options=params["output_options"],
+            tiling_options={"mode": params["tiling"]},
+            use_frame_cache=params["frame_cache"],
+        )
+
+    # Con caché de frames, la primera pasada la llena y se mide la siguiente
+    cache_fill_s = None
+    if params["frame_cache"]:
+        start = time.perf_counter()
+        os.remove(run()["processed_video_path"])
+        cache_fill_s = round(time.perf_counter() - start, 3)
+
+    start = time.perf_counter()
+    results = run()
+    elapsed = time.perf_counter() - start
+
+    save_inference_result_video(
+        inference_id=results["inference_id"],
+        motorcycle_count_per_frame=results["motorcycle_count_per_frame"],
+    )
+
+    output_bytes = os.path.getsize(results["processed_video_path"])
+    os.remove(results["processed_video_path"])
+
+    return {
+        "import_s": import_s,
+        "profile": params["profile"],
+        "frame_interval": params["frame_interval"],
+        "frames": results["frames_processed"],
+        "sampled_frames": len(results["motorcycle_count_per_frame"]),
+        "wall_s": round(elapsed, 3),
+        "frames_per_s": round(results["frames_processed"] / elapsed, 3),
+        "stages": results["metrics"]["stages"],
+        "output": results["output"],
+        "tiling": results["tiling"],
+        "heatmap": results["heatmap"],
+        "stream": results["stream"],
+        "frame_cache": results["frame_cache"],
+        "cache_fill_s": cache_fill_s,
+        "output_bytes": output_bytes,
+        "input_bytes": os.path.getsize(video["video_path"]),
+        "mongo": _flushed_stats(fake),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _fast_model_channels_ok():
+    """
+    Comprueba que el filtro fast_model entrega al modelo los canales en el orden que
+    espera Ultralytics (arrays de numpy en BGR, imágenes PIL en RGB): un frame rojo
+    debe llegarle como rojo.
+    """
+    import numpy as np
+    from PIL import Image
+
+    from utils.cascade import CascadeGate
+
+    received = []
+
+    def probe(source, **kwargs):
+        received.append(source)
+        return [SimpleNamespace(boxes=[], names={})]
+
+    frame = np.zeros((32, 32, 3), dtype=np.uint8)
+    frame[..., 2] = 255  # Rojo en BGR
+    CascadeGate(fast_model=probe, gate="fast_model").should_run(frame)
+    source = received[0]
+    rgb = np.asarray(source) if isinstance(source, Image.Image) else np.asarray(source)[..., ::-1]
+    return bool((rgb[..., 0] == 255).all() and (rgb[..., 2] == 0).all())
+
+
+def bench_cascade(params):
+    """
+    Cómputo evitado por la cascada (filtro barato antes del modelo completo) y su
+    impacto en el recall, comparando con el mismo video sin cascada y con la verdad
+    de terreno del video sintético.
+    """
+    install_fake_mongo(params["write_latency_s"])
+    inference, import_s = _import_pipeline()
+    video = params["video"]
+    with open(video["ground_truth_path"], encoding="utf-8") as file:
+        ground_truth = json.load(file)["boxes"]
+
+    runs = {}
+    for name, cascade_options in (("baseline", None), ("cascade", {"gate": params["cascade"]})):
+        start = time.perf_counter()
+        results = inference.process_video(
+            video["video_path"],
+            frame_interval=params["frame_interval"],
+            total_frames=video["total_frames"],
+            output_options=params["output_options"],
+            tiling_options={"mode": params["tiling"]},
+            cascade_options=cascade_options,
+        )
+        elapsed = time.perf_counter() - start
+        os.remove(results["processed_video_path"])
+
+        counts = {frame["frame_idx"]: frame["motorcycle_count"] for frame in results["motorcycle_count_per_frame"]}
+        positives = [frame_idx for frame_idx in counts if ground_truth[frame_idx]]
+        stages = results["metrics"]["stages"]
+        runs[name] = {
+            "wall_s": round(elapsed, 3),
+            "inference_s": stages.get("inference", {}).get("total_s", 0.0),
+            "gate_s": stages.get("gate", {}).get("total_s", 0.0),
+            "total_motos": results["total_motos"],
+            # Frames muestreados con motocicletas (verdad de terreno) en los que se detectó alguna
+            "frame_recall": round(sum(counts[i] > 0 for i in positives) / len(positives), 3) if positives else None,
+            "cascade": results["cascade"],
+        }
+
+    baseline, cascade = runs["baseline"], runs["cascade"]
+    return {
+        "import_s": import_s,
+        "profile": params["profile"],
+        "gate": params["cascade"],
+        "fast_model_channels_ok": _fast_model_channels_ok(),
+        "runs": runs,
+        "compute_saved": cascade["cascade"]["compute_saved"],
+        "inference_s_saved": round(baseline["inference_s"] - cascade["inference_s"] - cascade["gate_s"], 3),
+        "detections_kept": round(cascade["total_motos"] / baseline["total_motos"], 3) if baseline["total_motos"] else None,
+        "frame_recall_delta": (
+            round(cascade["frame_recall"] - baseline["frame_recall"], 3) if baseline["frame_recall"] is not None else None
+        ),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_segment(params):
+    """
+    Coste de dividir un video en segmentos por copia de stream y exactitud de los
+    desplazamientos de frame (la suma de frames de los segmentos debe ser la del video).
+    """
+    from utils.helpers import segment_video
+
+    video = params["video"]
+    start = time.perf_counter()
+    segments = segment_video(video["video_path"], segment_duration=params["segment_duration"])
+    elapsed = time.perf_counter() - start
+    frames = sum(segment["frames"] for segment in segments)
+    shutil.rmtree(os.path.dirname(segments[0]["path"]), ignore_errors=True)
+
+    return {
+        "profile": params["profile"],
+        "segment_duration": params["segment_duration"],
+        "segments": len(segments),
+        "wall_s": round(elapsed, 3),
+        "frames": frames,
+        "frames_match": frames == video["total_frames"],
+        "offsets": [segment["frame_offset"] for segment in segments],
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_concurrent(params):
+    """
+    Varios `process_video` simultáneos (como varias sesiones de Streamlit): throughput
+    total, latencia por video y uso del planificador de inferencia si está activo (si
+    no, del pool de instancias del modelo).
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    install_fake_mongo(params["write_latency_s"])
+    inference, import_s = _import_pipeline()
+    from utils.scheduler import get_inference_model, get_scheduler
+
+    video = params["video"]
+
+    def run_job(_):
+        start = time.perf_counter()
+        results = inference.process_video(
+            video["video_path"],
+            frame_interval=params["frame_interval"],
+            total_frames=video["total_frames"],
+            output_options={**params["output_options"], "mode": "keyframes"},
+        )
+        os.remove(results["processed_video_path"])
+        return time.perf_counter() - start, results["frames_processed"]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=params["concurrency"]) as executor:
+        jobs = list(executor.map(run_job, range(params["concurrency"])))
+    elapsed = time.perf_counter() - start
+
+    scheduler = get_scheduler()
+    return {
+        "import_s": import_s,
+        "profile": params["profile"],
+        "concurrency": params["concurrency"],
+        "wall_s": round(elapsed, 3),
+        "frames_per_s": round(sum(frames for _, frames in jobs) / elapsed, 3),
+        "job_latency": percentiles([latency for latency, _ in jobs]),
+        "scheduler": scheduler.stats if scheduler is not None else None,
+        # Sin planificador, instancias del modelo y esperas de las sesiones
+        "model_pool": get_inference_model("benchmark").pool.stats if scheduler is None else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+SEED_CAMERAS = 8
+
+
+def seed_documents(fake, count, seed=0, span_days=365):
+    """
+    Llena la colección en memoria con detecciones de video repartidas en los primeros
+    `span_days` días de 2024 entre `SEED_CAMERAS` cámaras.
+    """
+    import random
+
+    rng = random.Random(seed)
+    origin = datetime(2024, 1, 1)
+    fake.documents = [
+        {
+            "_id": i,
+            "type": "video",
+            "inference_id": f"bench-{i // 100}",
+            "detection_id": f"bench-{i}",
+            "camera": f"cam-{i // 100 % SEED_CAMERAS}",
+            "timestamp": origin + timedelta(seconds=rng.randrange(span_days * 24 * 3600)),
+            "motorcycle_count": rng.randrange(0, 12),
+        }
+        for i in range(count)
+    ]
+
+
+def bench_statistics(params):
+    """
+    Latencia de `get_inference_statistics` por nivel sobre una colección sembrada, para
+    todas las cámaras, una sola cámara y la comparación entre cámaras.
+    """
+    fake = install_fake_mongo()
+    seed_documents(fake, params["documents"], params["seed"])
+    from utils.mongodb import get_inference_statistics
+
+    filters = {
+        "day": {"year": 2024, "month": 6, "day": 15},
+        "month": {"year": 2024, "month": 6},
+        "year": {"year": 2024},
+    }
+    selections = {
+        "all": {},
+        "one_camera": {"cameras": ["cam-0"]},
+        "by_camera": {"by_camera": True},
+    }
+    levels = {}
+    for level, level_filters in filters.items():
+        levels[level] = {}
+        for selection, options in selections.items():
+            latencies = []
+            for _ in range(params["repeats"]):
+                start = time.perf_counter()
+                data = get_inference_statistics(level, dict(level_filters), **options)
+                latencies.append(time.perf_counter() - start)
+            levels[level][selection] = {"latency": percentiles(latencies), "rows": len(data)}
+
+    return {"documents": params["documents"], "levels": levels, "peak_rss_mb": peak_rss_mb()}
+
+
+def bench_analytics(params):
+    """
+    Réplica analítica local: tiempo de la sincronización completa e incremental y
+    latencia de las consultas en DuckDB (estadísticas por nivel, perfil por hora,
+    horas pico y semana a semana). Entre ambas sincronizaciones llega un video con
+    fecha de grabación antigua, que la incremental debe recoger.
+    """
+    fake = install_fake_mongo()
+    seed_documents(fake, params["documents"], params["seed"])
+    from utils import analytics, mongodb
+
+    start = time.perf_counter()
+    full = analytics.sync_mirror(full=True)
+    full_sync_s = time.perf_counter() - start
+
+    late = mongodb.build_video_documents("bench-late", [
+        {"timestamp": datetime(2024, 3, 1) + timedelta(seconds=i), "frame_idx": i, "motorcycle_count": 1}
+        for i in range(100)
+    ])
+    mongodb.write_documents(late)
+    start = time.perf_counter()
+    incremental = analytics.sync_mirror()
+    incremental_sync_s = time.perf_counter() - start
+
+    year = (datetime(2024, 1, 1), datetime(2025, 1, 1))
+    queries = {
+        "day": lambda: analytics.get_mirror_statistics("day", {"year": 2024, "month": 6, "day": 15}),
+        "month": lambda: analytics.get_mirror_statistics("month", {"year": 2024, "month": 6}),
+        "year": lambda: analytics.get_mirror_statistics("year", {"year": 2024}, by_camera=True),
+        "hourly_profile": lambda: analytics.hourly_profile(*year),
+        "peak_hours": lambda: analytics.peak_hours(*year),
+        "week_over_week": lambda: analytics.week_over_week(end=year[1]),
+    }
+    latencies = {}
+    for name, run in queries.items():
+        values = []
+        for _ in range(params["repeats"]):
+            query_start = time.perf_counter()
+            run()
+            values.append(time.perf_counter() - query_start)
+        latencies[name] = percentiles(values)
+
+    return {
+        "documents": params["documents"],
+        "full_sync_s": round(full_sync_s, 3),
+        "incremental_sync_s": round(incremental_sync_s, 3),
+        "rows": full["rows"],
+        "late_documents": len(late),
+        "incremental_added": incremental["added"],
+        "queries": latencies,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_retention(params):
+    """
+    Compactación de las detecciones antiguas en agregados por hora: duración de la
+    simulación y de la compactación, documentos resultantes, latencia de las
+    estadísticas antes y después, y totales verificados.
+    """
+    fake = install_fake_mongo()
+    # Dos semanas: varios frames por cámara y hora, como en un video muestreado
+    seed_documents(fake, params["documents"], params["seed"], span_days=14)
+    from utils import retention
+    from utils.mongodb import get_inference_statistics, get_source_totals
+
+    def statistics_latency():
+        values = []
+        for _ in range(params["repeats"]):
+            start = time.perf_counter()
+            data = get_inference_statistics("year", {"year": 2024}, by_camera=True)
+            values.append(time.perf_counter() - start)
+        return percentiles(values), data
+
+    latency_before, statistics_before = statistics_latency()
+    sources_before = get_source_totals({"year": 2024})
+    documents_before = len(fake.documents)
+
+    start = time.perf_counter()
+    plan = retention.dry_run(timedelta(days=30))
+    dry_run_s = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as archive_dir:
+        retention.ARCHIVE_DIR = archive_dir
+        report = retention.compact(timedelta(days=30), max_docs_per_s=0)
+        archive_bytes = sum(os.path.getsize(path) for path in report["archives"])
+
+    latency_after, statistics_after = statistics_latency()
+    sources_after = get_source_totals({"year": 2024})
+    return {
+        "documents_before": documents_before,
+        "documents_after": len(fake.documents),
+        "planned_aggregates": plan["aggregates"],
+        "dry_run_s": round(dry_run_s, 3),
+        "compact_s": report["elapsed_s"],
+        "batches": report["batches"],
+        "archive_mb": round(archive_bytes / 2**20, 3),
+        "verified": report["verified"],
+        "statistics_unchanged": statistics_before.equals(statistics_after),
+        "source_totals_unchanged": sources_before.equals(sources_after),
+        "statistics_before": latency_before,
+        "statistics_after": latency_after,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+# Módulos pesados que no deberían importarse al abrir la aplicación
+HEAVY_MODULES = ("torch", "ultralytics", "googleapiclient", "yt_dlp", "pytube")
+
+
+def bench_startup(params):
+    """
+    Tiempo hasta el primer render de `main.py` (arranque en frío, con imports) y de
+    los reruns posteriores, usando `streamlit.testing.v1.AppTest`.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    seed_documents(install_fake_mongo(), params["documents"], params["seed"])
+
+    app = AppTest.from_file(str(ROOT / "main.py"), default_timeout=120)
+    app.secrets["YOUTUBE"] = {"YOUTUBE_API_KEY": os.environ["YOUTUBE_API_KEY"]}
+    app.secrets["MONGO"] = {"MONGO_URI": os.environ["MONGO_URI"]}
+
+    start = time.perf_counter()
+    app.run()
+    first_paint_s = time.perf_counter() - start
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+
+    reruns = []
+    for _ in range(params["repeats"]):
+        start = time.perf_counter()
+        app.run()
+        reruns.append(time.perf_counter() - start)
+
+    return {
+        "first_paint_s": round(first_paint_s, 3),
+        "rerun": percentiles(reruns),
+        "heavy_modules_loaded": [name for name in HEAVY_MODULES if name in sys.modules],
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+CASES = {
+    "image": bench_image,
+    "video": bench_video,
+    "concurrent": bench_concurrent,
+    "cascade": bench_cascade,
+    "statistics": bench_statistics,
+    "startup": bench_startup,
+    "spool": bench_spool,
+    "segment": bench_segment,
+    "analytics": bench_analytics,
+    "retention": bench_retention,
+}
+
+
+def _child(case, params, queue):
+    _prepare_environment()
+    try:
+        queue.put({"ok": True, "result": CASES[case](params)})
+    except BaseException as e:  # st.stop() lanza una excepción propia de Streamlit
+        queue.put({"ok": False, "error": f"{type(e).__name__}: {e}"})
+
+
+def run_case(case, params):
+    """
+    Ejecuta un caso en un proceso aislado y devuelve su resultado.
+    """
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_child, args=(case, params, queue))
+    process.start()
+    outcome = queue.get()
+    process.join()
+    if not outcome["ok"]:
+        return {"error": outcome["error"]}
+    return outcome["result"]
+
+
+def _environment_info():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "model_path": os.environ.get("CROSSCOUNTER_MODEL_PATH", "models/best.pt"),
+    }
+
+
+def main(argv=None):
+    from benchmarks.synthetic import VIDEO_PROFILES, get_profile_video
+
+    parser = argparse.ArgumentParser(description="Benchmarks de CrossCounter")
+    parser.add_argument("--cases", default="startup,image,video,statistics", help="Casos separados por comas")
+    parser.add_argument("--profiles", default="short-480p,short-720p", help=f"Perfiles: {', '.join(VIDEO_PROFILES)}")
+    parser.add_argument("--frame-interval", type=int, default=101)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--documents", type=int, default=50_000, help="Documentos para el caso de estadísticas")
+    parser.add_argument("--write-latency-ms", type=float, default=0.0, help="Latencia simulada por escritura en MongoDB")
+    parser.add_argument("--encoder", default=None, help="Codificador de salida: h264 o mp4v")
+    parser.add_argument("--output-mode", default=None, help="Modo de salida: full, keyframes o preview")
+    parser.add_argument("--preset", default=None, help="Preset de x264")
+    parser.add_argument("--crf", type=int, default=None, help="CRF de x264")
+    parser.add_argument("--container", default=None, help="Contenedor de salida: mp4 o hls")
+    parser.add_argument("--tiling", default=None, help="Inferencia por mosaicos: off, auto o always")
+    parser.add_argument("--frame-cache", action="store_true", help="Usar la caché de frames decodificados")
+    parser.add_argument("--concurrency", type=int, default=4, help="Videos simultáneos en el caso concurrent")
+    parser.add_argument("--cascade", default="motion", help="Filtro del caso cascade: motion o fast_model")
+    parser.add_argument("--segment-duration", type=float, default=4, help="Segundos por segmento en el caso segment")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Ruta del JSON de resultados")
+    args = parser.parse_args(argv)
+
+    _prepare_environment()
+    report = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "environment": _environment_info(),
+        "arguments": vars(args),
+        "results": {},
+    }
+    write_latency_s = args.write_latency_ms / 1000
+
+    for case in args.cases.split(","):
+        if case in ("video", "concurrent", "cascade", "segment"):
+            for profile in args.profiles.split(","):
+                params = {
+                    "profile": profile,
+                    "video": get_profile_video(profile, seed=args.seed),
+                    "frame_interval": args.frame_interval,
+                    "output_options": {
+                        "encoder": args.encoder,
+                        "mode": args.output_mode,
+                        "preset": args.preset,
+                        "crf": args.crf,
+                        "container": args.container,
+                    },
+                    "write_latency_s": write_latency_s,
+                    "tiling": args.tiling,
+                    "concurrency": args.concurrency,
+                    "frame_cache": args.frame_cache,
+                    "cascade": args.cascade,
+                    "segment_duration": args.segment_duration,
+                }
+                print(f"[benchmarks] {case} {profile}...", flush=True)
+                report["results"][f"{case}/{profile}"] = run_case(case, params)
+        else:
+            params = {
+                "repeats": args.repeats,
+                "documents": args.documents,
+                "seed": args.seed,
+                "write_latency_s": write_latency_s,
+                "tiling": args.tiling,
+            }
+            print(f"[benchmarks] {case}...", flush=True)
+            report["results"][case] = run_case(case, params)
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2, default=str)
+    print(f"[benchmarks] Resultados guardados en {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Generación reproducible de videos sintéticos de tráfico para los benchmarks.
+
+Cada video usa como fondo `media/scene00199test.jpg` y dibuja vehículos que cruzan
+la escena por carriles. Junto al video se guarda un JSON con la verdad de terreno
+(cajas por frame), útil para medir recall.
+"""
+import json
+import os
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+BACKGROUND_PATH = Path(__file__).resolve().parent.parent / "media" / "scene00199test.jpg"
+CACHE_DIR = Path(__file__).resolve().parent / ".cache"
+
+# Perfiles de video: (duración en segundos, ancho, alto, fps)
+VIDEO_PROFILES = {
+    "short-480p": (10, 854, 480, 30),
+    "short-720p": (10, 1280, 720, 30),
+    "medium-720p": (60, 1280, 720, 30),
+    "short-1080p": (10, 1920, 1080, 30),
+    "long-1080p": (180, 1920, 1080, 30),
+}
+
+
+def _draw_motorcycle(frame, x, y, scale, color):
+    """
+    Dibuja una silueta simple de motocicleta (dos ruedas, chasis y conductor).
+
+    Returns:
+        tuple: Caja (xmin, ymin, xmax, ymax) ocupada por la figura.
+    """
+    wheel = max(int(6 * scale), 2)
+    length = int(36 * scale)
+    cv2.circle(frame, (x, y), wheel, (20, 20, 20), -1)
+    cv2.circle(frame, (x + length, y), wheel, (20, 20, 20), -1)
+    cv2.rectangle(frame, (x, y - 2 * wheel), (x + length, y - wheel), color, -1)
+    cv2.rectangle(frame, (x + length // 3, y - 5 * wheel), (x + length // 2, y - 2 * wheel), (40, 40, 160), -1)
+    return (x - wheel, y - 5 * wheel, x + length + wheel, y + wheel)
+
+
+def generate_traffic_video(path, duration_s, width, height, fps=30, vehicles_per_minute=40, seed=0):
+    """
+    Genera un video sintético de tráfico y su verdad de terreno.
+
+    Args:
+        path (str | Path): Ruta del video de salida (.mp4).
+        duration_s (float): Duración en segundos.
+        width (int): Ancho en píxeles.
+        height (int): Alto en píxeles.
+        fps (int): Frames por segundo.
+        vehicles_per_minute (int): Frecuencia media de aparición de vehículos.
+        seed (int): Semilla del generador aleatorio (mismo seed, mismo video).
+
+    Returns:
+        dict: Rutas del video y de la verdad de terreno, y número de frames.
+    """
+    rng = np.random.default_rng(seed)
+    total_frames = int(duration_s * fps)
+
+    background = cv2.imread(str(BACKGROUND_PATH))
+    if background is None:
+        background = np.full((height, width, 3), 90, dtype=np.uint8)
+    background = cv2.resize(background, (width, height), interpolation=cv2.INTER_AREA)
+
+    # Carriles horizontales en la mitad inferior de la escena
+    lanes = np.linspace(height * 0.55, height * 0.95, 4).astype(int)
+    spawn_probability = vehicles_per_minute / (60 * fps)
+    scale = height / 480
+
+    vehicles = []
+    ground_truth = []
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+
+    for frame_idx in range(total_frames):
+        if rng.random() < spawn_probability:
+            lane = int(rng.integers(len(lanes)))
+            direction = 1 if lane % 2 == 0 else -1
+            vehicles.append({
+                "x": -60 * scale if direction > 0 else width + 10,
+                "y": int(lanes[lane]),
+                "speed": direction * rng.uniform(2.0, 6.0) * scale,
+                "scale": scale * (0.6 + 0.4 * lane / len(lanes)),
+                "color": tuple(int(c) for c in rng.integers(0, 255, 3)),
+            })
+
+        frame = background.copy()
+        boxes = []
+        for vehicle in vehicles:
+            vehicle["x"] += vehicle["speed"]
+            box = _draw_motorcycle(frame, int(vehicle["x"]), vehicle["y"], vehicle["scale"], vehicle["color"])
+            if box[2] > 0 and box[0] < width:
+                boxes.append([max(box[0], 0), max(box[1], 0), min(box[2], width), min(box[3], height)])
+        vehicles = [v for v in vehicles if -100 * scale < v["x"] < width + 100 * scale]
+
+        # Ruido de sensor para que el códec no comprima frames idénticos
+        noise = rng.integers(-4, 5, size=(height // 8, width // 8, 1), dtype=np.int16)
+        noise = cv2.resize(noise.astype(np.float32), (width, height), interpolation=cv2.INTER_NEAREST)
+        frame = np.clip(frame.astype(np.int16) + noise[..., None].astype(np.int16), 0, 255).astype(np.uint8)
+
+        writer.write(frame)
+        ground_truth.append(boxes)
+
+    writer.release()
+
+    ground_truth_path = Path(path).with_suffix(".json")
+    with open(ground_truth_path, "w", encoding="utf-8") as file:
+        json.dump({"fps": fps, "width": width, "height": height, "boxes": ground_truth}, file)
+
+    return {"video_path": str(path), "ground_truth_path": str(ground_truth_path), "total_frames": total_frames}
+
+
+def get_profile_video(profile, seed=0):
+    """
+    Devuelve el video sintético de un perfil, generándolo solo si no está en caché.
+
+    Args:
+        profile (str): Nombre del perfil en `VIDEO_PROFILES`.
+        seed (int): Semilla del generador.
+
+    Returns:
+        dict: Ver `generate_traffic_video`.
+    """
+    duration_s, width, height, fps = VIDEO_PROFILES[profile]
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = CACHE_DIR / f"{profile}-seed{seed}.mp4"
+    ground_truth_path = path.with_suffix(".json")
+
+    if path.exists() and ground_truth_path.exists():
+        return {
+            "video_path": str(path),
+            "ground_truth_path": str(ground_truth_path),
+            "total_frames": int(duration_s * fps),
+        }
+    return generate_traffic_video(path, duration_s, width, height, fps, seed=seed)
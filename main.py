@@ -1,10 +1,9 @@
-import uuid
 import streamlit as st
 from views.html import (
     anchor_html, header_html, logo_separator_html,
     qr_code_html, about_section_html, team_section_html, documentation_html, meta_html
 )
-from utils.visualization import show_statistics, draw_detections, show_inspected_data
+from utils.visualization import show_statistics, show_export, draw_detections, show_inspected_data
 from utils.inference import (
     process_image, 
     process_video, 
@@ -14,8 +13,16 @@ from utils.inference import (
 from utils.helpers import (
     get_youtube_video_metadata,
     download_youtube_video,
+    generate_inference_id,
 )
-from utils.mongodb import save_inference_result_image, save_inference_result_video
+from utils.async_io import AsyncResultWriter, prepare_youtube_job, run as run_async
+from utils.mongodb import (
+    save_inference_result_image, save_inference_result_video, register_source, detection_key, DEFAULT_CAMERA
+)
+from utils.video_writer import ENCODERS, OUTPUT_MODES
+from utils.tiling import TILING_MODES
+from utils.cascade import CASCADE_GATES
+from utils.detections_store import load_detections, recount
 from datetime import datetime
 from pathlib import Path
 import cv2
@@ -40,10 +47,10 @@ YOUTUBE_API_KEY = st.secrets["YOUTUBE"]["YOUTUBE_API_KEY"]
 
 # Cargar estilos CSS
 def load_css(file_path):
-    with open(file_path) as file:
-        st.markdown(f"<style>{file.read()}</style>", unsafe_allow_html=True)
+    st.markdown(f"<style>{load_markdown(file_path)}</style>", unsafe_allow_html=True)
 
-# Mostrar Contenido Markdown
+# Mostrar Contenido Markdown (se lee del disco una sola vez por proceso)
+@st.cache_resource(show_spinner=False)
 def load_markdown(file_path):
     with open(file_path, "r", encoding="utf-8") as file:
         return file.read()
@@ -60,6 +67,54 @@ inference_mode = st.sidebar.selectbox(
     "Selecciona el modo de inferencia", ("Imagen", "Video")
 )
 
+# Inferencia por mosaicos para motocicletas pequeñas en imágenes de alta resolución
+tiling_options = {
+    "mode": st.sidebar.selectbox(
+        "Inferencia por mosaicos", TILING_MODES, index=TILING_MODES.index("off"),
+        format_func=lambda mode: {"off": "Desactivada", "auto": "Automática", "always": "Siempre"}[mode],
+    ),
+}
+
+# Cámara de origen: los conteos se guardan en la serie temporal de esa cámara
+camera = st.sidebar.text_input("Cámara", value=DEFAULT_CAMERA).strip() or DEFAULT_CAMERA
+
+# Sitio y ubicación de la cámara, para filtrar y comparar cámaras en las estadísticas
+with st.sidebar.expander("Datos de la cámara"):
+    camera_site = st.text_input("Sitio / intersección").strip()
+    camera_latitude = st.number_input("Latitud", value=None, min_value=-90.0, max_value=90.0, format="%.6f")
+    camera_longitude = st.number_input("Longitud", value=None, min_value=-180.0, max_value=180.0, format="%.6f")
+    if st.button("Guardar cámara"):
+        register_source(camera, site=camera_site or None, latitude=camera_latitude, longitude=camera_longitude)
+        st.success(f"Cámara {camera} guardada.")
+
+
+def video_sidebar_options():
+    """
+    Opciones de la barra lateral comunes a los videos subidos y de YouTube.
+
+    Returns:
+        tuple: (opciones de la cascada, opciones de las alertas en vivo, inicio de la grabación o None).
+    """
+    # Filtro barato que evita el modelo completo en los frames sin motocicletas
+    cascade_options = {
+        "gate": st.sidebar.selectbox(
+            "Filtro previo al modelo", CASCADE_GATES,
+            format_func=lambda gate: {"off": "Desactivado", "motion": "Movimiento", "fast_model": "Modelo ligero"}[gate],
+        ),
+    }
+
+    # Alertas en vivo: umbral de motocicletas por minuto (además de las anomalías)
+    rate_threshold = st.sidebar.number_input("Alerta: motos por minuto (0 = sin umbral)", min_value=0.0, value=0.0, step=1.0)
+    stream_options = {"rate_threshold": rate_threshold or None}
+
+    # Inicio de la grabación: fecha cada frame con su hora real (si no se indica, se usa
+    # la de los metadatos del video o la hora actual)
+    capture_date = st.sidebar.date_input("Fecha de grabación", value=None)
+    capture_time = st.sidebar.time_input("Hora de inicio de la grabación", value=None)
+    capture_start = datetime.combine(capture_date, capture_time) if capture_date and capture_time else None
+    return cascade_options, stream_options, capture_start
+
+
 # Mostrar la imagen del logo en la barra lateral
 st.sidebar.image('media/logox512.jpg', use_container_width=True)
 
@@ -90,15 +145,15 @@ if inference_mode == "Imagen":
                 f.write(uploaded_image.read())
 
             # Procesar imagen
-            detections = process_image(temp_path)
+            detections = process_image(temp_path, tiling_options=tiling_options)
 
             # Dibujar detecciones
             original_image = Image.open(temp_path)
             image_with_boxes = draw_detections(original_image, detections["predictions"])
 
             # Generar campos necesarios para guardar en MongoDB
-            inference_id = str(datetime.now().isoformat())  # Marca de tiempo única
-            detection_id = str(uuid.uuid4())  # Generar un ID único para la detección
+            inference_id = generate_inference_id()  # ID único y ordenable por tiempo
+            detection_id = detection_key(inference_id)  # Clave de idempotencia del resultado
             timestamp = datetime.now()  # Fecha y hora de la inferencia
 
 
@@ -110,6 +165,7 @@ if inference_mode == "Imagen":
                 "detection_id": detection_id,
                 "motorcycle_count": len(detections["predictions"]),
                 "timestamp": timestamp,
+                "camera": camera,
             })
 
             # Mostrar el frame procesado en el contenedor de imagen
@@ -138,6 +194,28 @@ elif inference_mode == "Video":
     st.subheader("Cargar un Video")
     uploaded_video = st.file_uploader("Elige un video", type=["mp4", "avi", "mov"])
 
+    # Opciones del video de salida
+    output_options = {
+        "encoder": st.sidebar.selectbox("Codificador de salida", ENCODERS),
+        "mode": st.sidebar.selectbox(
+            "Video de salida", OUTPUT_MODES,
+            format_func=lambda mode: {"full": "Completo", "keyframes": "Solo frames anotados", "preview": "Vista previa"}[mode],
+        ),
+        # Segmentos HLS: el video anotado se puede ver y descargar mientras se procesa
+        "container": "hls" if st.sidebar.checkbox("Reproducción progresiva", value=False) else "mp4",
+    }
+
+    # Volver a analizar el mismo video sin decodificarlo de nuevo
+    use_frame_cache = st.sidebar.checkbox("Caché de frames decodificados", value=False)
+
+    # Tiempo real: se ajusta el muestreo y la resolución de inferencia para no retrasarse
+    realtime_options = None
+    if st.sidebar.checkbox("Modo tiempo real", value=False):
+        target_fps = st.sidebar.number_input("FPS objetivo (0 = los del video)", min_value=0.0, value=0.0, step=1.0)
+        realtime_options = {"target_fps": target_fps or None}
+
+    cascade_options, stream_options, capture_start = video_sidebar_options()
+
     # Verificar si hay un video procesado previamente
     if "processed_video" not in st.session_state:
         st.session_state["processed_video"] = None
@@ -155,17 +233,41 @@ elif inference_mode == "Video":
                 total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
                 cap.release()
 
-                # Procesar video
-                results = process_video(temp_path, frame_interval=101, total_frames=total_frames)
-
-                # Guardar en MongoDB
-                save_inference_result_video(
-                    inference_id=results["inference_id"],
-                    motorcycle_count_per_frame=results["motorcycle_count_per_frame"],
+                # Procesar video; los conteos se guardan en MongoDB en segundo plano
+                result_writer = AsyncResultWriter(generate_inference_id(), camera=camera)
+                results = process_video(
+                    temp_path, frame_interval=101, total_frames=total_frames,
+                    output_options=output_options, result_writer=result_writer,
+                    tiling_options=tiling_options, use_frame_cache=use_frame_cache,
+                    capture_start=capture_start, realtime_options=realtime_options,
+                    cascade_options=cascade_options, stream_options=stream_options,
                 )
 
+                # Esperar a que terminen las escrituras en MongoDB
+                result_writer.close()
+
                 # Mostrar enlace de descarga del video procesado
                 st.success(f"Inferencia completada. Total de motocicletas detectadas: {results.get('total_motos', 0)}")
+                if results["realtime"]:
+                    realtime = results["realtime"]
+                    st.info(
+                        f"Tiempo real: {realtime['achieved_fps']:.1f} de {realtime['target_fps']:.1f} FPS · "
+                        f"frames inferidos: {realtime['frames_inferred']} ({realtime['coverage']:.0%} de los previstos) · "
+                        f"retraso máximo: {realtime['max_lag_s']:.2f} s"
+                    )
+                if results["cascade"]["skipped_frames"]:
+                    st.info(
+                        f"Filtro previo: se evitó el modelo completo en {results['cascade']['skipped_frames']} "
+                        f"de {results['cascade']['frames']} frames ({results['cascade']['compute_saved']:.0%})"
+                    )
+                if results["alerts"]:
+                    st.warning(
+                        f"Alertas durante el video: {len(results['alerts'])} "
+                        f"({sum(alert['kind'] == 'threshold' for alert in results['alerts'])} por umbral, "
+                        f"{sum(alert['kind'] == 'anomaly' for alert in results['alerts'])} por anomalía)"
+                    )
+                if results["output"]["encoder"] == "h264":
+                    st.video(results["processed_video_path"])
                 if "encoded_video" in results:
                     st.download_button(
                         label="Descargar video procesado",
@@ -176,6 +278,7 @@ elif inference_mode == "Video":
 
                 # Actualizar estado
                 st.session_state["processed_video"] = uploaded_video.name
+                st.session_state["detections_path"] = results["detections_path"]
 
                 # Eliminar archivo temporal
                 try:
@@ -185,12 +288,28 @@ elif inference_mode == "Video":
                     st.error(f"Error al eliminar el archivo temporal: {e}")
         else:
             print("El video ya ha sido procesado. Carga un nuevo video para realizar otra inferencia.")
+
+        # Recontar con otro umbral o clases a partir de las detecciones guardadas (sin el modelo)
+        if st.session_state.get("detections_path"):
+            with st.expander("Recontar con otros parámetros"):
+                sidecar = load_detections(st.session_state["detections_path"])
+                min_confidence = st.slider("Confianza mínima", 0.25, 1.0, 0.25, 0.05)
+                recount_classes = st.multiselect(
+                    "Clases", sidecar["class_names"],
+                    default=[name for name in sidecar["class_names"] if name == "motorcycle"],
+                )
+                recounted = recount(sidecar, min_confidence=min_confidence, classes=recount_classes)
+                st.write(
+                    f"Detecciones: {recounted['total_motos']} · Vehículos distintos (trayectorias): "
+                    f"{recounted['tracks']} · Máximo por frame: {recounted['max_per_frame']}"
+                )
             
 
 # Inferencia en videos de YouTube
 elif inference_mode == "YouTube":
     st.subheader("Procesar un Video de YouTube")
     youtube_url = st.text_input("Introduce la URL del video de YouTube")
+    cascade_options, stream_options, capture_start = video_sidebar_options()
 
     # Inicializar el estado de sesión para YouTube si no existe
     if "YouTube" not in st.session_state:
@@ -213,19 +332,43 @@ elif inference_mode == "YouTube":
 
             with st.spinner("Procesando el video de YouTube..."):
                 try:
-                    # Descargar y procesar el video
-                    video_metadata = get_youtube_video_metadata(youtube_url)
-                    is_large = video_metadata["filesize_approx"] > 200 * 1024
+                    # Obtener metadatos y tamaño en paralelo
+                    job = run_async(prepare_youtube_job(youtube_url))
+                    is_large = job["is_large"] or job["metadata"]["filesize_approx"] > 200 * 1024
+
+                    progress_bar = st.progress(0)
+                    status = st.empty()
 
                     if is_large:
                         st.warning("El video es grande y será procesado en segmentos.")
-                        results = process_youtube_video(youtube_url)
+
+                        # Conteo parcial visible mientras se descargan los segmentos restantes
+                        def show_partial_count(fraction, partial_count):
+                            progress_bar.progress(fraction)
+                            status.text(f"Procesado {fraction:.0%} del video. Motocicletas hasta ahora: {partial_count}")
+
+                        results = process_youtube_video(
+                            youtube_url, progress_callback=show_partial_count, tiling_options=tiling_options,
+                            capture_start=capture_start, camera=camera, cascade_options=cascade_options,
+                            stream_options=stream_options, job=job,
+                        )
                     else:
-                        video_path = download_youtube_video(youtube_url)
+                        def show_download_progress(fraction):
+                            progress_bar.progress(fraction)
+                            status.text(f"Descargando video: {fraction:.0%}")
+
+                        video_path = download_youtube_video(youtube_url, progress_callback=show_download_progress)
                         if not os.path.exists(video_path) or os.path.getsize(video_path) == 0:
                             raise ValueError("El video descargado está vacío o no existe.")
 
-                        results = process_youtube_video_inference(video_path)
+                        # Los conteos se guardan en MongoDB en segundo plano, con la cámara elegida
+                        result_writer = AsyncResultWriter(generate_inference_id(), camera=camera)
+                        results = process_youtube_video_inference(
+                            video_path, result_writer=result_writer, tiling_options=tiling_options,
+                            capture_start=capture_start, cascade_options=cascade_options,
+                            stream_options=stream_options,
+                        )
+                        result_writer.close()
 
                     # Actualizar el estado en la sesión
                     st.session_state["YouTube"]["processing"] = False
@@ -259,6 +402,7 @@ elif inference_mode == "YouTube":
 # Sección de Estadísticas
 st.header("Estadísticas de Conteo de Motocicletas")
 show_statistics()
+show_export()
 # show_inspected_data() # Mostrar datos almacenados en MongoDB
 st.markdown(logo_separator_html(), unsafe_allow_html=True)
 
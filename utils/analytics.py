@@ -0,0 +1,401 @@
+"""
+Réplica analítica local de las detecciones (Parquet + DuckDB).
+
+Las consultas estadísticas pesadas (percentiles, horas pico, comparación semana a
+semana) no se ejecutan sobre MongoDB: las detecciones se copian de forma incremental
+a archivos Parquet locales y se consultan con SQL vectorizado en DuckDB, en
+milisegundos y sin carga adicional para la base de datos operativa.
+
+Sincronización por marca de agua (`watermark`) sobre el orden de llegada, no sobre
+la hora de captura: `mongodb.write_documents` guarda en cada documento `ingested_at`,
+la hora en que se envió a MongoDB. Cada sincronización lee los documentos con
+`ingested_at` posterior a la marca (el inicio de la sincronización anterior) menos
+`lookback`, que cubre las escrituras en curso y la diferencia de reloj entre
+procesos, y descarta los que la réplica ya tiene por su `detection_id`. Así entra
+también un video con fecha de grabación de hace meses analizado hoy. Los documentos
+nuevos se escriben en un archivo Parquet por sincronización; cuando hay demasiados
+archivos se compactan en uno solo ordenado por (camera, timestamp).
+
+Los agregados por hora de `utils.retention` no tienen `ingested_at`: sustituyen a
+documentos que la réplica ya copió, así que solo entran en una reconstrucción
+completa (`sync_mirror(full=True)`, que lee todos los documentos). Cada agregado
+representa `frames` frames: las consultas por frame lo ponderan por `frames` y
+`max_per_frame`, y los percentiles solo usan los documentos por frame (el agregado no
+guarda la distribución).
+
+Uso desde la línea de comandos:
+    python -m utils.analytics --sync
+    python -m utils.analytics --full
+"""
+import argparse
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from utils import mongodb
+from utils.export import EXPORT_BATCH_SIZE
+
+ANALYTICS_DIR = os.environ.get(
+    "CROSSCOUNTER_ANALYTICS_DIR", os.path.join(tempfile.gettempdir(), "crosscounter-analytics")
+)
+
+# Ventana que se vuelve a leer antes de la marca de agua en cada sincronización
+SYNC_LOOKBACK = timedelta(minutes=10)
+# Archivos Parquet a partir de los cuales se compacta la réplica
+MAX_CHUNKS = 32
+
+MIRROR_FIELDS = (
+    "timestamp", "camera", "inference_id", "detection_id", "frame_idx", "motorcycle_count", "ingested_at",
+    "type", "frames", "max_per_frame",
+)
+# Formato de la réplica: una réplica de un formato anterior se reconstruye entera
+MIRROR_VERSION = 3
+
+# Filas por frame (excluye los agregados por hora de `utils.retention`)
+PER_FRAME = "type IS DISTINCT FROM 'hourly'"
+
+_sync_lock = threading.Lock()
+_last_sync = 0.0
+
+
+def _chunks_dir():
+    return os.path.join(ANALYTICS_DIR, "detections")
+
+
+def _state_path():
+    return os.path.join(ANALYTICS_DIR, "state.json")
+
+
+def _load_state():
+    try:
+        with open(_state_path(), encoding="utf-8") as file:
+            state = json.load(file)
+    except (OSError, ValueError):
+        return {"watermark": None, "rows": 0, "synced_at": None, "version": MIRROR_VERSION}
+    state["watermark"] = datetime.fromisoformat(state["watermark"]) if state.get("watermark") else None
+    return state
+
+
+def _save_state(state):
+    os.makedirs(ANALYTICS_DIR, exist_ok=True)
+    temporary = _state_path() + ".tmp"
+    with open(temporary, "w", encoding="utf-8") as file:
+        json.dump(state, file, default=str)
+    os.replace(temporary, _state_path())
+
+
+def _chunk_paths():
+    return sorted(glob.glob(os.path.join(_chunks_dir(), "*.parquet")))
+
+
+def _schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("timestamp", pa.timestamp("ms")),
+        ("camera", pa.string()),
+        ("inference_id", pa.string()),
+        ("detection_id", pa.string()),
+        ("frame_idx", pa.int64()),
+        ("motorcycle_count", pa.int64()),
+        ("ingested_at", pa.timestamp("ms")),
+        ("type", pa.string()),
+        ("frames", pa.int64()),
+        ("max_per_frame", pa.int64()),
+    ])
+
+
+def connect():
+    """
+    Conexión DuckDB en memoria con la vista `detections` sobre la réplica.
+
+    Returns:
+        duckdb.DuckDBPyConnection: Conexión lista para consultar.
+    """
+    import duckdb
+
+    connection = duckdb.connect()
+    paths = _chunk_paths()
+    if paths:
+        connection.execute(
+            f"CREATE VIEW detections AS SELECT * FROM read_parquet({paths!r})"
+        )
+    else:
+        connection.execute(
+            "CREATE VIEW detections AS SELECT * FROM (VALUES (NULL::TIMESTAMP, NULL::VARCHAR, NULL::VARCHAR,"
+            " NULL::VARCHAR, NULL::BIGINT, NULL::BIGINT, NULL::TIMESTAMP, NULL::VARCHAR, NULL::BIGINT, NULL::BIGINT))"
+            " AS t(" + ", ".join(MIRROR_FIELDS) + ")"
+            " WHERE false"
+        )
+    return connection
+
+
+def _compact():
+    """
+    Une los archivos de la réplica en uno solo ordenado por (camera, timestamp).
+    """
+    paths = _chunk_paths()
+    if len(paths) < 2:
+        return
+    target = os.path.join(_chunks_dir(), f"compact-{time.time_ns()}.parquet")
+    with connect() as connection:
+        connection.execute(
+            f"COPY (SELECT * FROM detections ORDER BY camera, timestamp) TO '{target}'"
+            " (FORMAT PARQUET, COMPRESSION ZSTD)"
+        )
+    for path in paths:
+        os.remove(path)
+
+
+def _iter_arrivals(since, batch_size):
+    """
+    Lotes de documentos llegados a MongoDB desde `since` (todos si es None).
+    """
+    query = {} if since is None else {"ingested_at": {"$gte": since}}
+    projection = {field: 1 for field in MIRROR_FIELDS}
+    projection["_id"] = 0
+    cursor = mongodb.collection.find(query, projection).batch_size(batch_size)
+    batch = []
+    for document in cursor:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def sync_mirror(full=False, lookback=SYNC_LOOKBACK, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Copia a la réplica los documentos nuevos de MongoDB.
+
+    Args:
+        full (bool): Reconstruir la réplica completa en lugar de sincronizar desde la marca
+            (también se reconstruye si la réplica es de un formato anterior).
+        lookback (timedelta): Ventana de llegada anterior a la marca que se vuelve a leer.
+        batch_size (int): Documentos por lote del cursor.
+
+    Returns:
+        dict: Filas añadidas, filas totales, marca de agua y archivos de la réplica.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    global _last_sync
+    with _sync_lock:
+        state = _load_state()
+        if full or state.get("version") != MIRROR_VERSION or state["watermark"] is None:
+            for path in _chunk_paths():
+                os.remove(path)
+            state = {"watermark": None, "rows": 0}
+        # Lo que llegue a MongoDB a partir de ahora lo recoge la siguiente sincronización
+        started_at = datetime.now()
+        since = state["watermark"] - lookback if state["watermark"] else None
+
+        # Claves que ya están en la réplica dentro de la ventana que se vuelve a leer
+        known = set()
+        if since is not None:
+            with connect() as connection:
+                known = {
+                    row[0] for row in
+                    connection.execute("SELECT detection_id FROM detections WHERE ingested_at >= ?", [since]).fetchall()
+                }
+
+        os.makedirs(_chunks_dir(), exist_ok=True)
+        path = os.path.join(_chunks_dir(), f"chunk-{time.time_ns()}.parquet")
+        added = 0
+        writer = None
+        try:
+            for batch in _iter_arrivals(since, batch_size):
+                rows = [
+                    {field: row.get(field) for field in MIRROR_FIELDS}
+                    for row in batch
+                    if row.get("detection_id") not in known and isinstance(row.get("timestamp"), datetime)
+                ]
+                if not rows:
+                    continue
+                known.update(row["detection_id"] for row in rows)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, _schema(), compression="zstd")
+                writer.write_table(pa.Table.from_pylist(rows, schema=_schema()))
+                added += len(rows)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        if len(_chunk_paths()) > MAX_CHUNKS:
+            _compact()
+
+        state = {
+            "watermark": started_at,
+            "rows": state.get("rows", 0) + added,
+            "synced_at": datetime.now(),
+            "version": MIRROR_VERSION,
+        }
+        _save_state(state)
+        _last_sync = time.monotonic()
+        return {**state, "added": added, "chunks": len(_chunk_paths())}
+
+
+def sync_if_stale(max_age_s=60):
+    """
+    Sincroniza la réplica si la última sincronización de este proceso tiene más de
+    `max_age_s` segundos (las sesiones del dashboard comparten la réplica).
+
+    Returns:
+        dict | None: Resultado de `sync_mirror`, o None si no hacía falta.
+    """
+    if _last_sync and time.monotonic() - _last_sync < max_age_s:
+        return None
+    return sync_mirror()
+
+
+def mirror_status():
+    """
+    Marca de agua, filas y archivos de la réplica.
+    """
+    state = _load_state()
+    return {**state, "chunks": len(_chunk_paths())}
+
+
+def _where(filters=None, cameras=None, start=None, end=None):
+    """
+    Cláusula WHERE y parámetros por periodo ({'year', 'month', 'day'} o [start, end)) y cámaras.
+    """
+    clauses, parameters = [], []
+    period = mongodb.time_range(filters) if filters else (start, end)
+    if period and period[0] is not None:
+        clauses.append("timestamp >= ?")
+        parameters.append(period[0])
+    if period and period[1] is not None:
+        clauses.append("timestamp < ?")
+        parameters.append(period[1])
+    if cameras is not None:
+        clauses.append(f"camera IN ({', '.join('?' for _ in cameras)})" if cameras else "false")
+        parameters.extend(cameras)
+    return ("WHERE " + " AND ".join(clauses)) if clauses else "", parameters
+
+
+def query(sql, parameters=None):
+    """
+    Ejecuta una consulta SQL sobre la vista `detections` de la réplica.
+
+    Returns:
+        pd.DataFrame: Resultado de la consulta.
+    """
+    with connect() as connection:
+        return connection.execute(sql, parameters or []).df()
+
+
+def get_mirror_statistics(level, filters=None, cameras=None, by_camera=False):
+    """
+    Igual que `utils.mongodb.get_inference_statistics`, calculado sobre la réplica.
+
+    Args:
+        level (str): Nivel de análisis ('day', 'month', 'year').
+        filters (dict): Periodo ({'year': 2024, 'month': 11, 'day': 4}).
+        cameras (list[str]): Cámaras a incluir (None = todas).
+        by_camera (bool): Una fila por cámara y periodo (columna `camera`).
+
+    Returns:
+        pd.DataFrame: Mismas columnas e índice que `get_inference_statistics`.
+    """
+    # (campos de agrupación, etiqueta del periodo)
+    grouping = {
+        "day": (("year", "month", "day", "hour"), "strftime(min(timestamp), '%H:00')"),
+        "month": (("year", "month", "day"), "strftime(min(timestamp), '%d/%m')"),
+        "year": (("year", "month"), "strftime(min(timestamp), '%m/%Y')"),
+    }
+    fields, label = grouping[level]
+    keys = [f"date_part('{field}', timestamp)::INTEGER AS {field}" for field in fields]
+    if by_camera:
+        keys.append("camera")
+    where, parameters = _where(filters, cameras)
+    group_by = ", ".join(str(i + 2) for i in range(len(keys)))
+    data = query(
+        f"SELECT sum(motorcycle_count)::BIGINT AS \"Cantidad de Motocicletas\", {', '.join(keys)}, {label} AS _id"
+        f" FROM detections {where} GROUP BY {group_by} ORDER BY {', '.join(fields)}",
+        parameters,
+    )
+    return data.set_index("_id") if len(data) else pd.DataFrame()
+
+
+def hourly_profile(start=None, end=None, cameras=None):
+    """
+    Perfil por hora del día: media, mediana y percentil 95 de motocicletas por frame.
+
+    Los agregados por hora cuentan como sus `frames` en frames, total y media; la
+    mediana y el percentil 95 solo usan los documentos por frame.
+
+    Returns:
+        pd.DataFrame: Columnas hora, frames, total, media, p50 y p95.
+    """
+    where, parameters = _where(cameras=cameras, start=start, end=end)
+    return query(
+        "SELECT date_part('hour', timestamp)::INTEGER AS hora, sum(coalesce(frames, 1))::BIGINT AS frames,"
+        " sum(motorcycle_count)::BIGINT AS total,"
+        " round(sum(motorcycle_count) / sum(coalesce(frames, 1)), 3) AS media,"
+        f" quantile_cont(motorcycle_count, 0.5) FILTER (WHERE {PER_FRAME}) AS p50,"
+        f" quantile_cont(motorcycle_count, 0.95) FILTER (WHERE {PER_FRAME}) AS p95"
+        f" FROM detections {where} GROUP BY 1 ORDER BY 1",
+        parameters,
+    )
+
+
+def peak_hours(start=None, end=None, cameras=None, top=10):
+    """
+    Horas (fecha y hora) con más motocicletas del periodo.
+
+    Returns:
+        pd.DataFrame: Columnas hora, camera, total y max_por_frame, de mayor a menor total.
+    """
+    where, parameters = _where(cameras=cameras, start=start, end=end)
+    return query(
+        "SELECT date_trunc('hour', timestamp) AS hora, camera, sum(motorcycle_count)::BIGINT AS total,"
+        " max(coalesce(max_per_frame, motorcycle_count)) AS max_por_frame"
+        f" FROM detections {where} GROUP BY 1, 2 ORDER BY total DESC LIMIT {int(top)}",
+        parameters,
+    )
+
+
+def week_over_week(end=None, cameras=None, weeks=8):
+    """
+    Totales semanales de las últimas `weeks` semanas y su variación respecto a la anterior.
+
+    Returns:
+        pd.DataFrame: Columnas semana, total, semana_anterior y variacion (fracción).
+    """
+    end = end or datetime.now()
+    start = end - timedelta(weeks=weeks + 1)
+    where, parameters = _where(cameras=cameras, start=start, end=end)
+    data = query(
+        "SELECT semana, total, lag(total) OVER (ORDER BY semana) AS semana_anterior,"
+        " round(total / nullif(lag(total) OVER (ORDER BY semana), 0) - 1, 4) AS variacion"
+        " FROM (SELECT date_trunc('week', timestamp) AS semana, sum(motorcycle_count)::BIGINT AS total"
+        f" FROM detections {where} GROUP BY 1) ORDER BY semana",
+        parameters,
+    )
+    # La semana más antigua solo sirve de referencia para la siguiente
+    return data.tail(weeks).reset_index(drop=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Réplica analítica local de las detecciones")
+    parser.add_argument("--full", action="store_true", help="Reconstruir la réplica completa")
+    parser.add_argument("--sync", action="store_true", help="Sincronizar desde la marca de agua")
+    args = parser.parse_args(argv)
+
+    if args.full or args.sync:
+        result = sync_mirror(full=args.full)
+        print(f"{result['added']} filas añadidas; marca de agua: {result['watermark']}")
+    print(mirror_status())
+
+
+if __name__ == "__main__":
+    main()
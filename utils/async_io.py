@@ -0,0 +1,189 @@
+"""
+Capa de E/S asíncrona para que la latencia de red (YouTube, MongoDB) se solape con
+la inferencia en lugar de sumarse a ella.
+
+Un bucle de eventos de asyncio vive en un hilo dedicado del proceso. Desde el hilo
+de Streamlit se le envían corrutinas con `submit`, que devuelve un
+`concurrent.futures.Future`; el hilo de Streamlit sigue ejecutando la inferencia y
+solo espera el resultado cuando lo necesita.
+
+- YouTube: las llamadas bloqueantes (API de YouTube, yt-dlp) se ejecutan en un
+  pool de hilos de E/S con `run_in_executor`.
+- MongoDB: `AsyncResultWriter` guarda los resultados en el spool local
+  (`utils.spool`), que los escribe en MongoDB en segundo plano. `insert_documents`
+  escribe directamente (sin spool) con `mongodb.write_documents` en el pool de
+  hilos, de modo que reintentar un lote no duplica documentos.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.helpers import get_youtube_video_metadata, is_large_video
+from utils import mongodb
+
+# Hilos para las llamadas bloqueantes de red (yt-dlp, API de YouTube, PyMongo síncrono)
+IO_WORKERS = 8
+
+_loop = None
+_loop_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="crosscounter-io")
+
+
+def get_loop():
+    """
+    Devuelve el bucle de eventos de E/S, iniciándolo en un hilo dedicado la primera vez.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _loop.set_default_executor(_executor)
+            threading.Thread(target=_loop.run_forever, name="crosscounter-io-loop", daemon=True).start()
+    return _loop
+
+
+def submit(coroutine):
+    """
+    Programa una corrutina en el bucle de E/S sin bloquear al llamador.
+
+    Args:
+        coroutine: Corrutina a ejecutar.
+
+    Returns:
+        concurrent.futures.Future: Resultado de la corrutina.
+    """
+    return asyncio.run_coroutine_threadsafe(coroutine, get_loop())
+
+
+def run(coroutine, timeout=None):
+    """
+    Ejecuta una corrutina en el bucle de E/S y espera su resultado.
+    """
+    return submit(coroutine).result(timeout)
+
+
+async def _in_executor(function, *args):
+    return await asyncio.get_running_loop().run_in_executor(_executor, function, *args)
+
+
+# --- YouTube ---------------------------------------------------------------
+
+async def fetch_youtube_metadata(youtube_url):
+    """
+    Versión asíncrona de `get_youtube_video_metadata`.
+    """
+    return await _in_executor(get_youtube_video_metadata, youtube_url)
+
+
+async def check_large_video(youtube_url, max_size_mb=200):
+    """
+    Versión asíncrona de `is_large_video`.
+    """
+    return await _in_executor(is_large_video, youtube_url, max_size_mb)
+
+
+async def prepare_youtube_job(youtube_url, max_size_mb=200):
+    """
+    Obtiene en paralelo los metadatos de la API de YouTube y la estimación de tamaño
+    de yt-dlp de un video.
+
+    Args:
+        youtube_url (str): URL del video de YouTube.
+        max_size_mb (int): Tamaño máximo permitido en MB antes de segmentar.
+
+    Returns:
+        dict: {"metadata": dict, "is_large": bool}
+    """
+    metadata, is_large = await asyncio.gather(
+        fetch_youtube_metadata(youtube_url),
+        check_large_video(youtube_url, max_size_mb),
+    )
+    return {"metadata": metadata, "is_large": is_large}
+
+
+# --- MongoDB ---------------------------------------------------------------
+
+async def insert_documents(documents, collection=None):
+    """
+    Escribe documentos en MongoDB de forma idempotente sin bloquear el bucle de eventos
+    (ver `mongodb.write_documents`).
+
+    Args:
+        documents (list[dict]): Documentos con `detection_id`.
+        collection: Colección síncrona alternativa (p. ej. un sustituto local en pruebas).
+
+    Returns:
+        int: Número de documentos escritos.
+    """
+    if not documents:
+        return 0
+    return await _in_executor(mongodb.write_documents, documents, collection)
+
+
+class AsyncResultWriter:
+    """
+    Escribe en MongoDB los resultados por frame de un video a medida que se generan,
+    por lotes y en segundo plano, mientras continúa la inferencia.
+
+    Por defecto cada lote se guarda en el spool local (a la velocidad del disco) y el
+    hilo de vaciado lo envía a MongoDB; si MongoDB está lento o caído la inferencia
+    no espera y los resultados no se pierden.
+
+    Uso:
+        writer = AsyncResultWriter(generate_inference_id())
+        results = process_video(path, result_writer=writer)
+        writer.close()  # espera las escrituras pendientes (en el spool o en `collection`)
+
+    Args:
+        inference_id (str): Identificador de la inferencia.
+        batch_size (int): Frames por lote de escritura.
+        collection: Colección síncrona alternativa (ver `insert_documents`); se escribe
+            directamente en ella, sin spool.
+        camera (str): Cámara de origen de los frames.
+    """
+
+    def __init__(self, inference_id, batch_size=50, collection=None, camera=mongodb.DEFAULT_CAMERA):
+        self.inference_id = inference_id
+        self.camera = camera
+        self.batch_size = batch_size
+        self.collection = collection
+        self.documents_written = 0
+        self._pending = []
+        self._futures = []
+
+    def add(self, frame_result):
+        """
+        Añade el resultado de un frame muestreado; envía un lote si está completo.
+        """
+        self._pending.append(frame_result)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Envía los resultados acumulados sin esperar a que se escriban.
+        """
+        if not self._pending:
+            return
+        documents = mongodb.build_video_documents(self.inference_id, self._pending, self.camera)
+        self._pending = []
+        if self.collection is None:
+            self.documents_written += mongodb.spool_documents(documents)
+        else:
+            self._futures.append(submit(insert_documents(documents, self.collection)))
+
+    def close(self, timeout=None):
+        """
+        Envía lo pendiente y espera a que terminen todas las escrituras.
+
+        Returns:
+            int: Documentos escritos.
+
+        Raises:
+            Exception: La primera excepción producida por una escritura.
+        """
+        self.flush()
+        for future in self._futures:
+            self.documents_written += future.result(timeout)
+        self._futures = []
+        return self.documents_written
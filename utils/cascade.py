@@ -0,0 +1,163 @@
+"""
+Cascada de detección: un filtro barato decide si un frame muestreado merece una
+pasada del modelo completo.
+
+En los videos de tráfico muchos frames muestreados no contienen motocicletas, y
+cada uno cuesta una inferencia completa de `models/best.pt`. El filtro se evalúa
+antes y, si indica que el frame está vacío, el frame cuenta como sin detecciones
+sin ejecutar el modelo.
+
+Filtros (`gate`):
+
+- motion: sustracción de fondo (MOG2) sobre el frame reducido; pasa si la fracción
+  de píxeles en movimiento supera `motion_threshold`.
+- fast_model: el modelo ligero de `CROSSCOUNTER_FAST_MODEL_PATH` a baja resolución;
+  pasa si detecta alguna motocicleta con confianza `fast_model_confidence`.
+
+Para no perder motocicletas detenidas (que la sustracción de fondo absorbe), el
+modelo completo se ejecuta siempre que el frame inferido anterior tenía detecciones
+y, como mínimo, cada `refresh_interval` frames muestreados.
+"""
+import time
+
+import cv2
+import numpy as np
+
+# Filtros: off (sin cascada), motion (sustracción de fondo), fast_model (modelo ligero)
+CASCADE_GATES = ("off", "motion", "fast_model")
+
+DEFAULT_CASCADE_OPTIONS = {
+    "gate": "motion",
+    # Fracción mínima de píxeles en movimiento para ejecutar el modelo completo
+    "motion_threshold": 0.0001,
+    # Ancho al que se reduce el frame para la sustracción de fondo
+    "gate_width": 320,
+    # Frames con los que MOG2 aprende el fondo
+    "history": 50,
+    "var_threshold": 25,
+    # Resolución y confianza mínima del modelo ligero
+    "fast_model_imgsz": 320,
+    "fast_model_confidence": 0.15,
+    "class_name": "motorcycle",
+    # Frames muestreados seguidos que el filtro puede descartar como máximo
+    "refresh_interval": 10,
+}
+
+
+class CascadeGate:
+    """
+    Decide, frame a frame, si se ejecuta el modelo completo.
+
+    Debe crearse una por video (guarda el modelo de fondo y el estado entre frames).
+
+    Uso:
+        gate = CascadeGate(gate="motion")
+        if gate.should_run(frame):
+            results = detector.detect(model, img)
+            gate.record(results)
+
+    Args:
+        fast_model: Modelo ligero (obligatorio con `gate="fast_model"`).
+        **options: Sobrescriben `DEFAULT_CASCADE_OPTIONS`.
+    """
+
+    def __init__(self, fast_model=None, **options):
+        self.options = {**DEFAULT_CASCADE_OPTIONS, **{k: v for k, v in options.items() if v is not None}}
+        if self.options["gate"] not in CASCADE_GATES:
+            raise ValueError(f"Filtro de cascada no soportado: {self.options['gate']}")
+        if self.options["gate"] == "fast_model" and fast_model is None:
+            raise ValueError("El filtro fast_model requiere CROSSCOUNTER_FAST_MODEL_PATH.")
+        self.fast_model = fast_model
+        self._subtractor = None
+        self._since_full = 0
+        self._previous_had_detections = True
+        self.frames = 0
+        self.full_model_frames = 0
+        self.gate_s = 0.0
+        self.passes = {"gate": 0, "previous_detections": 0, "refresh": 0, "off": 0}
+
+    def _motion_fraction(self, frame):
+        if self._subtractor is None:
+            self._subtractor = cv2.createBackgroundSubtractorMOG2(
+                history=self.options["history"], varThreshold=self.options["var_threshold"], detectShadows=False
+            )
+        height, width = frame.shape[:2]
+        gate_width = min(self.options["gate_width"], width)
+        small = cv2.resize(frame, (gate_width, max(int(height * gate_width / width), 1)), interpolation=cv2.INTER_AREA)
+        mask = self._subtractor.apply(small)
+        # Quitar el ruido de píxeles sueltos antes de medir el área en movimiento
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+        return np.count_nonzero(mask) / mask.size
+
+    def _fast_model_detects(self, frame):
+        # Ultralytics interpreta los arrays de numpy como BGR: el frame se pasa tal cual
+        result = self.fast_model(frame, imgsz=self.options["fast_model_imgsz"], verbose=False)[0]
+        if len(result.boxes) == 0:
+            return False
+        conf = result.boxes.conf.cpu().numpy()
+        cls = result.boxes.cls.cpu().numpy().astype(int)
+        wanted = [index for index, name in result.names.items() if name == self.options["class_name"]]
+        return bool(np.any((conf >= self.options["fast_model_confidence"]) & np.isin(cls, wanted)))
+
+    def should_run(self, frame):
+        """
+        Evalúa el filtro sobre un frame muestreado.
+
+        Args:
+            frame (numpy.ndarray): Frame BGR.
+
+        Returns:
+            bool: True si hay que ejecutar el modelo completo.
+        """
+        self.frames += 1
+        gate = self.options["gate"]
+        if gate == "off":
+            reason = "off"
+        else:
+            start = time.perf_counter()
+            # El fondo se actualiza en todos los frames muestreados, se use o no el resultado
+            if gate == "motion":
+                passed = self._motion_fraction(frame) >= self.options["motion_threshold"]
+            else:
+                passed = self._fast_model_detects(frame)
+            self.gate_s += time.perf_counter() - start
+
+            if passed:
+                reason = "gate"
+            elif self._previous_had_detections:
+                reason = "previous_detections"
+            elif self._since_full + 1 >= self.options["refresh_interval"]:
+                reason = "refresh"
+            else:
+                self._since_full += 1
+                return False
+
+        self.passes[reason] += 1
+        self._since_full = 0
+        self.full_model_frames += 1
+        return True
+
+    def record(self, detections):
+        """
+        Registra el resultado del modelo completo en el frame actual.
+
+        Args:
+            detections (list): Tuplas (nombre, confianza, xmin, ymin, xmax, ymax).
+        """
+        self._previous_had_detections = any(name == self.options["class_name"] for name, *_ in detections)
+
+    @property
+    def stats(self):
+        """
+        Frames evaluados, frames con modelo completo, cómputo evitado y coste del filtro.
+        """
+        skipped = self.frames - self.full_model_frames
+        return {
+            "gate": self.options["gate"],
+            "frames": self.frames,
+            "full_model_frames": self.full_model_frames,
+            "skipped_frames": skipped,
+            "compute_saved": round(skipped / self.frames, 3) if self.frames else 0.0,
+            "gate_mean_ms": round(self.gate_s / self.frames * 1000, 3) if self.frames else 0.0,
+            "passes": self.passes,
+        }
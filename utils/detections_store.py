@@ -0,0 +1,223 @@
+"""
+Archivo auxiliar (sidecar) con todas las detecciones de un video y API de reconteo.
+
+Cada análisis de video guarda, además de los conteos en MongoDB, todas las
+detecciones en bruto de los frames muestreados (cajas, confianzas y clases) en un
+`.npz` comprimido. `recount` recalcula conteos, trayectorias y estadísticas para
+otro umbral de confianza, otras clases o una región de interés (ROI) a partir de
+ese archivo en milisegundos, sin volver a ejecutar el modelo.
+
+Las detecciones se guardan tal como salen del modelo, es decir, con su umbral de
+confianza por defecto: se puede recontar con umbrales iguales o más altos.
+
+Formato (arrays del `.npz`):
+    frame_index (F,): índice de cada frame muestreado en el video.
+    offsets (F + 1,): las detecciones del frame i son [offsets[i], offsets[i + 1]).
+    boxes (N, 4): cajas xyxy en píxeles (float32).
+    scores (N,): confianzas (float16).
+    classes (N,): índice de clase en `class_names` (uint16).
+    class_names, metadata: JSON con los nombres de clase y datos del video.
+"""
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from utils.tiling import pairwise_overlap
+
+DETECTIONS_DIR = os.environ.get(
+    "CROSSCOUNTER_DETECTIONS_DIR", os.path.join(tempfile.gettempdir(), "crosscounter-detections")
+)
+
+
+def detections_path(inference_id, directory=DETECTIONS_DIR):
+    """
+    Ruta del sidecar de una inferencia.
+    """
+    safe_id = "".join(c if c.isalnum() or c in "-_." else "-" for c in str(inference_id))
+    return os.path.join(directory, f"{safe_id}.npz")
+
+
+class DetectionRecorder:
+    """
+    Acumula las detecciones de los frames muestreados de un video y las guarda en un sidecar.
+
+    Uso:
+        recorder = DetectionRecorder(fps=fps, width=width, height=height, frame_interval=30)
+        recorder.add(frame_count, detections)  # tuplas de `TiledDetector.detect`
+        recorder.save(detections_path(inference_id))
+
+    Args:
+        **metadata: Datos del video que se guardan junto a las detecciones.
+    """
+
+    def __init__(self, **metadata):
+        self.metadata = metadata
+        self._frame_index = []
+        self._counts = []
+        self._boxes = []
+        self._scores = []
+        self._classes = []
+        self._class_ids = {}
+
+    def add(self, frame_idx, detections):
+        """
+        Registra las detecciones (de todas las clases) de un frame muestreado.
+
+        Args:
+            frame_idx (int): Índice del frame en el video.
+            detections (list): Tuplas (nombre, confianza, xmin, ymin, xmax, ymax).
+        """
+        self._frame_index.append(frame_idx)
+        self._counts.append(len(detections))
+        for name, confidence, x_min, y_min, x_max, y_max in detections:
+            self._boxes.append((x_min, y_min, x_max, y_max))
+            self._scores.append(confidence)
+            self._classes.append(self._class_ids.setdefault(name, len(self._class_ids)))
+
+    def save(self, path):
+        """
+        Escribe el sidecar comprimido.
+
+        Returns:
+            str: Ruta del archivo.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez_compressed(
+            path,
+            frame_index=np.asarray(self._frame_index, dtype=np.int64),
+            offsets=np.concatenate([[0], np.cumsum(self._counts, dtype=np.int64)]),
+            boxes=np.asarray(self._boxes, dtype=np.float32).reshape(-1, 4),
+            scores=np.asarray(self._scores, dtype=np.float16),
+            classes=np.asarray(self._classes, dtype=np.uint16),
+            class_names=np.array(json.dumps(list(self._class_ids))),
+            metadata=np.array(json.dumps(self.metadata, default=str)),
+        )
+        return path
+
+
+def load_detections(path):
+    """
+    Carga un sidecar en memoria.
+
+    Returns:
+        dict: Arrays del sidecar, con `class_names` (list) y `metadata` (dict) ya decodificados.
+    """
+    with np.load(path) as data:
+        sidecar = {key: data[key] for key in data.files}
+    sidecar["class_names"] = json.loads(str(sidecar["class_names"]))
+    sidecar["metadata"] = json.loads(str(sidecar["metadata"]))
+    return sidecar
+
+
+def points_in_polygon(points, polygon):
+    """
+    Indica qué puntos caen dentro de un polígono (regla par-impar, vectorizada).
+
+    Args:
+        points (numpy.ndarray): Puntos (N, 2).
+        polygon (list): Vértices [(x, y), ...] en píxeles.
+
+    Returns:
+        numpy.ndarray: Máscara booleana (N,).
+    """
+    polygon = np.asarray(polygon, dtype=np.float64)
+    x = points[:, 0][:, None]
+    y = points[:, 1][:, None]
+    x0, y0 = polygon[:, 0][None, :], polygon[:, 1][None, :]
+    x1, y1 = np.roll(polygon[:, 0], -1)[None, :], np.roll(polygon[:, 1], -1)[None, :]
+    crosses = ((y0 > y) != (y1 > y)) & (x < (x1 - x0) * (y - y0) / np.where(y1 == y0, 1e-12, y1 - y0) + x0)
+    return np.count_nonzero(crosses, axis=1) % 2 == 1
+
+
+def link_tracks(frame_of_detection, boxes, iou_threshold=0.3, max_gap=1):
+    """
+    Une detecciones de frames muestreados consecutivos en trayectorias (asociación
+    voraz por IoU), para contar vehículos distintos en lugar de apariciones.
+
+    Args:
+        frame_of_detection (numpy.ndarray): Posición del frame muestreado de cada detección (N,), ordenada.
+        boxes (numpy.ndarray): Cajas (N, 4).
+        iou_threshold (float): IoU mínimo para continuar una trayectoria.
+        max_gap (int): Frames muestreados que una trayectoria puede saltarse.
+
+    Returns:
+        numpy.ndarray: Identificador de trayectoria de cada detección (N,).
+    """
+    track_ids = np.full(len(boxes), -1, dtype=np.int64)
+    next_id = 0
+    # Trayectorias activas: (índice de su última detección, frame muestreado)
+    active = []
+    starts = np.flatnonzero(np.diff(frame_of_detection, prepend=-1)) if len(boxes) else []
+    ends = list(starts[1:]) + [len(boxes)]
+
+    for start, end in zip(starts, ends):
+        frame = frame_of_detection[start]
+        active = [(index, last_frame) for index, last_frame in active if frame - last_frame <= max_gap]
+        current = np.arange(start, end)
+
+        if active:
+            previous = np.array([index for index, _ in active])
+            overlap = pairwise_overlap(np.concatenate([boxes[previous], boxes[current]]))[: len(previous), len(previous):]
+            # Asociar primero los pares con mayor IoU
+            for flat in np.argsort(-overlap, axis=None):
+                row, column = divmod(int(flat), len(current))
+                if overlap[row, column] < iou_threshold:
+                    break
+                if track_ids[current[column]] == -1 and previous[row] != -1:
+                    track_ids[current[column]] = track_ids[previous[row]]
+                    previous[row] = -1
+            active = [(index, last_frame) for (index, last_frame), p in zip(active, previous) if p != -1]
+
+        for index in current:
+            if track_ids[index] == -1:
+                track_ids[index] = next_id
+                next_id += 1
+            active.append((index, frame))
+    return track_ids
+
+
+def recount(sidecar, min_confidence=0.25, classes=("motorcycle",), roi=None, iou_threshold=0.3):
+    """
+    Recalcula conteos a partir de un sidecar sin ejecutar el modelo.
+
+    Args:
+        sidecar (str | dict): Ruta del sidecar o resultado de `load_detections`.
+        min_confidence (float): Confianza mínima.
+        classes (iterable): Clases a contar (None = todas).
+        roi (list): Polígono [(x, y), ...] en píxeles; cuenta las cajas cuyo centro cae dentro.
+        iou_threshold (float): IoU mínimo para unir detecciones en una trayectoria.
+
+    Returns:
+        dict: Conteo total (suma por frame, como `total_motos`), conteo por frame
+        muestreado, trayectorias distintas y estadísticas por frame.
+    """
+    if isinstance(sidecar, str):
+        sidecar = load_detections(sidecar)
+
+    offsets = sidecar["offsets"]
+    boxes = sidecar["boxes"]
+    frame_of_detection = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+    mask = sidecar["scores"].astype(np.float32) >= min_confidence
+    if classes is not None:
+        wanted = [i for i, name in enumerate(sidecar["class_names"]) if name in set(classes)]
+        mask &= np.isin(sidecar["classes"], wanted)
+    if roi is not None and len(boxes):
+        centers = np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2], axis=1)
+        mask &= points_in_polygon(centers, roi)
+
+    per_frame = np.bincount(frame_of_detection[mask], minlength=len(offsets) - 1)
+    tracks = link_tracks(frame_of_detection[mask], boxes[mask], iou_threshold)
+
+    return {
+        "total_motos": int(per_frame.sum()),
+        "tracks": int(len(np.unique(tracks))),
+        "motorcycle_count_per_frame": [
+            {"frame_idx": int(frame_idx), "motorcycle_count": int(count)}
+            for frame_idx, count in zip(sidecar["frame_index"], per_frame)
+        ],
+        "max_per_frame": int(per_frame.max()) if len(per_frame) else 0,
+        "mean_per_frame": round(float(per_frame.mean()), 3) if len(per_frame) else 0.0,
+    }
@@ -0,0 +1,238 @@
+"""
+Exportación de detecciones y agregados de MongoDB a CSV, Parquet o NDJSON.
+
+Los resultados se leen con un cursor del servidor por lotes (`batch_size`) y cada
+lote se escribe en el archivo antes de pedir el siguiente, de modo que la memoria no
+crece con el número de filas: una exportación de millones de documentos usa la misma
+memoria que un lote.
+
+Uso desde la línea de comandos:
+    python -m utils.export --format parquet --start 2024-06-01 --end 2024-07-01 \
+        --camera cam-0 --output junio.parquet
+"""
+import argparse
+import csv
+import json
+from datetime import datetime
+
+from utils import mongodb
+
+EXPORT_FORMATS = ("csv", "parquet", "ndjson")
+# detections: un documento por frame; hourly: totales por cámara y hora
+EXPORT_KINDS = ("detections", "hourly")
+
+EXPORT_BATCH_SIZE = 5000
+
+# Columnas de cada tipo de exportación, en orden
+EXPORT_FIELDS = {
+    "detections": ("timestamp", "camera", "type", "inference_id", "detection_id", "frame_idx", "motorcycle_count", "time"),
+    "hourly": ("hour", "camera", "total_motos", "frames", "max_per_frame"),
+}
+
+
+def export_query(start=None, end=None, cameras=None):
+    """
+    Filtro de MongoDB por rango de fechas [start, end) y cámaras.
+
+    Args:
+        start (datetime): Inicio del rango (incluido).
+        end (datetime): Fin del rango (excluido).
+        cameras (list[str]): Cámaras a incluir (None = todas).
+
+    Returns:
+        dict: Filtro para `find` o `$match`.
+    """
+    query = {}
+    if cameras is not None:
+        query["camera"] = {"$in": list(cameras)}
+    if start is not None or end is not None:
+        query["timestamp"] = {}
+        if start is not None:
+            query["timestamp"]["$gte"] = start
+        if end is not None:
+            query["timestamp"]["$lt"] = end
+    return query
+
+
+def iter_batches(kind="detections", start=None, end=None, cameras=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Recorre los resultados de una exportación por lotes.
+
+    Args:
+        kind (str): Tipo de exportación (ver `EXPORT_KINDS`).
+        start (datetime): Inicio del rango.
+        end (datetime): Fin del rango.
+        cameras (list[str]): Cámaras a incluir.
+        batch_size (int): Documentos por lote (también el tamaño de lote del cursor).
+
+    Yields:
+        list[dict]: Filas con las columnas de `EXPORT_FIELDS[kind]`.
+    """
+    if kind not in EXPORT_KINDS:
+        raise ValueError(f"Tipo de exportación no soportado: {kind}")
+    query = export_query(start, end, cameras)
+
+    if kind == "detections":
+        projection = {field: 1 for field in EXPORT_FIELDS[kind]}
+        projection["_id"] = 0
+        # Orden del índice (camera, timestamp): el servidor no ordena en memoria
+        cursor = (
+            mongodb.collection.find(query, projection)
+            .sort([("camera", 1), ("timestamp", 1)])
+            .batch_size(batch_size)
+        )
+        rows = (document for document in cursor)
+    else:
+        pipeline = [
+            {"$match": query},
+            {"$group": {
+                "_id": {
+                    "camera": "$camera",
+                    "year": {"$year": "$timestamp"},
+                    "month": {"$month": "$timestamp"},
+                    "day": {"$dayOfMonth": "$timestamp"},
+                    "hour": {"$hour": "$timestamp"},
+                },
+                "total_motos": {"$sum": "$motorcycle_count"},
+                # Los agregados de `utils.retention` representan varios frames
+                "frames": {"$sum": {"$ifNull": ["$frames", 1]}},
+                "max_per_frame": {"$max": {"$ifNull": ["$max_per_frame", "$motorcycle_count"]}},
+            }},
+            {"$sort": {"_id.camera": 1, "_id.year": 1, "_id.month": 1, "_id.day": 1, "_id.hour": 1}},
+        ]
+        cursor = mongodb.collection.aggregate(pipeline, allowDiskUse=True, batchSize=batch_size)
+        rows = (
+            {
+                "hour": datetime(row["_id"]["year"], row["_id"]["month"], row["_id"]["day"], row["_id"]["hour"]),
+                "camera": row["_id"]["camera"],
+                "total_motos": row["total_motos"],
+                "frames": row["frames"],
+                "max_per_frame": row["max_per_frame"],
+            }
+            for row in cursor
+        )
+
+    batch = []
+    for row in rows:
+        batch.append({field: row.get(field) for field in EXPORT_FIELDS[kind]})
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _write_csv(batches, file, fields):
+    writer = csv.DictWriter(file, fieldnames=fields)
+    writer.writeheader()
+    rows = 0
+    for batch in batches:
+        writer.writerows(batch)
+        rows += len(batch)
+    return rows
+
+
+def _write_ndjson(batches, file, fields):
+    rows = 0
+    for batch in batches:
+        file.write("".join(json.dumps(row, default=_json_default, ensure_ascii=False) + "\n" for row in batch))
+        rows += len(batch)
+    return rows
+
+
+def _parquet_schema(kind):
+    import pyarrow as pa
+
+    if kind == "detections":
+        return pa.schema([
+            ("timestamp", pa.timestamp("ms")),
+            ("camera", pa.string()),
+            ("type", pa.string()),
+            ("inference_id", pa.string()),
+            ("detection_id", pa.string()),
+            ("frame_idx", pa.int64()),
+            ("motorcycle_count", pa.int64()),
+            ("time", pa.float64()),
+        ])
+    return pa.schema([
+        ("hour", pa.timestamp("ms")),
+        ("camera", pa.string()),
+        ("total_motos", pa.int64()),
+        ("frames", pa.int64()),
+        ("max_per_frame", pa.int64()),
+    ])
+
+
+def _write_parquet(batches, path, kind):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema(kind)
+    rows = 0
+    # Un grupo de filas por lote: el archivo se escribe a medida que llegan los datos
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for batch in batches:
+            for row in batch:
+                # Documentos de imagen antiguos guardan `time` como fecha
+                if kind == "detections" and not isinstance(row["time"], (int, float, type(None))):
+                    row["time"] = None
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            rows += len(batch)
+    return rows
+
+
+def export_results(path, export_format="csv", kind="detections", start=None, end=None, cameras=None,
+                   batch_size=EXPORT_BATCH_SIZE):
+    """
+    Exporta detecciones o agregados a un archivo, lote a lote.
+
+    Args:
+        path (str): Archivo de salida.
+        export_format (str): Formato (ver `EXPORT_FORMATS`).
+        kind (str): Tipo de exportación (ver `EXPORT_KINDS`).
+        start (datetime): Inicio del rango (incluido).
+        end (datetime): Fin del rango (excluido).
+        cameras (list[str]): Cámaras a incluir (None = todas).
+        batch_size (int): Documentos por lote.
+
+    Returns:
+        int: Filas exportadas.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Formato de exportación no soportado: {export_format}")
+    batches = iter_batches(kind, start, end, cameras, batch_size)
+    fields = EXPORT_FIELDS[kind]
+
+    if export_format == "parquet":
+        return _write_parquet(batches, path, kind)
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        if export_format == "csv":
+            return _write_csv(batches, file, fields)
+        return _write_ndjson(batches, file, fields)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exporta detecciones de MongoDB")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--kind", choices=EXPORT_KINDS, default="detections")
+    parser.add_argument("--start", type=datetime.fromisoformat, default=None, help="Fecha inicial (AAAA-MM-DD)")
+    parser.add_argument("--end", type=datetime.fromisoformat, default=None, help="Fecha final, excluida")
+    parser.add_argument("--camera", action="append", default=None, help="Cámara (se puede repetir)")
+    parser.add_argument("--site", action="append", default=None, help="Sitio (se puede repetir)")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    parser.add_argument("--output", required=True)
+    args = parser.parse_args(argv)
+
+    cameras = mongodb.resolve_cameras(args.camera, args.site)
+    rows = export_results(args.output, args.format, args.kind, args.start, args.end, cameras, args.batch_size)
+    print(f"{rows} filas exportadas a {args.output}")
+
+
+if __name__ == "__main__":
+    main()
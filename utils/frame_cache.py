@@ -0,0 +1,262 @@
+"""
+Caché de frames decodificados para volver a analizar un video sin decodificarlo.
+
+Al procesar un video con la caché activa, cada frame decodificado se escribe en un
+archivo `.npy` mapeado en memoria, cuya clave es el hash del contenido del video y la
+resolución guardada. Los análisis siguientes del mismo video (otro `frame_interval`,
+otro umbral) leen los frames como vistas de solo lectura del archivo mapeado, sin
+pasar por el decodificador.
+
+Los frames se guardan a la resolución original, de modo que activar la caché no
+cambia las detecciones ni el video de salida. Para ocupar menos disco se puede
+reducir explícitamente su ancho con `CROSSCOUNTER_FRAME_CACHE_MAX_WIDTH` (o
+`max_width` en `open_video`), sabiendo que entonces los resultados son los de esa
+resolución también en el primer análisis.
+
+La caché ocupa como máximo `FRAME_CACHE_MAX_MB` en disco: al superarse se eliminan
+las entradas usadas hace más tiempo (LRU según la fecha de modificación, que se
+actualiza en cada acierto). Los videos cuya entrada no cabría se procesan sin caché.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import uuid
+
+import cv2
+import numpy as np
+
+FRAME_CACHE_DIR = os.environ.get(
+    "CROSSCOUNTER_FRAME_CACHE_DIR", os.path.join(tempfile.gettempdir(), "crosscounter-frames")
+)
+FRAME_CACHE_MAX_MB = int(os.environ.get("CROSSCOUNTER_FRAME_CACHE_MB", "4096"))
+# Ancho máximo de los frames guardados (0 = resolución original)
+FRAME_CACHE_MAX_WIDTH = int(os.environ.get("CROSSCOUNTER_FRAME_CACHE_MAX_WIDTH", "0"))
+
+
+def video_hash(video_path, chunk_size=1024 * 1024):
+    """
+    Hash del contenido del video (no depende del nombre ni de la ruta del archivo).
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(video_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cached_size(width, height, max_width=FRAME_CACHE_MAX_WIDTH):
+    """
+    Resolución con la que se guardan los frames de un video: la original, o reducida
+    (pares) si se indica un ancho máximo menor.
+    """
+    if not max_width or width <= max_width:
+        return width, height
+    scale = max_width / width
+    return max_width, int(height * scale) // 2 * 2
+
+
+def _entries(cache_dir):
+    """
+    Entradas completas de la caché: (ruta sin extensión, bytes, fecha de uso).
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".json"):
+            continue
+        base = os.path.join(cache_dir, name[:-5])
+        try:
+            size = os.path.getsize(base + ".npy") + os.path.getsize(base + ".json")
+            entries.append((base, size, os.path.getmtime(base + ".json")))
+        except OSError:
+            continue
+    return entries
+
+
+def evict(cache_dir=FRAME_CACHE_DIR, max_bytes=FRAME_CACHE_MAX_MB * 1024 * 1024):
+    """
+    Elimina las entradas usadas hace más tiempo hasta que la caché quepa en `max_bytes`.
+
+    Returns:
+        int: Bytes liberados.
+    """
+    if not os.path.isdir(cache_dir):
+        return 0
+    entries = sorted(_entries(cache_dir), key=lambda entry: entry[2])
+    total = sum(size for _, size, _ in entries)
+    freed = 0
+    for base, size, _ in entries:
+        if total <= max_bytes:
+            break
+        for suffix in (".json", ".npy"):
+            try:
+                os.remove(base + suffix)
+            except FileNotFoundError:
+                pass
+        total -= size
+        freed += size
+    return freed
+
+
+class CachedVideoReader:
+    """
+    Lee frames de una entrada de la caché con la interfaz de `cv2.VideoCapture`
+    que usa el pipeline (`isOpened`, `read`, `get`, `release`).
+
+    `read` devuelve vistas de solo lectura sobre el archivo mapeado (sin copia); quien
+    necesite modificar el frame debe copiarlo (ver `OverlayCompositor.apply`).
+    """
+
+    cache_hit = True
+
+    def __init__(self, base, metadata):
+        self._frames = np.load(base + ".npy", mmap_mode="r")
+        self._metadata = metadata
+        self._position = 0
+        self._opened = True
+        # Actualizar la fecha de uso para el LRU
+        os.utime(base + ".json")
+
+    def isOpened(self):
+        return self._opened
+
+    def read(self):
+        if not self._opened or self._position >= self._metadata["frame_count"]:
+            return False, None
+        frame = self._frames[self._position]
+        self._position += 1
+        return True, frame
+
+    def get(self, prop):
+        return {
+            cv2.CAP_PROP_FPS: self._metadata["fps"],
+            cv2.CAP_PROP_FRAME_COUNT: self._metadata["frame_count"],
+            cv2.CAP_PROP_FRAME_WIDTH: self._metadata["width"],
+            cv2.CAP_PROP_FRAME_HEIGHT: self._metadata["height"],
+            cv2.CAP_PROP_POS_FRAMES: self._position,
+        }.get(prop, 0)
+
+    def release(self):
+        self._opened = False
+        self._frames = None
+
+
+class CachingVideoReader:
+    """
+    Decodifica con `cv2.VideoCapture` y, a la vez, escribe los frames reducidos en
+    una entrada nueva de la caché. La entrada solo se publica si el video se leyó
+    completo; si el procesamiento se interrumpe se descarta.
+
+    Los frames devueltos tienen la resolución guardada (la original salvo que se
+    pida reducirla), igual que en los análisis posteriores.
+    """
+
+    cache_hit = False
+
+    def __init__(self, capture, base, size, frame_count, fps, cache_dir, max_bytes):
+        self._capture = capture
+        self._base = base
+        self._size = size
+        self._fps = fps
+        self._cache_dir = cache_dir
+        self._max_bytes = max_bytes
+        self._temporary = f"{base}.{uuid.uuid4().hex}.tmp.npy"
+        width, height = size
+        self._frames = np.lib.format.open_memmap(
+            self._temporary, mode="w+", dtype=np.uint8, shape=(frame_count, height, width, 3)
+        )
+        self._written = 0
+        self._complete = False
+
+    def isOpened(self):
+        return self._capture.isOpened()
+
+    def read(self):
+        ret, frame = self._capture.read()
+        if not ret:
+            self._complete = True
+            return ret, frame
+        if (frame.shape[1], frame.shape[0]) != self._size:
+            frame = cv2.resize(frame, self._size, interpolation=cv2.INTER_AREA)
+        if self._frames is not None:
+            if self._written < len(self._frames):
+                self._frames[self._written] = frame
+                self._written += 1
+            else:
+                # El contenedor declaraba menos frames de los reales: no se guarda
+                self._discard()
+        return ret, frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self._size[0]
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self._size[1]
+        return self._capture.get(prop)
+
+    def _discard(self):
+        self._frames = None
+        try:
+            os.remove(self._temporary)
+        except FileNotFoundError:
+            pass
+
+    def release(self):
+        self._capture.release()
+        if self._frames is None:
+            return
+        if not self._complete or self._written == 0:
+            self._discard()
+            return
+
+        self._frames.flush()
+        self._frames = None
+        os.replace(self._temporary, self._base + ".npy")
+        width, height = self._size
+        metadata = {"frame_count": self._written, "fps": self._fps, "width": width, "height": height}
+        with open(self._base + ".json", "w", encoding="utf-8") as file:
+            json.dump(metadata, file)
+        evict(self._cache_dir, self._max_bytes)
+
+
+def open_video(video_path, use_cache=True, cache_dir=FRAME_CACHE_DIR, max_bytes=FRAME_CACHE_MAX_MB * 1024 * 1024,
+               max_width=FRAME_CACHE_MAX_WIDTH):
+    """
+    Abre un video para el pipeline de inferencia, usando la caché de frames si se pide.
+
+    Args:
+        video_path (str): Ruta del video.
+        use_cache (bool): Si es False se devuelve un `cv2.VideoCapture` normal.
+        cache_dir (str): Directorio de la caché.
+        max_bytes (int): Tamaño máximo de la caché en disco.
+        max_width (int): Ancho máximo de los frames guardados (0 = resolución original).
+
+    Returns:
+        CachedVideoReader | CachingVideoReader | cv2.VideoCapture: Objeto con la
+        interfaz de `cv2.VideoCapture`.
+    """
+    capture = cv2.VideoCapture(str(video_path))
+    if not use_cache or not capture.isOpened():
+        return capture
+
+    width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    size = cached_size(width, height, max_width)
+    os.makedirs(cache_dir, exist_ok=True)
+    base = os.path.join(cache_dir, f"{video_hash(video_path)}-{size[0]}x{size[1]}")
+
+    if os.path.exists(base + ".json"):
+        try:
+            with open(base + ".json", encoding="utf-8") as file:
+                metadata = json.load(file)
+            reader = CachedVideoReader(base, metadata)
+            capture.release()
+            return reader
+        except (OSError, ValueError):
+            pass  # Entrada dañada: se vuelve a crear
+
+    # Solo se guarda si la entrada cabe en la caché
+    frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    if frame_count <= 0 or frame_count * size[0] * size[1] * 3 > max_bytes:
+        return capture
+    return CachingVideoReader(capture, base, size, frame_count, capture.get(cv2.CAP_PROP_FPS), cache_dir, max_bytes)
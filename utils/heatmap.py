@@ -0,0 +1,238 @@
+"""
+Mapa de calor de las posiciones de las motocicletas por cámara.
+
+Cada detección se acumula en una rejilla reducida (`HEATMAP_SHAPE`, en coordenadas
+normalizadas del frame, de modo que no depende de la resolución del video):
+
+- centroid: suma 1 en la celda del centro de la caja (`np.add.at`).
+- footprint: suma 1 en todas las celdas que cubre la caja, con una matriz de
+  diferencias (cuatro `np.add.at` por lote de cajas) que se integra con sumas
+  acumuladas al guardar; el coste por frame no depende del tamaño de las cajas.
+
+La memoria es la de la rejilla de la hora en curso, sea cual sea la duración del
+video. Al cambiar de hora (según el timestamp de los frames) y al terminar, la
+rejilla se guarda en el archivo de esa cámara, hora e inferencia
+(`{camera}/{AAAAMMDDTHH}-{inference_id}.npz`), junto con los frames muestreados, y
+se guarda un frame de referencia reducido sobre el que se dibuja el mapa en las
+estadísticas. Cada archivo tiene un único escritor y se reemplaza (no se suma), así
+que guardar dos veces la misma hora de una inferencia no duplica el calor; las
+estadísticas suman los archivos de todas las inferencias. Sin `inference_id` (p. ej.
+un análisis cuyos conteos no se guardan en MongoDB) no se guarda nada.
+"""
+import glob
+import os
+import tempfile
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+HEATMAP_DIR = os.environ.get(
+    "CROSSCOUNTER_HEATMAP_DIR", os.path.join(tempfile.gettempdir(), "crosscounter-heatmaps")
+)
+
+# Celdas de la rejilla (filas, columnas)
+HEATMAP_SHAPE = (90, 160)
+HEATMAP_MODES = ("centroid", "footprint")
+# Ancho del frame de referencia guardado por cámara
+BACKGROUND_WIDTH = 640
+
+
+def _camera_dir(camera, directory=HEATMAP_DIR):
+    safe_camera = "".join(c if c.isalnum() or c in "-_." else "-" for c in str(camera))
+    return os.path.join(directory, safe_camera)
+
+
+class HeatmapAccumulator:
+    """
+    Acumula las cajas detectadas de una cámara en una rejilla por hora.
+
+    Uso:
+        heatmap = HeatmapAccumulator("cam-0", (width, height), inference_id)
+        heatmap.add(frame_timestamp, detections)  # tuplas de `extract_motorcycle_detections`
+        heatmap.flush()
+
+    Args:
+        camera (str): Cámara de los frames.
+        frame_size (tuple): (ancho, alto) de los frames en píxeles.
+        inference_id (str): Inferencia a la que pertenecen los frames (None = no se guarda).
+        shape (tuple): Celdas de la rejilla (filas, columnas).
+        mode (str): Qué se acumula de cada caja (ver `HEATMAP_MODES`).
+        directory (str): Directorio de los mapas guardados.
+    """
+
+    def __init__(self, camera, frame_size, inference_id=None, shape=HEATMAP_SHAPE, mode="footprint",
+                 directory=HEATMAP_DIR):
+        if mode not in HEATMAP_MODES:
+            raise ValueError(f"Modo de mapa de calor no soportado: {mode}")
+        self.camera = camera
+        self.inference_id = inference_id
+        self.width, self.height = frame_size
+        self.shape = tuple(shape)
+        self.mode = mode
+        self.directory = directory
+        self.saved_hours = 0
+        self._hour = None
+        self._frames = 0
+        self._background = None
+        # Centroides: conteos directos; huellas: matriz de diferencias (una fila y columna más)
+        rows, cols = self.shape
+        self._grid = np.zeros((rows + 1, cols + 1) if mode == "footprint" else self.shape, dtype=np.float32)
+        self._scale = np.array([cols / max(self.width, 1), rows / max(self.height, 1)], dtype=np.float32)
+
+    def set_background(self, frame):
+        """
+        Guarda (una vez) una copia reducida del frame como referencia para el mapa.
+        """
+        if self._background is not None:
+            return
+        height, width = frame.shape[:2]
+        target_width = min(BACKGROUND_WIDTH, width)
+        self._background = cv2.resize(
+            frame, (target_width, max(int(height * target_width / width), 1)), interpolation=cv2.INTER_AREA
+        )
+
+    def add(self, timestamp, detections):
+        """
+        Acumula las cajas de un frame muestreado.
+
+        Args:
+            timestamp (datetime): Hora real del frame.
+            detections (list): Tuplas (nombre, confianza, xmin, ymin, xmax, ymax).
+        """
+        hour = timestamp.replace(minute=0, second=0, microsecond=0)
+        if self._hour is not None and hour != self._hour:
+            self.flush()
+            self._grid[:] = 0
+            self._frames = 0
+        self._hour = hour
+        self._frames += 1
+        if not detections:
+            return
+
+        rows, cols = self.shape
+        boxes = np.array([detection[2:6] for detection in detections], dtype=np.float32)
+        # Coordenadas de celda de las esquinas (x, y)
+        corners = (boxes.reshape(-1, 2, 2) * self._scale).astype(np.intp)
+        x = np.clip(corners[:, :, 0], 0, cols - 1)
+        y = np.clip(corners[:, :, 1], 0, rows - 1)
+        if self.mode == "centroid":
+            np.add.at(self._grid, ((y[:, 0] + y[:, 1]) // 2, (x[:, 0] + x[:, 1]) // 2), 1)
+        else:
+            np.add.at(self._grid, (y[:, 0], x[:, 0]), 1)
+            np.add.at(self._grid, (y[:, 0], x[:, 1] + 1), -1)
+            np.add.at(self._grid, (y[:, 1] + 1, x[:, 0]), -1)
+            np.add.at(self._grid, (y[:, 1] + 1, x[:, 1] + 1), 1)
+
+    def _counts(self):
+        if self.mode == "centroid":
+            return self._grid
+        rows, cols = self.shape
+        return self._grid.cumsum(axis=0).cumsum(axis=1)[:rows, :cols]
+
+    def flush(self):
+        """
+        Guarda la rejilla de la hora en curso en su archivo (reemplazándolo). Se puede
+        llamar varias veces: la rejilla se vacía solo al cambiar de hora.
+
+        Returns:
+            str | None: Ruta del archivo, o None si no había frames o no se guarda.
+        """
+        if self._hour is None or not self._frames or self.inference_id is None:
+            return None
+        directory = _camera_dir(self.camera, self.directory)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self._hour:%Y%m%dT%H}-{self.inference_id}.npz")
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as file:
+            np.savez_compressed(file, counts=self._counts().astype(np.float32), frames=np.int64(self._frames))
+        os.replace(temporary, path)
+        if self._background is not None:
+            cv2.imwrite(os.path.join(directory, "background.jpg"), self._background)
+        self.saved_hours += 1
+        return path
+
+    @property
+    def stats(self):
+        """
+        Modo, celdas de la rejilla, horas guardadas y memoria de la rejilla.
+        """
+        return {
+            "mode": self.mode,
+            "shape": self.shape,
+            "saved_hours": self.saved_hours,
+            "grid_kb": round(self._grid.nbytes / 1024, 1),
+        }
+
+
+def list_heatmap_cameras(directory=HEATMAP_DIR):
+    """
+    Cámaras con algún mapa de calor guardado.
+    """
+    return sorted({
+        os.path.basename(os.path.dirname(path)) for path in glob.glob(os.path.join(directory, "*", "*.npz"))
+    })
+
+
+def load_heatmap(cameras=None, start=None, end=None, directory=HEATMAP_DIR):
+    """
+    Suma los mapas guardados de las cámaras y horas de [start, end).
+
+    Args:
+        cameras (list[str]): Cámaras a incluir (None = todas).
+        start (datetime): Inicio del rango (incluido).
+        end (datetime): Fin del rango (excluido).
+        directory (str): Directorio de los mapas guardados.
+
+    Returns:
+        tuple: (rejilla de conteos o None, frames muestreados, frame de referencia o None).
+    """
+    camera_dirs = (
+        [_camera_dir(camera, directory) for camera in cameras]
+        if cameras is not None else sorted(glob.glob(os.path.join(directory, "*")))
+    )
+    total, frames, background = None, 0, None
+    for camera_dir in camera_dirs:
+        for path in sorted(glob.glob(os.path.join(camera_dir, "*.npz"))):
+            hour = datetime.strptime(os.path.basename(path)[:11], "%Y%m%dT%H")
+            if (start is not None and hour < start) or (end is not None and hour >= end):
+                continue
+            with np.load(path) as saved:
+                counts = saved["counts"]
+                if total is None:
+                    total = counts.astype(np.float64)
+                elif counts.shape != total.shape:
+                    continue  # Rejilla de otro tamaño (HEATMAP_SHAPE cambiado)
+                else:
+                    total += counts
+                frames += int(saved["frames"])
+        if background is None and os.path.exists(os.path.join(camera_dir, "background.jpg")):
+            background = cv2.imread(os.path.join(camera_dir, "background.jpg"))
+    return total, frames, background
+
+
+def render_heatmap(counts, background=None, alpha=0.6, size=(BACKGROUND_WIDTH, 360)):
+    """
+    Dibuja la rejilla como mapa de color sobre el frame de referencia.
+
+    Args:
+        counts (numpy.ndarray): Rejilla de conteos.
+        background (numpy.ndarray): Frame BGR de referencia (None = fondo negro).
+        alpha (float): Opacidad máxima del mapa.
+        size (tuple): (ancho, alto) de la imagen sin frame de referencia.
+
+    Returns:
+        numpy.ndarray: Imagen BGR.
+    """
+    if background is None:
+        background = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+    height, width = background.shape[:2]
+    peak = float(counts.max()) if counts.size else 0.0
+    if peak <= 0:
+        return background.copy()
+    density = cv2.resize((counts / peak).astype(np.float32), (width, height), interpolation=cv2.INTER_CUBIC)
+    density = cv2.GaussianBlur(np.clip(density, 0, 1), (0, 0), sigmaX=max(width / counts.shape[1], 1))
+    colored = cv2.applyColorMap((density * 255).astype(np.uint8), cv2.COLORMAP_JET)
+    # Opacidad proporcional a la densidad: las zonas sin motocicletas dejan ver el frame
+    weight = (np.clip(density / max(float(density.max()), 1e-6), 0, 1) * alpha)[:, :, None]
+    return (background * (1 - weight) + colored * weight).astype(np.uint8)
@@ -1,28 +1,106 @@
 import streamlit as st
-from yt_dlp import YoutubeDL
 from pathlib import Path
-from ultralytics import YOLO
 import os
+import csv
 import subprocess
-from googleapiclient.discovery import build
-from datetime import datetime
+from datetime import datetime, timedelta
 import cv2
 import tempfile
 from PIL import Image
 import requests
-import yt_dlp
 import isodate
+import queue
+import re
+import shutil
+import secrets
+import threading
+import time
+import uuid
+
+from utils.video_writer import create_video_writer, ffmpeg_path
+from utils.overlay import APP_NAME, OverlayCompositor
+from utils.model_pool import ModelPool, PooledModel
 
 # Obtener la API de YouTube desde los secretos de Streamlit Cloud
-YOUTUBE_API_KEY = st.secrets["YOUTUBE"]["YOUTUBE_API_KEY"]
+YOUTUBE_API_KEY = os.environ.get("YOUTUBE_API_KEY") or st.secrets["YOUTUBE"]["YOUTUBE_API_KEY"]
+
+# Ruta del modelo YOLOv8 (puede sobrescribirse con CROSSCOUNTER_MODEL_PATH)
+model_path = os.environ.get("CROSSCOUNTER_MODEL_PATH", "models/best.pt")
+# Modelo ligero opcional (p. ej. una variante nano) para el modo de tiempo real
+fast_model_path = os.environ.get("CROSSCOUNTER_FAST_MODEL_PATH")
+
+
+def _yolo_loader(path):
+    """
+    Función que crea una instancia nueva del modelo de `path` (para `ModelPool`).
+    """
+    def load():
+        from ultralytics import YOLO
+
+        return YOLO(path, verbose=False)
+
+    return load
+
+
+@st.cache_resource(show_spinner="Cargando el modelo...")
+def load_model():
+    """
+    Carga el modelo YOLOv8 la primera vez que un modo de inferencia lo necesita y lo
+    comparte entre sesiones y reruns. torch y ultralytics se importan aquí para no
+    retrasar el arranque de la aplicación.
+
+    El modelo devuelto es un `PooledModel`: cada llamada usa en exclusiva una de las
+    instancias del pool (ver `utils.model_pool`), por lo que las sesiones concurrentes
+    no comparten el estado del predictor. La primera instancia se carga aquí.
+
+    Returns:
+        PooledModel: Modelo cargado.
+    """
+    pool = ModelPool(_yolo_loader(model_path))
+    try:
+        pool.release(pool.acquire())
+    except Exception as e:
+        st.error(f"Error al cargar el modelo: {e}")
+        st.stop()
+    return PooledModel(pool)
+
+
+@st.cache_resource(show_spinner="Cargando el modelo ligero...")
+def load_fast_model():
+    """
+    Carga el modelo ligero de `CROSSCOUNTER_FAST_MODEL_PATH`, si está configurado.
+
+    Returns:
+        PooledModel | None: Modelo cargado (con su propio pool de instancias), o None si
+        no hay modelo ligero o no se pudo cargar.
+    """
+    if not fast_model_path:
+        return None
+    pool = ModelPool(_yolo_loader(fast_model_path))
+    try:
+        pool.release(pool.acquire())
+    except Exception as e:
+        st.warning(f"No se pudo cargar el modelo ligero: {e}")
+        return None
+    return PooledModel(pool)
+
+def extract_video_id(youtube_url):
+    """
+    Extrae el ID de un video a partir de su URL de YouTube.
+
+    Args:
+        youtube_url (str): URL del video de YouTube.
+
+    Returns:
+        str: ID del video.
+
+    Raises:
+        ValueError: Si la URL no contiene un ID de video.
+    """
+    if "v=" in youtube_url:
+        return youtube_url.split("v=")[1].split("&")[0].split("#")[0]
+    raise ValueError("URL de YouTube no válida.")
 
-# Cargar el modelo YOLOv8
-model_path = "models/best.pt"
-try:
-    model = YOLO(model_path, verbose=False)
-except Exception as e:
-    st.error(f"Error al cargar el modelo: {e}")
-    st.stop()
 
 def get_youtube_video_metadata(youtube_url):
     """
@@ -39,12 +117,11 @@ def get_youtube_video_metadata(youtube_url):
     """
     try:
         # Extraer el ID del video desde la URL
-        if "v=" in youtube_url:
-            video_id = youtube_url.split("v=")[1].split("&")[0]
-        else:
-            raise ValueError("URL de YouTube no válida.")
+        video_id = extract_video_id(youtube_url)
 
         # Construir cliente de la API de YouTube
+        from googleapiclient.discovery import build
+
         youtube = build("youtube", "v3", developerKey=YOUTUBE_API_KEY)
 
         # Obtener información del video
@@ -80,18 +157,67 @@ def get_youtube_video_metadata(youtube_url):
         # Manejar errores y lanzar excepciones con un mensaje descriptivo
         raise RuntimeError(f"Error al obtener los metadatos del video: {e}")
 
+# Reintentos de descarga: yt-dlp reanuda el archivo .part desde su desplazamiento en bytes
+DOWNLOAD_MAX_ATTEMPTS = 5
+DOWNLOAD_BACKOFF_S = 2.0
+# Tamaño de cada petición HTTP por rangos durante la descarga
+DOWNLOAD_CHUNK_SIZE = 10 * 1024 * 1024
+
+
+def _progress_hook(progress_callback):
+    """
+    Adapta un callback de progreso (fracción 0-1) al formato de `progress_hooks` de yt-dlp.
+    """
+    def hook(status):
+        total = status.get("total_bytes") or status.get("total_bytes_estimate")
+        if status.get("status") == "downloading" and total:
+            progress_callback(min(status.get("downloaded_bytes", 0) / total, 1.0))
+        elif status.get("status") == "finished":
+            progress_callback(1.0)
+    return hook
+
+
+def _download_with_retries(ydl_opts, url, max_attempts=DOWNLOAD_MAX_ATTEMPTS):
+    """
+    Descarga con yt-dlp reintentando con espera exponencial. Como `continuedl` está
+    activo, cada reintento continúa desde los bytes ya escritos en el archivo .part.
+    """
+    from yt_dlp import YoutubeDL
+
+    ydl_opts = {
+        "continuedl": True,
+        "http_chunk_size": DOWNLOAD_CHUNK_SIZE,
+        "retries": 10,
+        "fragment_retries": 10,
+        **ydl_opts,
+    }
+    for attempt in range(1, max_attempts + 1):
+        try:
+            with YoutubeDL(ydl_opts) as ydl:
+                ydl.download([url])
+            return
+        except Exception:
+            if attempt == max_attempts:
+                raise
+            time.sleep(DOWNLOAD_BACKOFF_S * 2 ** (attempt - 1))
+
+
 #  función para descargar un video de YouTube
-def download_youtube_video(youtube_url):
+def download_youtube_video(youtube_url, progress_callback=None):
     """
     Descarga un video de YouTube utilizando yt-dlp.
 
+    La descarga se hace por rangos HTTP y se reanuda desde el último byte escrito
+    si falla a mitad de camino.
+
     Args:
         youtube_url (str): URL del video de YouTube.
+        progress_callback (callable): Recibe la fracción descargada (0-1).
 
     Returns:
         str: Ruta al archivo descargado.
     """
-    output_template = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4").name
+    from yt_dlp import YoutubeDL
 
     # Comprobar los formatos disponibles antes de descargar
     try:
@@ -110,8 +236,10 @@ def download_youtube_video(youtube_url):
     except Exception as e:
         raise RuntimeError(f"Error al obtener información del video: {e}")
 
-    metadata = get_youtube_video_metadata(youtube_url)
-    video_id = metadata["video_id"]
+    video_id = extract_video_id(youtube_url)
+
+    # Ruta estable por video: si la descarga se interrumpe, el .part se reanuda
+    output_template = os.path.join(_job_directory(video_id), "video.mp4")
 
     # Descargar el video utilizando el formato encontrado
     ydl_opts = {
@@ -120,10 +248,11 @@ def download_youtube_video(youtube_url):
         "quiet": False,  # Cambiar a False temporalmente para depuración
         "postprocessors": [],  # No usar postprocesadores que requieran ffmpeg
     }
+    if progress_callback is not None:
+        ydl_opts["progress_hooks"] = [_progress_hook(progress_callback)]
 
     try:
-        with YoutubeDL(ydl_opts) as ydl:
-            ydl.download([f"https://www.youtube.com/watch?v={video_id}"])
+        _download_with_retries(ydl_opts, f"https://www.youtube.com/watch?v={video_id}")
             # st.text(f"Descargando video: {ydl.process_info['downloaded_bytes'] / 1024 / 1024:.2f} MB")
         
         # Verificar que el archivo se haya descargado correctamente
@@ -137,49 +266,239 @@ def download_youtube_video(youtube_url):
         raise RuntimeError(f"Error al descargar el video: {e}")
 
 
-# función para segmentar un video
-def segment_video(video_path, segment_duration=200):
+def _job_directory(video_id):
+    """
+    Directorio temporal estable para las descargas de un video (permite reanudar).
     """
-    Divide un video en segmentos más pequeños.
+    path = os.path.join(tempfile.gettempdir(), f"crosscounter-{video_id}")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def plan_video_sections(duration, first_section_s=15, max_section_s=200):
+    """
+    Divide la duración de un video en secciones que crecen geométricamente: la primera
+    es corta para obtener el primer conteo en segundos y las siguientes se duplican
+    hasta `max_section_s`.
 
     Args:
-        video_path (str): Ruta del video original.
-        segment_duration (int): Duración máxima de cada segmento en segundos.
+        duration (float): Duración total en segundos.
+        first_section_s (float): Duración de la primera sección.
+        max_section_s (float): Duración máxima de una sección.
 
     Returns:
-        list: Lista de rutas a los segmentos generados.
+        list: Tuplas (inicio, fin) en segundos.
     """
-    cap = cv2.VideoCapture(video_path)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    fps = int(cap.get(cv2.CAP_PROP_FPS))
-    total_duration = total_frames / fps
+    sections = []
+    start = 0.0
+    length = min(first_section_s, max_section_s)
+    while start < duration:
+        end = min(start + length, duration)
+        sections.append((start, end))
+        start = end
+        length = min(length * 2, max_section_s)
+    return sections
+
+
+def stream_youtube_sections(youtube_url, duration, first_section_s=15, max_section_s=200, prefetch=2):
+    """
+    Descarga un video de YouTube por secciones temporales en un hilo de fondo y las
+    entrega en orden a medida que terminan, para que la inferencia empiece con la
+    primera sección mientras el resto se sigue descargando.
 
-    segments = []
-    start_time = 0
+    Cada sección es un archivo decodificable por sí mismo (yt-dlp `download_ranges`,
+    requiere ffmpeg). Las secciones ya descargadas en un intento anterior se
+    reutilizan; una sección interrumpida se vuelve a descargar entera.
 
-    while start_time < total_duration:
-        end_time = min(start_time + segment_duration, total_duration)
-        segment_path = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4").name
+    ffmpeg corta sin recodificar, así que una sección puede incluir frames de antes de
+    `start` (desde el keyframe anterior) o de después de `end`; quien la procesa debe
+    descartarlos por su timestamp (ver `process_youtube_video_inference`).
 
-        out = cv2.VideoWriter(
-            segment_path,
-            cv2.VideoWriter_fourcc(*'mp4v'),
-            fps,
-            (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))),
-        )
+    Args:
+        youtube_url (str): URL del video de YouTube.
+        duration (float): Duración total en segundos.
+        first_section_s (float): Duración de la primera sección.
+        max_section_s (float): Duración máxima de una sección.
+        prefetch (int): Secciones descargadas por delante de la inferencia como máximo
+            (limita el uso de disco).
 
-        cap.set(cv2.CAP_PROP_POS_FRAMES, start_time * fps)
-        while cap.get(cv2.CAP_PROP_POS_MSEC) < end_time * 1000:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            out.write(frame)
+    Yields:
+        dict: {"index", "start", "end", "path", "sections"} de cada sección descargada.
 
-        out.release()
-        segments.append(segment_path)
-        start_time = end_time
+    Raises:
+        RuntimeError: Si una sección no se puede descargar tras los reintentos.
+    """
+    from yt_dlp.utils import download_range_func
+
+    video_id = extract_video_id(youtube_url)
+    job_directory = _job_directory(video_id)
+    sections = plan_video_sections(duration, first_section_s, max_section_s)
+    ready = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def put(item):
+        # Con la cola llena, esperar al consumidor solo mientras siga leyendo
+        while not stop.is_set():
+            try:
+                ready.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def producer():
+        try:
+            for index, (start, end) in enumerate(sections):
+                if stop.is_set():
+                    return
+                path = os.path.join(job_directory, f"section-{index:04d}-{int(start)}-{int(end)}.mp4")
+                if not (os.path.exists(path) and os.path.getsize(path) > 0):
+                    _download_with_retries({
+                        "format": "bestvideo/best",
+                        "outtmpl": path,
+                        "quiet": True,
+                        "download_ranges": download_range_func(None, [(start, end)]),
+                    }, f"https://www.youtube.com/watch?v={video_id}")
+                if not os.path.exists(path) or os.path.getsize(path) == 0:
+                    raise RuntimeError(f"La sección {start:.0f}-{end:.0f}s está vacía.")
+                if not put({"index": index, "start": start, "end": end, "path": path, "sections": len(sections)}):
+                    return
+            put(None)
+        except Exception as e:
+            put(RuntimeError(f"Error al descargar el video por secciones: {e}"))
+
+    thread = threading.Thread(target=producer, name="crosscounter-download", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = ready.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Si el consumidor se detiene, no seguir descargando secciones
+        stop.set()
+
+
+def concat_videos(video_paths, output_path):
+    """
+    Une varios videos con los mismos parámetros de codificación sin recodificar
+    (demuxer `concat` de ffmpeg con copia de stream).
+
+    Args:
+        video_paths (list): Rutas de los videos en orden.
+        output_path (str): Ruta del video resultante.
 
+    Returns:
+        str: Ruta del video resultante.
+
+    Raises:
+        RuntimeError: Si ffmpeg no está disponible o falla.
+    """
+    if len(video_paths) == 1:
+        shutil.copyfile(video_paths[0], output_path)
+        return output_path
+    if not ffmpeg_path():
+        raise RuntimeError("Se necesita ffmpeg para unir los videos procesados.")
+
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as list_file:
+        for path in video_paths:
+            list_file.write(f"file '{os.path.abspath(path)}'\n")
+
+    try:
+        subprocess.run(
+            [ffmpeg_path(), "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+             "-i", list_file.name, "-c", "copy", "-movflags", "+faststart", output_path],
+            check=True, capture_output=True,
+        )
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise RuntimeError(f"Error al unir los videos procesados: {e}")
+    finally:
+        os.remove(list_file.name)
+    return output_path
+
+
+def _count_frames(video_path):
+    """
+    Número de frames de un video: el de la cabecera del contenedor o, si no lo indica,
+    el que resulta de recorrer los paquetes (sin decodificar).
+    """
+    cap = cv2.VideoCapture(str(video_path))
+    frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if frames <= 0:
+        frames = 0
+        while cap.grab():
+            frames += 1
     cap.release()
+    return frames
+
+
+# función para segmentar un video
+def segment_video(video_path, segment_duration=200, output_dir=None):
+    """
+    Divide un video en segmentos sin recodificarlo.
+
+    Los segmentos se cortan con el muxer `segment` de ffmpeg y copia de stream, que
+    solo puede cortar en fotogramas clave: cada segmento empieza en el primer
+    fotograma clave a partir de su tiempo objetivo y se puede decodificar por sí
+    mismo. Dividir el video cuesta solo lectura y escritura en disco.
+
+    Los límites reales de cada segmento se leen de la lista que escribe ffmpeg y su
+    número de frames de la cabecera del segmento, de modo que `frame_offset` es exacto
+    también con FPS fraccionarios (p. ej. 29.97), y los conteos y timestamps de los
+    segmentos se pueden volver a unir.
+
+    Args:
+        video_path (str): Ruta del video original.
+        segment_duration (float): Duración objetivo de cada segmento en segundos.
+        output_dir (str): Directorio de los segmentos (por defecto, uno temporal nuevo).
+
+    Returns:
+        list[dict]: Un elemento por segmento, en orden:
+            - "index" (int): Posición del segmento.
+            - "path" (str): Ruta del segmento.
+            - "start" / "end" (float): Límites en segundos en el video original.
+            - "frame_offset" (int): Índice en el video original del primer frame del segmento.
+            - "frames" (int): Número de frames del segmento.
+
+    Raises:
+        RuntimeError: Si ffmpeg no está disponible o falla.
+    """
+    if not ffmpeg_path():
+        raise RuntimeError("Se necesita ffmpeg para segmentar el video.")
+    output_dir = output_dir or tempfile.mkdtemp(prefix="crosscounter-segments-")
+    os.makedirs(output_dir, exist_ok=True)
+    list_path = os.path.join(output_dir, "segments.csv")
+
+    try:
+        subprocess.run(
+            [ffmpeg_path(), "-y", "-loglevel", "error", "-i", str(video_path),
+             "-map", "0:v:0", "-c", "copy",
+             "-f", "segment", "-segment_time", str(segment_duration), "-reset_timestamps", "1",
+             "-segment_list", list_path, "-segment_list_type", "csv",
+             os.path.join(output_dir, "segment-%04d.mp4")],
+            check=True, capture_output=True,
+        )
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise RuntimeError(f"Error al segmentar el video: {e}")
+
+    segments = []
+    frame_offset = 0
+    with open(list_path, newline="", encoding="utf-8") as list_file:
+        for index, (name, start, end) in enumerate(csv.reader(list_file)):
+            path = os.path.join(output_dir, os.path.basename(name))
+            frames = _count_frames(path)
+            segments.append({
+                "index": index,
+                "path": path,
+                "start": float(start),
+                "end": float(end),
+                "frame_offset": frame_offset,
+                "frames": frames,
+            })
+            frame_offset += frames
     return segments
 
 
@@ -193,6 +512,8 @@ def display_youtube_info(youtube_url):
     Returns:
         dict: Información estructurada del video (título, duración, autor, tamaño aproximado).
     """
+    from yt_dlp import YoutubeDL
+
     try:
         # Extraer metadatos del video
         ydl_opts = {"quiet": True, "dump_single_json": True}
@@ -244,55 +565,121 @@ def update_progress(bar, processed_frames, total_frames):
     if progress == 100:
         st.empty()
 
+# Estado del generador de IDs: último milisegundo usado y contador dentro de él
+_inference_id_lock = threading.Lock()
+_last_inference_ms = 0
+_inference_counter = 0
+
+
 # función para generar un ID de inferencia único
 def generate_inference_id():
     """
-    Genera un ID único basado en la fecha y hora actual.
+    Genera un ID único y ordenable por tiempo con el formato UUIDv7 (RFC 9562).
+
+    Los 48 bits altos son los milisegundos Unix, seguidos de un contador de 12 bits
+    que mantiene el orden de los IDs generados en el mismo milisegundo por este
+    proceso, y de 62 bits aleatorios que evitan colisiones entre procesos. A
+    diferencia de la marca de tiempo ISO usada antes, dos inferencias simultáneas
+    nunca comparten ID, y los IDs consecutivos quedan juntos en los índices.
 
     Returns:
-        str: ID único en formato ISO 8601.
+        str: ID único en formato UUID.
     """
-    return datetime.now().isoformat()
+    global _last_inference_ms, _inference_counter
+    with _inference_id_lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms <= _last_inference_ms:
+            # Mismo milisegundo (o reloj hacia atrás): se incrementa el contador
+            _inference_counter += 1
+            if _inference_counter > 0xFFF:
+                _last_inference_ms += 1
+                _inference_counter = 0
+        else:
+            _last_inference_ms = now_ms
+            # Inicio aleatorio en la mitad baja, dejando margen al contador
+            _inference_counter = secrets.randbits(11)
+        timestamp_ms, counter = _last_inference_ms, _inference_counter
+    value = (
+        (timestamp_ms & 0xFFFFFFFFFFFF) << 80
+        | 0x7 << 76  # versión 7
+        | counter << 64
+        | 0b10 << 62  # variante RFC 9562
+        | secrets.randbits(62)
+    )
+    return str(uuid.UUID(int=value))
 
-# Añade una marca de agua y un contador total de motocicletas a un video.
-def add_watermark_and_counter(video_path, total_motorcycle_count):
+def get_capture_start(video_path):
     """
-    Añade una marca de agua y un contador total de motocicletas a un video.
+    Fecha y hora de inicio de la grabación según los metadatos del contenedor
+    (`creation_time`, que escriben la mayoría de cámaras y teléfonos).
 
     Args:
         video_path (str): Ruta del video.
-        total_motorcycle_count (int): Conteo total de motocicletas detectadas.
 
     Returns:
-        str: Ruta del video procesado con la marca de agua y el contador.
+        datetime | None: Hora local sin zona horaria, o None si no está disponible.
     """
-    cap = cv2.VideoCapture(video_path)
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    fps = int(cap.get(cv2.CAP_PROP_FPS))
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    if not ffmpeg_path():
+        return None
+    try:
+        probe = subprocess.run(
+            [ffmpeg_path(), "-hide_banner", "-i", str(video_path)], capture_output=True, text=True, timeout=30
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
 
-    output_path = video_path.replace(".mp4", "_watermarked.mp4")
-    out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+    match = re.search(r"creation_time\s*:\s*(\S+)", probe.stderr)
+    if not match:
+        return None
+    try:
+        created = datetime.fromisoformat(match.group(1).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    # Los timestamps de MongoDB se guardan en hora local, como `datetime.now()`
+    return created.astimezone().replace(tzinfo=None) if created.tzinfo else created
 
-    app_name = "AI-MotorCycle CrossCounter TalentoTECH"  # Nombre de la aplicación
 
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
+def frame_timestamp(capture_start, frame_idx, fps):
+    """
+    Hora real de un frame: inicio de la grabación + frame_idx / fps.
+    """
+    return capture_start + timedelta(seconds=frame_idx / (fps if fps and fps > 0 else 30.0))
+
 
-        # Añadir título y contador total al frame
-        motos_text = f"Motos encontradas: {total_motorcycle_count}"
-        cv2.putText(frame, app_name, (10, height - 50), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-        cv2.putText(frame, motos_text, (10, height - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+# Añade una marca de agua y un contador total de motocicletas a un video.
+def add_watermark_and_counter(video_path, total_motorcycle_count):
+    """
+    Añade una marca de agua y un contador total de motocicletas a un video ya procesado.
 
-        # Escribir el frame procesado en el video de salida
-        out.write(frame)
+    No vuelve a decodificar ni codificar el video: el nombre de la aplicación y el
+    conteo total se escriben en los metadatos del contenedor (`title` y `comment`)
+    con copia de stream. La marca de agua visible y el total final ya los dibuja el
+    pipeline de inferencia en su única pasada (HUD y tarjeta de cierre, ver
+    `utils.overlay.render_title_card`).
 
-    cap.release()
-    out.release()
+    Args:
+        video_path (str): Ruta del video.
+        total_motorcycle_count (int): Conteo total de motocicletas detectadas.
+
+    Returns:
+        str: Ruta del video procesado con la marca de agua y el contador.
 
+    Raises:
+        RuntimeError: Si ffmpeg no está disponible o falla.
+    """
+    if not ffmpeg_path():
+        raise RuntimeError("Se necesita ffmpeg para añadir la marca de agua.")
+    output_path = video_path.replace(".mp4", "_watermarked.mp4")
+    try:
+        subprocess.run(
+            [ffmpeg_path(), "-y", "-loglevel", "error", "-i", str(video_path), "-map", "0", "-c", "copy",
+             "-metadata", f"title={APP_NAME}",
+             "-metadata", f"comment=Motos encontradas: {total_motorcycle_count}",
+             "-movflags", "+faststart", output_path],
+            check=True, capture_output=True,
+        )
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise RuntimeError(f"Error al añadir la marca de agua: {e}")
     return output_path
 
 # función para redimensionar un frame de forma proporcional
@@ -339,7 +726,7 @@ def get_video_duration_and_size(video_path):
     return duration_seconds, video_size_mb
 
 #   función para procesar un segmento de video
-def process_video_segment(cap, start_frame, end_frame, frame_interval, inference_id):
+def process_video_segment(cap, start_frame, end_frame, frame_interval, inference_id, output_options=None):
     """
     Procesa un segmento de video utilizando el modelo YOLO.
 
@@ -349,6 +736,7 @@ def process_video_segment(cap, start_frame, end_frame, frame_interval, inference
         end_frame (int): Frame final del segmento.
         frame_interval (int): Intervalo de frames a procesar.
         inference_id (str): ID único para la inferencia.
+        output_options (dict): Opciones del video de salida (ver `utils.video_writer.DEFAULT_OUTPUT_OPTIONS`).
 
     Returns:
         dict: Resultados del segmento procesado, incluyendo el conteo total y la ruta del video.
@@ -361,11 +749,12 @@ def process_video_segment(cap, start_frame, end_frame, frame_interval, inference
     processed_video_path = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4").name
 
     # Crear el escritor de video
-    out = cv2.VideoWriter(
+    out = create_video_writer(
         processed_video_path,
-        cv2.VideoWriter_fourcc(*'mp4v'),
         cap.get(cv2.CAP_PROP_FPS),
         (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))),
+        frame_interval,
+        **(output_options or {}),
     )
 
     # Inicializar variables para mostrar progreso
@@ -373,9 +762,13 @@ def process_video_segment(cap, start_frame, end_frame, frame_interval, inference
     total_frames_in_segment = end_frame - start_frame
     progress_bar = st.progress(0)
 
-    # Nombre de la aplicación
-    app_name = "AI-MotorCycle CrossCounter TalentoTECH"
+    # Capa con el HUD y las detecciones, compuesta sobre cada frame
+    overlay = OverlayCompositor(
+        (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))), hud_scale=0.5
+    )
+    overlay.update([], segment_motorcycle_count)
 
+    model = load_model()
     while cap.isOpened():
         frame_pos = cap.get(cv2.CAP_PROP_POS_FRAMES)
 
@@ -394,21 +787,19 @@ def process_video_segment(cap, start_frame, end_frame, frame_interval, inference
             img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
             results = model(img)
 
-            # Detecciones y anotaciones en el frame
+            # Detecciones del frame
+            detections = []
             for result in results:
                 for box in result.boxes:
                     cls = result.names[int(box.cls[0])]
                     if cls == "motorcycle":
-                        conf = box.conf[0]
                         x_min, y_min, x_max, y_max = map(int, box.xyxy[0].tolist())
-                        # Dibujar detección en el frame
-                        cv2.rectangle(frame, (x_min, y_min), (x_max, y_max), (0, 255, 0), 2)
-                        cv2.putText(frame, f"{cls} {conf:.2f}", (x_min, y_min - 10),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-                        frame_motorcycle_count += 1
+                        detections.append((cls, float(box.conf[0]), x_min, y_min, x_max, y_max))
+            frame_motorcycle_count = len(detections)
 
             # Actualizar conteo total de motocicletas en el segmento
             segment_motorcycle_count += frame_motorcycle_count
+            overlay.update(detections, segment_motorcycle_count)
 
             # Guardar resultados del frame
             frame_results.append({
@@ -416,13 +807,11 @@ def process_video_segment(cap, start_frame, end_frame, frame_interval, inference
                 "motorcycle_count": frame_motorcycle_count,
             })
 
-        # Añadir título y contador total al frame
-        motos_text = f"Motos encontradas: {segment_motorcycle_count}"
-        cv2.putText(frame, app_name, (10, frame.shape[0] - 50), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-        cv2.putText(frame, motos_text, (10, frame.shape[0] - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+        # Añadir título, contador total y últimas detecciones al frame
+        overlay.apply(frame)
 
         # Escribir el frame en el video de salida
-        out.write(frame)
+        out.write(frame, keyframe=int(frame_pos) % frame_interval == 0)
 
         # Actualizar progreso
         progress = (frame_pos - start_frame + 1) / total_frames_in_segment
@@ -452,6 +841,8 @@ def is_large_video(video_url, max_size_mb=200):
     Returns:
         bool: True si el video es grande, False en caso contrario.
     """
+    from yt_dlp import YoutubeDL
+
     ydl_opts = {"quiet": True}
     with YoutubeDL(ydl_opts) as ydl:
         info = ydl.extract_info(video_url, download=False)
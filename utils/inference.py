@@ -1,6 +1,5 @@
 from datetime import datetime
 import streamlit as st
-from ultralytics import YOLO
 from pathlib import Path
 import os
 import cv2
@@ -11,77 +10,231 @@ from utils.helpers import (
     generate_inference_id,
     resize_frame_proportionally,
     is_large_video,
+    stream_youtube_sections,
+    concat_videos,
+    get_capture_start,
+    frame_timestamp,
+    load_fast_model,
     )
 import tempfile
+import time
 import base64
-from pytube import YouTube
 
-from utils.mongodb import save_inference_result_video
+from utils import async_io
+from utils.metrics import StageTimer
+from utils.video_writer import create_video_writer
+from utils.overlay import OverlayCompositor, render_title_card
+from utils.tiling import TiledDetector
+from utils.scheduler import get_inference_model
+from utils.frame_cache import open_video
+from utils.detections_store import DetectionRecorder, detections_path
+from utils.realtime import RealtimeGovernor
+from utils.cascade import CascadeGate
+from utils.heatmap import HeatmapAccumulator
+from utils.streaming import StreamAggregator
 
 
 
-# Cargar el modelo YOLOv8
-model_path = "models/best.pt"
-try:
-    model = YOLO(model_path, verbose=False)
-except Exception as e:
-    st.error(f"Error al cargar el modelo: {e}")
-    st.stop()
-
-
-def process_image(image_path):
+def process_image(image_path, tiling_options=None):
     """
     Procesa una imagen utilizando el modelo YOLO.
 
     Args:
         image_path (str): Ruta de la imagen.
+        tiling_options (dict): Opciones de inferencia por mosaicos (ver `utils.tiling.DEFAULT_TILING_OPTIONS`).
 
     Returns:
-        dict: Resultados de detecciones en formato esperado.
+        dict: Resultados de detecciones en formato esperado y métricas por etapa.
     """
-    results = model(image_path)
+    timer = StageTimer()
+    detector = TiledDetector(**(tiling_options or {}))
+
+    with timer.stage("preprocess"):
+        image = Image.open(image_path).convert("RGB")
+
+    with timer.stage("inference"):
+        results = detector.detect(get_inference_model(str(image_path)), image)
 
     detections = []
-    for result in results:
-        for box in result.boxes:
-            cls = result.names[int(box.cls[0])]
-            conf = box.conf[0]
-            x_min, y_min, x_max, y_max = box.xyxy[0].tolist()
-            detections.append({
-                "name": cls,
-                "confidence": float(conf),
-                "xmin": float(x_min),
-                "ymin": float(y_min),
-                "xmax": float(x_max),
-                "ymax": float(y_max),
-            })
+    for cls, conf, x_min, y_min, x_max, y_max in results:
+        detections.append({
+            "name": cls,
+            "confidence": float(conf),
+            "xmin": float(x_min),
+            "ymin": float(y_min),
+            "xmax": float(x_max),
+            "ymax": float(y_max),
+        })
     
-    return {"predictions": detections}
+    return {"predictions": detections, "metrics": timer.summary(), "tiling": detector.stats}
+
+
+def extract_motorcycle_detections(detections, class_name="motorcycle"):
+    """
+    Filtra las detecciones de una clase y redondea sus coordenadas a píxeles.
+
+    Args:
+        detections (list): Tuplas (nombre, confianza, xmin, ymin, xmax, ymax) de `TiledDetector.detect`.
+        class_name (str): Clase a conservar.
+
+    Returns:
+        list: Tuplas (nombre, confianza, xmin, ymin, xmax, ymax) con coordenadas enteras.
+    """
+    return [
+        (cls, float(conf), int(x_min), int(y_min), int(x_max), int(y_max))
+        for cls, conf, x_min, y_min, x_max, y_max in detections
+        if cls == class_name
+    ]
+
+
+def create_cascade_gate(cascade_options=None):
+    """
+    Crea el filtro de la cascada de un video (desactivado si no hay opciones).
+
+    Args:
+        cascade_options (dict): Ver `utils.cascade.DEFAULT_CASCADE_OPTIONS`.
+
+    Returns:
+        CascadeGate: Filtro listo para usar.
+    """
+    options = {"gate": "off", **(cascade_options or {})}
+    fast_model = load_fast_model() if options["gate"] == "fast_model" else None
+    return CascadeGate(fast_model=fast_model, **options)
+
 
+def show_progressive_output(out, container):
+    """
+    Muestra en `container` el video anotado procesado hasta ahora (salida HLS), con un
+    enlace para descargarlo, cada vez que el escritor termina un segmento.
 
-def process_video(video_path, frame_interval=103, total_frames=None):
+    Args:
+        out (AnnotatedVideoWriter): Escritor con salida progresiva.
+        container: Contenedor de Streamlit (`st.empty()`).
+    """
+    if not out.new_segments():
+        return
+    preview = out.preview()
+    if not preview:
+        return
+    with container.container():
+        st.video(preview, format="video/mp4")
+        # Enlace y no `st.download_button`: el botón relanzaría el script e interrumpiría el procesamiento
+        st.markdown(
+            f'<a href="data:video/mp4;base64,{base64.b64encode(preview).decode()}" '
+            'download="video_procesado_parcial.mp4">Descargar lo procesado hasta ahora</a>',
+            unsafe_allow_html=True,
+        )
+
+
+def show_stream_dashboard(stream, container):
+    """
+    Muestra en `container` la tasa de motocicletas de cada ventana de `stream` y las
+    últimas alertas, sin consultar MongoDB.
+
+    Args:
+        stream (StreamAggregator): Agregador en streaming del procesamiento.
+        container: Contenedor de Streamlit (`st.empty()`).
+    """
+    snapshot = stream.snapshot()
+    with container.container():
+        for column, (name, window) in zip(st.columns(len(snapshot)), snapshot.items()):
+            closed, current = window["closed"], window["current"]
+            column.metric(
+                f"Ventana {name}",
+                f"{closed['rate_per_min']:.1f} motos/min" if closed else "—",
+                help=f"En curso: {current['total']} motos en {current['frames']} frames" if current else None,
+            )
+        for alert in list(stream.alerts)[-3:]:
+            kind = "umbral superado" if alert["kind"] == "threshold" else f"anomalía (z = {alert['value']:.1f})"
+            st.caption(
+                f"⚠️ {alert['window']} {alert['start']:%H:%M}–{alert['end']:%H:%M}: "
+                f"{alert['rate_per_min']:.1f} motos/min, {kind}"
+            )
+
+
+def process_video(video_path, frame_interval=103, total_frames=None, output_options=None, result_writer=None, tiling_options=None, use_frame_cache=False, capture_start=None, realtime_options=None, cascade_options=None, stream_options=None, detection_recorder=None, section=None, count_offset=0, title_card=True, stream_aggregator=None, heatmap_accumulator=None):
     """
     Procesa un video utilizando YOLO.
 
+    Es el único bucle de procesamiento de frames: `process_youtube_video_inference` y
+    los segmentos de `process_youtube_video` lo usan con sus opciones de sección.
+
     Args:
         video_path (str): Ruta del video.
         frame_interval (int): Procesar cada n-ésimo frame.
         total_frames (int): Total de frames en el video (para mostrar progreso).
+        output_options (dict): Opciones del video de salida (ver `utils.video_writer.DEFAULT_OUTPUT_OPTIONS`).
+        result_writer (AsyncResultWriter): Si se indica, los conteos por frame se guardan en
+            MongoDB en segundo plano durante el procesamiento (ver `utils.async_io`).
+        tiling_options (dict): Opciones de inferencia por mosaicos (ver `utils.tiling.DEFAULT_TILING_OPTIONS`).
+        use_frame_cache (bool): Leer los frames de la caché de frames decodificados (o
+            crearla en este análisis) en lugar de decodificar el video (ver `utils.frame_cache`).
+        capture_start (datetime): Inicio de la grabación; por defecto el de los metadatos del
+            video o, si no lo tiene, la hora actual. Cada frame se fecha con inicio + frame_idx / fps.
+        realtime_options (dict): Si se indica, activa el modo de tiempo real: el intervalo de
+            muestreo y el nivel de inferencia se ajustan para seguir el ritmo del video
+            (ver `utils.realtime.DEFAULT_REALTIME_OPTIONS`); `frame_interval` es el mínimo.
+        cascade_options (dict): Filtro barato previo al modelo completo (ver
+            `utils.cascade.DEFAULT_CASCADE_OPTIONS`); por defecto desactivado.
+        stream_options (dict): Umbral y detector de anomalías de las alertas en vivo (ver
+            `utils.streaming.DEFAULT_STREAMING_OPTIONS`).
+        detection_recorder (DetectionRecorder): Si se indica, las detecciones se añaden a este
+            sidecar (p. ej. el del video completo) en lugar de guardarse en uno propio.
+        section (tuple): (inicio, fin) en segundos de este archivo dentro de un video mayor
+            (fin None = hasta el final). Los índices y timestamps de sus frames parten de
+            `round(inicio * fps)`, y se descartan los frames que ffmpeg incluye fuera del
+            rango al cortar sin recodificar, para no contarlos en dos secciones.
+        count_offset (int): Motocicletas de los segmentos anteriores; se suma al contador
+            del HUD y de la tarjeta de cierre.
+        title_card (bool): Añadir la tarjeta de cierre con el conteo total (solo en el
+            último segmento de un video mayor).
+        stream_aggregator (StreamAggregator): Si se indica, los conteos se añaden a este
+            agregador (p. ej. el del video completo), que no se cierra al terminar.
+        heatmap_accumulator (HeatmapAccumulator): Si se indica, las posiciones se acumulan
+            en este mapa de calor (p. ej. el del video completo), que no se guarda al terminar.
 
     Returns:
         dict: Incluye conteo total de detecciones y conteos por frame.
     """
-    inference_id = generate_inference_id()  # Generar ID único
+    # Generar ID único (o reutilizar el del escritor asíncrono de resultados)
+    inference_id = result_writer.inference_id if result_writer is not None else generate_inference_id()
     temp_output = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
     output_path = temp_output.name
 
-    cap = cv2.VideoCapture(video_path)
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    fps = int(cap.get(cv2.CAP_PROP_FPS))
+    model = get_inference_model(inference_id)
+    detector = TiledDetector(**(tiling_options or {}))
+    gate = create_cascade_gate(cascade_options)
+    cap = open_video(video_path, use_cache=use_frame_cache)
+    total_frames = total_frames or max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), 1)
+    fps = cap.get(cv2.CAP_PROP_FPS)
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    capture_start = capture_start or get_capture_start(video_path) or datetime.now()
+    section_start, section_end = section or (0.0, None)
+    frame_offset = round(section_start * fps)
+
+    governor = None
+    if realtime_options is not None:
+        governor = RealtimeGovernor(fps, frame_interval, model, fast_model=load_fast_model(), **realtime_options)
 
-    out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+    out = create_video_writer(output_path, fps, (width, height), frame_interval, **(output_options or {}))
+    if out.fallback:
+        st.warning(out.fallback)
+
+    # Todas las detecciones en bruto, para recontar sin volver a inferir
+    recorder = detection_recorder or DetectionRecorder(
+        video=os.path.basename(str(video_path)), fps=fps, width=width, height=height, frame_interval=frame_interval
+    )
+    camera = result_writer.camera if result_writer is not None else async_io.mongodb.DEFAULT_CAMERA
+    # Posiciones de las motocicletas, acumuladas por hora en una rejilla reducida (solo se
+    # guardan si los conteos se guardan en MongoDB)
+    heatmap = heatmap_accumulator or HeatmapAccumulator(
+        camera, (width, height), result_writer.inference_id if result_writer is not None else None
+    )
+    # Tasas por ventana de tiempo y alertas en vivo (un agregador por video o transmisión)
+    stream = stream_aggregator or StreamAggregator(
+        camera, result_writer.inference_id if result_writer is not None else None, **(stream_options or {})
+    )
     total_motorcycle_count = 0
     frame_count = 0
     motorcycle_count_per_frame = []
@@ -92,252 +245,296 @@ def process_video(video_path, frame_interval=103, total_frames=None):
     # Crear barra de progreso única
     progress_bar = st.progress(0)
 
-    app_name = "AI-MotorCycle CrossCounter TalentoTECH"  # Nombre de la aplicación
+    # Video anotado reproducible durante el procesamiento (salida HLS)
+    progressive_container = st.empty() if out.progressive else None
+
+    # Panel en vivo de las ventanas y alertas, actualizado como mucho una vez por segundo
+    stream_container = st.empty()
+    stream_shown_at = 0.0
 
+    # Capa con el HUD y las detecciones, compuesta sobre cada frame
+    overlay = OverlayCompositor((width, height))
+    overlay.update([], count_offset + total_motorcycle_count)
+
+
+    timer = StageTimer()
 
     while cap.isOpened():
-        ret, frame = cap.read()
+        with timer.stage("decode"):
+            ret, frame = cap.read()
         if not ret:
             break
+        if section is not None:
+            # Frames del corte fuera de la sección (antes del inicio o desde el fin)
+            position_s = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            if position_s < 0 or (section_end is not None and position_s >= section_end - section_start):
+                continue
 
         frame_motorcycle_count = 0  # Contador de motocicletas por frame
 
-
-        if frame_count % frame_interval == 0:
-            # Convertir frame a formato PIL para la inferencia
-            img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-
-            # Realizar inferencia en el frame
-            results = model(img)
-
-            # frame_motorcycle_count = 0
-            for result in results:
-                for box in result.boxes:
-                    cls = result.names[int(box.cls[0])]
-
-                    if cls == "motorcycle":
-                        conf = box.conf[0]
-                        x_min, y_min, x_max, y_max = map(int, box.xyxy[0].tolist())
-                        # Dibujar detección en el frame
-                        cv2.rectangle(frame, (x_min, y_min), (x_max, y_max), (0, 255, 0), 2)
-                        cv2.putText(frame, f"{cls} {conf:.2f}", (x_min, y_min - 10),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-                        frame_motorcycle_count += 1
+        # En tiempo real el gobernador decide qué frames se infieren
+        infer_frame = governor.should_infer(frame_count) if governor else frame_count % frame_interval == 0
+
+        if infer_frame:
+            # Filtro barato: los frames que descarta cuentan como sin detecciones
+            with timer.stage("gate"):
+                run_model = gate.should_run(frame)
+
+            results = []
+            if run_model:
+                # Convertir frame a formato PIL para la inferencia
+                with timer.stage("preprocess"):
+                    img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+                # Realizar inferencia en el frame
+                with timer.stage("inference"):
+                    inference_start = time.perf_counter()
+                    results = detector.detect(governor.model if governor else model, img)
+                    if governor:
+                        governor.record_inference(time.perf_counter() - inference_start)
+                gate.record(results)
+            recorder.add(frame_offset + frame_count, results)
+
+            with timer.stage("annotate"):
+                detections = extract_motorcycle_detections(results)
+                frame_motorcycle_count = len(detections)
 
             # Actualizar el contador total de motocicletas
             total_motorcycle_count += frame_motorcycle_count
 
+            # Rasterizar la capa con las nuevas detecciones (se reutiliza hasta la próxima inferencia)
+            with timer.stage("annotate"):
+                overlay.update(detections, count_offset + total_motorcycle_count)
+
             # Acumular resultados por frame
-            motorcycle_count_per_frame.append({
-                "timestamp": datetime.now(),
+            frame_result = {
+                "timestamp": frame_timestamp(capture_start, frame_offset + frame_count, fps),
+                "frame_idx": frame_offset + frame_count,
                 "motorcycle_count": frame_motorcycle_count,
-            })
+            }
+            motorcycle_count_per_frame.append(frame_result)
 
-        # Añadir título y contador total al frame
-        motos_text = f"Motos encontradas: {total_motorcycle_count}"
-        cv2.putText(frame, app_name, (10, height - 50), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-        cv2.putText(frame, motos_text, (10, height - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+            with timer.stage("heatmap"):
+                heatmap.set_background(frame)
+                heatmap.add(frame_result["timestamp"], detections)
+
+            with timer.stage("stream"):
+                for alert in stream.add(frame_result):
+                    st.toast(f"Alerta en la ventana {alert['window']}: {alert['rate_per_min']:.1f} motos/min", icon="⚠️")
+            if time.monotonic() - stream_shown_at >= 1.0:
+                with timer.stage("display"):
+                    show_stream_dashboard(stream, stream_container)
+                stream_shown_at = time.monotonic()
+
+            # Guardar en segundo plano mientras continúa la inferencia
+            if result_writer is not None:
+                result_writer.add(frame_result)
+
+        # Añadir título, contador total y últimas detecciones al frame
+        with timer.stage("annotate"):
+            frame = overlay.apply(frame)
 
         # Mostrar en un cuadro de imagen pequeño el frame procesado dentro de un container de Streamlit
-        frame_small = resize_frame_proportionally(frame, scale=0.5)
+        if governor is None or governor.should_display():
+            with timer.stage("display"):
+                frame_small = resize_frame_proportionally(frame, scale=0.5)
 
-        if image_container:
-            image_container.image(frame_small, channels="BGR", caption=f"Frame {frame_count}")
+                if image_container:
+                    image_container.image(frame_small, channels="BGR", caption=f"Frame {frame_offset + frame_count}")
 
         # Escribir el frame procesado en el video de salida
-        out.write(frame)
+        with timer.stage("encode"):
+            out.write(frame, keyframe=infer_frame)
+
+        # Comprobar una vez por segundo de video si hay segmentos nuevos
+        if progressive_container is not None and frame_count % max(int(fps), 1) == 0:
+            with timer.stage("display"):
+                show_progressive_output(out, progressive_container)
 
+        if governor:
+            governor.end_frame(frame_count)
         frame_count += 1
 
         # Actualizar la barra de progreso
-        progress_bar.progress(frame_count / total_frames)
-
+        progress_bar.progress(min(frame_count / total_frames, 1.0))
+
+    # Los acumuladores compartidos (sidecar, mapa de calor, ventanas) los cierra quien los creó
+    detections_file = recorder.save(detections_path(inference_id)) if detection_recorder is None else None
+    if heatmap_accumulator is None:
+        heatmap.flush()
+    if stream_aggregator is None:
+        stream.close()
+    show_stream_dashboard(stream, stream_container)
+    frame_cache = "off" if not use_frame_cache else "hit" if getattr(cap, "cache_hit", False) else "miss"
     cap.release()
-    out.release()
+    with timer.stage("encode"):
+        # El total final va en una tarjeta de cierre, sin volver a codificar el video
+        if title_card:
+            out.write_title_card(render_title_card((width, height), count_offset + total_motorcycle_count))
+        out.release()
 
     # Leer el video procesado como binario
-    with open(output_path, "rb") as file:
-        video_data = file.read()
-        encoded_video = base64.b64encode(video_data).decode()
+    with timer.stage("base64"):
+        with open(output_path, "rb") as file:
+            video_data = file.read()
+            encoded_video = base64.b64encode(video_data).decode()
 
     return {
         "inference_id": inference_id,
+        "capture_start": capture_start,
         "processed_video_path": output_path,
         "encoded_video": encoded_video,
         "total_motos": total_motorcycle_count,
         "motorcycle_count_per_frame": motorcycle_count_per_frame,
+        "frames_processed": frame_count,
+        "output": out.stats,
+        "frame_cache": frame_cache,
+        "detections_path": detections_file,
+        "tiling": detector.stats,
+        "realtime": governor.stats if governor else None,
+        "cascade": gate.stats,
+        "heatmap": heatmap.stats,
+        "stream": stream.stats,
+        "alerts": list(stream.alerts),
+        "metrics": timer.summary(),
     }
 
 
 
-def process_youtube_video(youtube_url, frame_interval=99, max_segment_duration=200):
+def process_youtube_video(youtube_url, frame_interval=99, max_segment_duration=200, output_options=None, progress_callback=None, tiling_options=None, capture_start=None, camera=None, cascade_options=None, stream_options=None, job=None):
     """
     Procesa un video de YouTube dividiéndolo en segmentos si es necesario.
 
+    Los videos grandes se descargan por secciones en segundo plano: la inferencia
+    empieza en cuanto termina la primera sección (corta) y las siguientes se
+    descargan mientras se procesan las anteriores.
+
     Args:
         youtube_url (str): URL del video de YouTube.
         frame_interval (int): Procesar cada n-ésimo frame.
         max_segment_duration (int): Duración máxima de un segmento en segundos.
+        output_options (dict): Opciones del video de salida (ver `utils.video_writer.DEFAULT_OUTPUT_OPTIONS`).
+        progress_callback (callable): Recibe (fracción procesada 0-1, conteo parcial) tras cada segmento.
+        tiling_options (dict): Opciones de inferencia por mosaicos (ver `utils.tiling.DEFAULT_TILING_OPTIONS`).
+        capture_start (datetime): Inicio de la grabación; por defecto la hora actual.
+        camera (str): Cámara con la que se guardan los conteos en MongoDB.
+        cascade_options (dict): Filtro barato previo al modelo completo (ver
+            `utils.cascade.DEFAULT_CASCADE_OPTIONS`); por defecto desactivado.
+        stream_options (dict): Umbral y detector de anomalías de las alertas en vivo (ver
+            `utils.streaming.DEFAULT_STREAMING_OPTIONS`).
+        job (dict): Resultado de `async_io.prepare_youtube_job` si ya se obtuvo (evita
+            repetir la consulta a la API de YouTube y la estimación de tamaño).
 
     Returns:
         dict: Resultados de la inferencia.
     """
-    # Obtener información del video
-    video_info = get_youtube_video_metadata(youtube_url)
-    duration = video_info["duration"]
+    # Obtener metadatos y tamaño en paralelo (si no los obtuvo ya quien llama)
+    job = job or async_io.run(async_io.prepare_youtube_job(youtube_url))
+    duration = job["metadata"]["duration"]
   
     # Validar tamaño y decidir si segmentar
-    is_large = is_large_video(youtube_url)
+    is_large = job["is_large"]
     if not is_large and duration <= max_segment_duration:
         video_path = download_youtube_video(youtube_url)
-        return process_youtube_video_inference(video_path, frame_interval)
+        result_writer = async_io.AsyncResultWriter(
+            generate_inference_id(), camera=camera or async_io.mongodb.DEFAULT_CAMERA
+        )
+        results = process_youtube_video_inference(
+            video_path, frame_interval, output_options=output_options, result_writer=result_writer,
+            tiling_options=tiling_options, capture_start=capture_start, cascade_options=cascade_options,
+            stream_options=stream_options,
+        )
+        # Esperar a que terminen de guardarse los resultados en MongoDB
+        result_writer.close()
+        return results
 
     # Descargar y procesar por segmentos
     inference_id = generate_inference_id()
     total_motorcycle_count = 0
     motorcycle_count_per_frame = []
+    segment_outputs = []
     processed_video_path = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4").name
 
-    for start_time in range(0, int(duration), max_segment_duration):
-        end_time = min(start_time + max_segment_duration, duration)
-
-        # Descargar el segmento del video
-        segment_url = f"{youtube_url}#t={start_time},{end_time}"
-        segment_path = download_youtube_video(segment_url)
-
-        # Verificar que el segmento se descargó correctamente
-        if not os.path.exists(segment_path) or os.path.getsize(segment_path) == 0:
-            raise ValueError(f"El segmento del video no se descargó correctamente: {segment_url}")
-
-        # Procesar el segmento
-        segment_result = process_youtube_video_inference(segment_path, frame_interval)
+    # Los resultados se guardan en segundo plano mientras se procesan los segmentos
+    result_writer = async_io.AsyncResultWriter(inference_id, camera=camera or async_io.mongodb.DEFAULT_CAMERA)
+    recorder = DetectionRecorder(video=youtube_url, frame_interval=frame_interval)
+    # Las ventanas y alertas continúan de una sección a la siguiente
+    stream = StreamAggregator(result_writer.camera, inference_id, **(stream_options or {}))
+    # Un único mapa de calor por video: cada hora se guarda una vez por inferencia
+    heatmap = None
+    capture_start = capture_start or datetime.now()
+
+    for section in stream_youtube_sections(youtube_url, duration, max_section_s=max_segment_duration):
+        if heatmap is None:
+            cap = cv2.VideoCapture(section["path"])
+            frame_size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+            cap.release()
+            heatmap = HeatmapAccumulator(result_writer.camera, frame_size, inference_id)
+        # Procesar la sección mientras se descargan las siguientes
+        # La tarjeta de cierre con el total solo va al final del último segmento
+        segment_result = process_youtube_video_inference(
+            section["path"], frame_interval, output_options=output_options, result_writer=result_writer,
+            tiling_options=tiling_options, detection_recorder=recorder,
+            capture_start=capture_start, cascade_options=cascade_options,
+            section=(section["start"], section["end"] if section["index"] < section["sections"] - 1 else None),
+            count_offset=total_motorcycle_count, title_card=section["index"] == section["sections"] - 1,
+            stream_aggregator=stream, heatmap_accumulator=heatmap,
+        )
         total_motorcycle_count += segment_result["total_motos"]
         motorcycle_count_per_frame.extend(segment_result["motorcycle_count_per_frame"])
+        segment_outputs.append(segment_result["processed_video_path"])
+
+        # Liberar el disco de la sección ya procesada
+        os.remove(section["path"])
 
-        # Combinar el video procesado
-        with open(segment_result["processed_video_path"], "rb") as segment_file:
-            with open(processed_video_path, "ab") as final_video:
-                final_video.write(segment_file.read())
+        if progress_callback is not None:
+            progress_callback(min(section["end"] / duration, 1.0), total_motorcycle_count)
 
-        # Limpiar recursos temporales
-        os.remove(segment_path)
-        os.remove(segment_result["processed_video_path"])
+    # Combinar los videos procesados sin recodificar
+    concat_videos(segment_outputs, processed_video_path)
+    for segment_output in segment_outputs:
+        os.remove(segment_output)
 
-    # Guardar resultados en MongoDB
-    save_inference_result_video(inference_id, motorcycle_count_per_frame)
+    detections_file = recorder.save(detections_path(inference_id))
+    if heatmap is not None:
+        heatmap.flush()
+    stream.close()
+
+    # Esperar a que terminen de guardarse los resultados en MongoDB
+    result_writer.close()
 
     return {
         "inference_id": inference_id,
+        "capture_start": capture_start,
         "total_motos": total_motorcycle_count,
+        "motorcycle_count_per_frame": motorcycle_count_per_frame,
         "processed_video_path": processed_video_path,
+        "detections_path": detections_file,
+        "stream": stream.stats,
+        "alerts": list(stream.alerts),
     }
 
 
-def process_youtube_video_inference(video_path, frame_interval=33, total_frames=None):
+def process_youtube_video_inference(video_path, frame_interval=33, total_frames=None, output_options=None, result_writer=None, tiling_options=None, use_frame_cache=False, detection_recorder=None, capture_start=None, section=None, cascade_options=None, count_offset=0, title_card=True, stream_aggregator=None, stream_options=None, heatmap_accumulator=None, realtime_options=None):
     """
     Procesa un video de YouTube y realiza la inferencia de motocicletas.
 
+    Usa el mismo bucle que `process_video` (ver sus argumentos), con el intervalo de
+    frames por defecto de los videos de YouTube.
+
     Args:
         video_path (str): Ruta del video.
         frame_interval (int): Intervalo de frames a procesar.
-        total_frames (int): Total de frames en el video (para mostrar progreso).
+        Los demás argumentos son los de `process_video`.
 
     Returns:
         dict: Resultados de la inferencia.
     """
-    inference_id = generate_inference_id()  # Generar ID único
-    temp_output = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
-    output_path = temp_output.name
-
-    cap = cv2.VideoCapture(video_path)
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    fps = int(cap.get(cv2.CAP_PROP_FPS))
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-
-    out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
-    total_motorcycle_count = 0
-    frame_count = 0
-    motorcycle_count_per_frame = []
-
-    # Crear un contenedor vacío para mostrar los frames procesados
-    image_container = st.empty()
-
-    # Crear barra de progreso única
-    progress_bar = st.progress(0)
-
-    app_name = "AI-MotorCycle CrossCounter TalentoTECH"  # Nombre de la aplicación
-
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        frame_motorcycle_count = 0  # Contador de motocicletas por frame
-
-        if frame_count % frame_interval == 0:
-            # Convertir frame a formato PIL para la inferencia
-            img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-
-            # Realizar inferencia en el frame
-            results = model(img)
-
-            for result in results:
-                for box in result.boxes:
-                    cls = result.names[int(box.cls[0])]
-
-                    if cls == "motorcycle":
-                        conf = box.conf[0]
-                        x_min, y_min, x_max, y_max = map(int, box.xyxy[0].tolist())
-                        # Dibujar detección en el frame
-                        cv2.rectangle(frame, (x_min, y_min), (x_max, y_max), (0, 255, 0), 2)
-                        cv2.putText(frame, f"{cls} {conf:.2f}", (x_min, y_min - 10),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-                        frame_motorcycle_count += 1
-
-            # Actualizar el contador total de motocicletas
-            total_motorcycle_count += frame_motorcycle_count
-
-            # Acumular resultados por frame
-            motorcycle_count_per_frame.append({
-                "timestamp": datetime.now(),
-                "motorcycle_count": frame_motorcycle_count,
-            })
-
-        # Añadir título y contador total al frame
-        motos_text = f"Motos encontradas: {total_motorcycle_count}"
-        cv2.putText(frame, app_name, (10, height - 50), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-        cv2.putText(frame, motos_text, (10, height - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-
-        # Mostrar en un cuadro de imagen pequeño el frame procesado dentro de un container de Streamlit
-        frame_small = resize_frame_proportionally(frame, scale=0.5)
-
-        # Mostrar el frame procesado en el contenedor de imagen
-        if image_container:
-            image_container.image(frame, channels="BGR", use_container_width=True)
-
-        # Escribir el frame procesado en el video de salida
-        out.write(frame)
-
-
-        frame_count += 1
-
-        # Actualizar la barra de progreso
-        progress_value = min(frame_count / total_frames, 1.0)
-        progress_bar.progress(progress_value)
-
-    cap.release()
-    out.release()
-
-    # Leer el video procesado como binario
-    with open(output_path, "rb") as file:
-        video_data = file.read()
-        encoded_video = base64.b64encode(video_data).decode()
-
-    return {
-        "inference_id": inference_id,
-        "total_motos": total_motorcycle_count,
-        "motorcycle_count_per_frame": motorcycle_count_per_frame,
-        "processed_video_path": output_path
-    }
-
+    return process_video(
+        video_path, frame_interval, total_frames=total_frames, output_options=output_options,
+        result_writer=result_writer, tiling_options=tiling_options, use_frame_cache=use_frame_cache,
+        capture_start=capture_start, realtime_options=realtime_options, cascade_options=cascade_options,
+        stream_options=stream_options, detection_recorder=detection_recorder, section=section,
+        count_offset=count_offset, title_card=title_card, stream_aggregator=stream_aggregator,
+        heatmap_accumulator=heatmap_accumulator,
+    )
@@ -0,0 +1,69 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """
+    Acumula el tiempo invertido en cada etapa de un pipeline de inferencia
+    (decodificación, inferencia, anotación, escritura, etc.).
+
+    Uso:
+        timer = StageTimer()
+        with timer.stage("inference"):
+            results = model(img)
+        timer.summary()
+    """
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.started_at = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Mide el tiempo de un bloque y lo suma a la etapa indicada.
+
+        Args:
+            name (str): Nombre de la etapa.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.totals[name] += time.perf_counter() - start
+            self.counts[name] += 1
+
+    def add(self, name, seconds, count=1):
+        """
+        Suma un tiempo medido externamente a la etapa indicada.
+
+        Args:
+            name (str): Nombre de la etapa.
+            seconds (float): Tiempo en segundos.
+            count (int): Número de ejecuciones que representa el tiempo.
+        """
+        self.totals[name] += seconds
+        self.counts[name] += count
+
+    def summary(self):
+        """
+        Resume los tiempos acumulados.
+
+        Returns:
+            dict: Por etapa, tiempo total (s), número de ejecuciones y media (ms),
+                más el tiempo total transcurrido desde la creación del medidor.
+        """
+        stages = {
+            name: {
+                "total_s": round(total, 6),
+                "count": self.counts[name],
+                "mean_ms": round(total / self.counts[name] * 1000, 3) if self.counts[name] else 0.0,
+            }
+            for name, total in self.totals.items()
+        }
+        return {
+            "wall_s": round(time.perf_counter() - self.started_at, 6),
+            "stages": stages,
+        }
@@ -0,0 +1,187 @@
+"""
+Pool de instancias del modelo para sesiones de Streamlit concurrentes.
+
+Streamlit atiende cada sesión en su propio hilo, y un único objeto YOLO compartido
+no es seguro entre hilos: el predictor de Ultralytics guarda estado mutable (lote
+actual, preprocesado, resultados) entre llamadas. El pool crea instancias
+independientes del modelo bajo demanda, hasta `CROSSCOUNTER_MODEL_POOL_SIZE` y sin
+superar `CROSSCOUNTER_MODEL_POOL_MEMORY_MB`. Cada llamada al modelo toma una instancia
+libre en exclusiva; si todas están ocupadas, espera a que se libere una.
+
+La memoria de una instancia se mide (RSS) al cargar la primera, de modo que el tope
+de memoria se traduce en un número de instancias.
+
+Con CROSSCOUNTER_INFERENCE_WORKERS > 0 el modelo principal se ejecuta en los
+procesos del planificador (`utils.scheduler`) y no pasa por este pool.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Instancias del modelo por proceso como máximo
+MODEL_POOL_SIZE = int(os.environ.get("CROSSCOUNTER_MODEL_POOL_SIZE", "2"))
+# Memoria máxima del conjunto de instancias en MB (0 = sin tope)
+MODEL_POOL_MEMORY_MB = float(os.environ.get("CROSSCOUNTER_MODEL_POOL_MEMORY_MB", "0"))
+
+
+def _rss_mb():
+    """
+    Memoria residente actual del proceso en MB (None si no se puede medir).
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            resident_pages = int(statm.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+class ModelPool:
+    """
+    Conjunto de instancias de un modelo que se prestan en exclusiva.
+
+    Uso:
+        pool = ModelPool(lambda: YOLO(model_path, verbose=False))
+        with pool.checkout() as model:
+            results = model(images)
+
+    Args:
+        loader (callable): Crea una instancia nueva del modelo.
+        max_instances (int): Instancias como máximo.
+        memory_cap_mb (float): Memoria máxima de todas las instancias (0 = sin tope).
+    """
+
+    def __init__(self, loader, max_instances=MODEL_POOL_SIZE, memory_cap_mb=MODEL_POOL_MEMORY_MB):
+        self.loader = loader
+        self.max_instances = max(int(max_instances), 1)
+        self.memory_cap_mb = memory_cap_mb
+        self.instance_mb = None
+        self.instances = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_s = 0.0
+        self._idle = []
+        self._loading = 0
+        self._condition = threading.Condition()
+
+    @property
+    def capacity(self):
+        """
+        Instancias permitidas: `max_instances` limitado por el tope de memoria.
+        """
+        if not self.memory_cap_mb or not self.instance_mb:
+            return self.max_instances
+        return max(min(self.max_instances, int(self.memory_cap_mb // self.instance_mb)), 1)
+
+    def _can_create(self):
+        if self.instances >= self.capacity:
+            return False
+        # Con tope de memoria, la primera instancia se mide antes de crear otras
+        return not (self.memory_cap_mb and self.instance_mb is None and self._loading)
+
+    def acquire(self, timeout=None):
+        """
+        Toma una instancia libre, creándola si hay capacidad o esperando si no.
+
+        Args:
+            timeout (float): Segundos de espera como máximo (None = sin límite).
+
+        Returns:
+            Instancia del modelo; debe devolverse con `release`.
+
+        Raises:
+            TimeoutError: Si no se libera ninguna instancia a tiempo.
+        """
+        start = time.perf_counter()
+        deadline = None if timeout is None else start + timeout
+        waited = False
+        with self._condition:
+            while not self._idle and not self._can_create():
+                waited = True
+                remaining = None if deadline is None else deadline - time.perf_counter()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("No hay instancias del modelo libres.")
+                self._condition.wait(remaining)
+
+            self.checkouts += 1
+            if waited:
+                self.waits += 1
+                self.wait_s += time.perf_counter() - start
+            if self._idle:
+                return self._idle.pop()
+            # Reservar la plaza antes de cargar fuera del candado
+            self.instances += 1
+            self._loading += 1
+
+        rss_before = _rss_mb()
+        try:
+            instance = self.loader()
+        except Exception:
+            with self._condition:
+                self.instances -= 1
+                self._loading -= 1
+                self._condition.notify()
+            raise
+        rss_after = _rss_mb()
+
+        with self._condition:
+            self._loading -= 1
+            if self.instance_mb is None and rss_before is not None and rss_after is not None:
+                self.instance_mb = max(rss_after - rss_before, 1.0)
+            self._condition.notify_all()
+        return instance
+
+    def release(self, instance):
+        """
+        Devuelve una instancia al pool.
+        """
+        with self._condition:
+            self._idle.append(instance)
+            self._condition.notify()
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        """
+        Presta una instancia durante el bloque `with`.
+        """
+        instance = self.acquire(timeout)
+        try:
+            yield instance
+        finally:
+            self.release(instance)
+
+    @property
+    def stats(self):
+        """
+        Instancias creadas y libres, capacidad, memoria por instancia y esperas.
+        """
+        with self._condition:
+            return {
+                "instances": self.instances,
+                "idle": len(self._idle),
+                "capacity": self.capacity,
+                "instance_mb": round(self.instance_mb, 1) if self.instance_mb else None,
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "mean_wait_ms": round(self.wait_s / self.waits * 1000, 3) if self.waits else 0.0,
+            }
+
+
+class PooledModel:
+    """
+    Sustituto del modelo YOLO que ejecuta cada llamada con una instancia del pool.
+
+    Se llama igual que el modelo (`model(imagen)`, `model([imágenes], imgsz=320)`), de
+    modo que varias sesiones pueden compartirlo sin compartir el estado del predictor.
+
+    Args:
+        pool (ModelPool): Pool de instancias.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def __call__(self, *args, **kwargs):
+        with self.pool.checkout() as model:
+            return model(*args, **kwargs)
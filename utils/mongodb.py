@@ -1,22 +1,423 @@
+import os
 import streamlit as st
 import pandas as pd
 import streamlit as st
 from uuid import uuid4
-from pymongo import MongoClient
-from datetime import datetime, timezone
+from pymongo import MongoClient, ReplaceOne, UpdateOne
+from pymongo.errors import CollectionInvalid, OperationFailure
+from datetime import datetime, timezone, timedelta
+import threading
+
+from utils.spool import SPOOL_PATH, CircuitBreaker, ResultSpool, SpoolDrainer
 
 # Obtener la URI de MongoDB desde los secretos de Streamlit Cloud
-MONGO_URI = st.secrets["MONGO"]["MONGO_URI"]
+# (la variable de entorno MONGO_URI tiene prioridad, p. ej. en benchmarks locales)
+MONGO_URI = os.environ.get("MONGO_URI") or st.secrets["MONGO"]["MONGO_URI"]
+
+DATABASE_NAME = "motorcycle_detection"  # Nombre de la base de datos
+LEGACY_COLLECTION_NAME = "detections"   # Colección original (documentos sin cámara)
+COLLECTION_NAME = "detections_ts"       # Colección de series temporales
+SOURCES_COLLECTION_NAME = "sources"     # Registro de cámaras (sitio y ubicación)
+WINDOW_STATS_COLLECTION_NAME = "window_stats"  # Ventanas cerradas de `utils.streaming`
+
+# Cámara asignada a los resultados que no indican una
+DEFAULT_CAMERA = "default"
+
+# Colección de series temporales: MongoDB agrupa internamente los documentos de una
+# misma cámara por intervalos de tiempo, lo que reduce el almacenamiento y acelera
+# los $group por hora o día.
+TIMESERIES_OPTIONS = {"timeField": "timestamp", "metaField": "camera", "granularity": "seconds"}
+
+# Límites explícitos del cliente: sin ellos un Atlas lento bloquea cada operación
+# durante los 30 s por defecto de selección de servidor. Las opciones que ya vienen
+# en la URI tienen prioridad.
+CLIENT_OPTIONS = {
+    "maxPoolSize": int(os.environ.get("CROSSCOUNTER_MONGO_POOL_SIZE", "20")),
+    "serverSelectionTimeoutMS": int(os.environ.get("CROSSCOUNTER_MONGO_TIMEOUT_MS", "5000")),
+    "connectTimeoutMS": int(os.environ.get("CROSSCOUNTER_MONGO_TIMEOUT_MS", "5000")),
+    "socketTimeoutMS": 30000,
+    "waitQueueTimeoutMS": 10000,
+}
+CLIENT_OPTIONS = {key: value for key, value in CLIENT_OPTIONS.items() if key.lower() not in MONGO_URI.lower()}
+
+# Cortacircuitos compartido por las escrituras del spool y las consultas
+breaker = CircuitBreaker()
 
 # Crear una instancia del cliente de MongoDB
 try:
-    client = MongoClient(MONGO_URI)
-    db = client["motorcycle_detection"]  # Nombre de la base de datos
-    collection = db["detections"]        # Nombre de la colección
+    client = MongoClient(MONGO_URI, **CLIENT_OPTIONS)
+    db = client[DATABASE_NAME]
+    collection = db[COLLECTION_NAME]
+    default_collection = collection  # Referencia a la colección real (los benchmarks pueden sustituir `collection`)
+    sources = db[SOURCES_COLLECTION_NAME]
+    window_stats = db[WINDOW_STATS_COLLECTION_NAME]
     # st.write("Conexión a MongoDB establecida correctamente.")
 except Exception as e:
     st.error(f"Error al conectar con MongoDB: {e}")
 
+_collection_ready = False
+# True si la colección es de series temporales (sin índices únicos ni upserts)
+_is_timeseries = False
+
+
+def ensure_timeseries_collection():
+    """
+    Crea la colección de series temporales si no existe (una vez por proceso).
+
+    Si el servidor no admite colecciones de series temporales (MongoDB < 5.0), se usa
+    una colección normal. En ambos casos se crea el índice compuesto (camera, timestamp)
+    con el que las consultas por cámara y rango de fechas solo leen los datos de las
+    cámaras seleccionadas, y el índice de `detection_id` (clave de idempotencia, ver
+    `detection_key`), único cuando la colección no es de series temporales.
+    """
+    global _collection_ready, _is_timeseries
+    if _collection_ready or collection is not default_collection:
+        return
+    try:
+        db.create_collection(COLLECTION_NAME, timeseries=TIMESERIES_OPTIONS)
+    except (CollectionInvalid, OperationFailure):
+        pass  # Ya existe o el servidor no admite series temporales
+    info = next(iter(db.list_collections(filter={"name": COLLECTION_NAME})), {})
+    _is_timeseries = info.get("type") == "timeseries"
+    collection.create_index([("camera", 1), ("timestamp", 1)])
+    # Orden de llegada, para la sincronización incremental de `utils.analytics`
+    collection.create_index("ingested_at")
+    if _is_timeseries:
+        collection.create_index("detection_id")
+    else:
+        try:
+            collection.create_index("detection_id", unique=True)
+        except OperationFailure:
+            # Ya existe un índice no único o hay duplicados antiguos: se mantiene el existente
+            collection.create_index("detection_id")
+    sources.create_index("site")
+    window_stats.create_index([("window", 1), ("start", 1), ("camera", 1)])
+    _collection_ready = True
+
+
+def detection_key(inference_id, frame_idx=0):
+    """
+    Clave determinista de un resultado: una por (inferencia, frame).
+
+    Se guarda en `detection_id`. Como no depende de cuándo ni cuántas veces se guarde
+    el resultado, un reintento o un segundo guardado de la misma inferencia produce la
+    misma clave y no duplica el documento.
+
+    Args:
+        inference_id (str): Identificador de la inferencia (ver `generate_inference_id`).
+        frame_idx (int): Índice del frame en el video (0 para imágenes).
+
+    Returns:
+        str: Clave `"{inference_id}:{frame_idx}"`.
+    """
+    return f"{inference_id}:{frame_idx}"
+
+
+def register_source(camera, site=None, name=None, latitude=None, longitude=None):
+    """
+    Registra (o actualiza) una cámara con su sitio y ubicación.
+
+    Los documentos de detección solo guardan el identificador de la cámara (campo meta
+    de la serie temporal); el sitio y la ubicación se resuelven con este registro.
+
+    Args:
+        camera (str): Identificador de la cámara.
+        site (str): Sitio o intersección al que pertenece.
+        name (str): Nombre descriptivo.
+        latitude (float): Latitud en grados.
+        longitude (float): Longitud en grados.
+    """
+    fields = {"site": site, "name": name or camera}
+    if latitude is not None and longitude is not None:
+        fields["location"] = {"type": "Point", "coordinates": [float(longitude), float(latitude)]}
+    sources.update_one({"_id": camera}, {"$set": fields}, upsert=True)
+
+
+def list_sources(sites=None):
+    """
+    Cámaras conocidas: las registradas y las que tienen detecciones.
+
+    Args:
+        sites (list[str]): Si se indica, solo las cámaras registradas en esos sitios.
+
+    Returns:
+        list[dict]: {"camera", "site", "name", "location"} por cámara, ordenadas por identificador.
+    """
+    if not breaker.allow():
+        return []
+    query = {"site": {"$in": list(sites)}} if sites else {}
+    try:
+        registered = {document["_id"]: document for document in sources.find(query)}
+        cameras = set(registered)
+        if not sites:
+            # Usa el índice (camera, timestamp): no recorre la colección
+            cameras.update(camera for camera in collection.distinct("camera") if camera is not None)
+    except Exception:
+        breaker.record_failure()
+        return []
+    return [
+        {
+            "camera": camera,
+            "site": registered.get(camera, {}).get("site"),
+            "name": registered.get(camera, {}).get("name", camera),
+            "location": registered.get(camera, {}).get("location"),
+        }
+        for camera in sorted(cameras)
+    ]
+
+
+def resolve_cameras(cameras=None, sites=None):
+    """
+    Cámaras a consultar a partir de una selección de cámaras y/o sitios.
+
+    Returns:
+        list[str] | None: Identificadores de cámara, o None si no hay selección (todas).
+    """
+    if not cameras and not sites:
+        return None
+    selected = set(cameras or [])
+    if sites:
+        selected.update(source["camera"] for source in list_sources(sites))
+    return sorted(selected)
+
+
+def migrate_legacy_detections(batch_size=1000):
+    """
+    Copia los documentos de la colección original a la de series temporales, con la
+    cámara por defecto. Los documentos ya copiados (mismo detection_id) se omiten.
+
+    Args:
+        batch_size (int): Documentos por inserción.
+
+    Returns:
+        int: Documentos copiados.
+    """
+    ensure_timeseries_collection()
+    copied = set(collection.distinct("detection_id"))
+    batch = []
+    total = 0
+    for document in db[LEGACY_COLLECTION_NAME].find({}, {"_id": 0}).batch_size(batch_size):
+        if document.get("detection_id") in copied or not isinstance(document.get("timestamp"), datetime):
+            continue
+        document.setdefault("camera", DEFAULT_CAMERA)
+        document["ingested_at"] = datetime.now()
+        batch.append(document)
+        if len(batch) >= batch_size:
+            collection.insert_many(batch, ordered=False)
+            total += len(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        total += len(batch)
+    return total
+
+
+_drainer = None
+_drainer_lock = threading.Lock()
+
+# Candados por inferencia (repartidos en franjas fijas): en una colección de series
+# temporales la comprobación de claves y la inserción de un lote deben ser atómicas
+# frente a otros hilos que escriben la misma inferencia (spool, escrituras directas)
+_write_locks = [threading.Lock() for _ in range(64)]
+
+
+def _lock_inferences(documents):
+    """
+    Candados (en orden fijo, para no bloquearse entre sí) de las inferencias de los documentos.
+    """
+    stripes = sorted({hash(document.get("inference_id")) % len(_write_locks) for document in documents})
+    return [_write_locks[stripe] for stripe in stripes]
+
+
+def write_documents(documents, target=None):
+    """
+    Escribe documentos en MongoDB de forma idempotente, por su `detection_id`.
+
+    En una colección normal se envía un único `bulk_write` de upserts con
+    `$setOnInsert`: el índice único garantiza que cada clave se guarda una sola vez,
+    aunque escriban varios procesos a la vez.
+
+    Cada documento se guarda con `ingested_at`, la hora en que se envía a MongoDB (no
+    la de captura, que puede ser muy anterior), para que la réplica analítica lo
+    recoja por orden de llegada (ver `utils.analytics.sync_mirror`).
+
+    Las colecciones de series temporales no admiten índices únicos ni upserts; en
+    ellas se omiten las claves que ya están guardadas (una consulta por lote sobre el
+    índice de `detection_id`) y después se insertan las demás. Dentro de un proceso la
+    consulta y la inserción se serializan por `inference_id`, así que los reintentos y
+    los escritores concurrentes del mismo proceso no duplican documentos. Entre
+    procesos no hay esa garantía: si dos procesos escriben a la vez la misma
+    inferencia (p. ej. vaciando el mismo archivo de spool) un documento puede quedar
+    duplicado; cada proceso debe usar su propio `CROSSCOUNTER_SPOOL_PATH`.
+
+    Args:
+        documents (list[dict]): Documentos con `detection_id`.
+        target: Colección alternativa (por defecto la de detecciones); se trata como
+            una colección normal.
+
+    Returns:
+        int: Documentos enviados a MongoDB.
+    """
+    if not documents:
+        return 0
+    ingested_at = datetime.now()
+    documents = [{**document, "ingested_at": ingested_at} for document in documents]
+    if target is None:
+        ensure_timeseries_collection()
+        if _is_timeseries:
+            locks = _lock_inferences(documents)
+            for lock in locks:
+                lock.acquire()
+            try:
+                keys = [document["detection_id"] for document in documents]
+                existing = set(collection.distinct("detection_id", {"detection_id": {"$in": keys}}))
+                documents = [document for document in documents if document["detection_id"] not in existing]
+                if documents:
+                    collection.insert_many(documents, ordered=False)
+            finally:
+                for lock in reversed(locks):
+                    lock.release()
+            return len(documents)
+        target = collection
+    target.bulk_write(
+        [
+            UpdateOne({"detection_id": document["detection_id"]}, {"$setOnInsert": document}, upsert=True)
+            for document in documents
+        ],
+        ordered=False,
+    )
+    return len(documents)
+
+
+def get_spool_drainer():
+    """
+    Devuelve el hilo de vaciado del spool del proceso, creándolo la primera vez.
+    """
+    global _drainer
+    with _drainer_lock:
+        if _drainer is None:
+            _drainer = SpoolDrainer(
+                ResultSpool(os.environ.get("CROSSCOUNTER_SPOOL_PATH", SPOOL_PATH)), write_documents, breaker
+            )
+    return _drainer
+
+
+def spool_documents(documents):
+    """
+    Guarda documentos en el spool local; se escriben en MongoDB en segundo plano.
+
+    Args:
+        documents (list[dict]): Documentos con `detection_id`.
+
+    Returns:
+        int: Documentos guardados en el spool.
+    """
+    if not documents:
+        return 0
+    drainer = get_spool_drainer()
+    count = drainer.spool.append(documents)
+    drainer.wake()
+    return count
+
+
+def flush_spool(timeout=None):
+    """
+    Espera a que todos los documentos del spool estén escritos en MongoDB.
+
+    Returns:
+        bool: True si el spool quedó vacío antes de `timeout`.
+    """
+    return get_spool_drainer().flush(timeout)
+
+
+def save_window_results(results):
+    """
+    Guarda ventanas agregadas en streaming (`utils.streaming`) con un único `bulk_write`.
+
+    Cada ventana se identifica por cámara, nombre, inicio e inferencia: reescribir la
+    de una misma inferencia (p. ej. al reintentar) reemplaza su documento, y las de
+    trabajos que se solapan se guardan por separado (ver `get_window_stats`).
+
+    Args:
+        results (list[dict]): Ventanas con camera, inference_id, window, start, end y totales.
+
+    Returns:
+        int: Ventanas escritas.
+
+    Raises:
+        ConnectionError: Si el cortacircuitos está abierto (las ventanas se reintentan).
+    """
+    if not results:
+        return 0
+    if not breaker.allow():
+        raise ConnectionError("MongoDB no está disponible.")
+    try:
+        window_stats.bulk_write(
+            [
+                ReplaceOne(
+                    {"_id": f"{result['camera']}:{result['window']}:{result['start']:%Y%m%dT%H%M%S}:{result['inference_id']}"},
+                    result,
+                    upsert=True,
+                )
+                for result in results
+            ],
+            ordered=False,
+        )
+    except Exception:
+        breaker.record_failure()
+        raise
+    breaker.record_success()
+    return len(results)
+
+
+def get_window_stats(window, start, end, cameras=None):
+    """
+    Ventanas guardadas por `save_window_results` en un periodo, sumando las de todas
+    las inferencias que cubren la misma cámara e inicio.
+
+    Args:
+        window (str): Nombre de la ventana (ver `utils.streaming.DEFAULT_WINDOWS`).
+        start (datetime): Inicio del periodo (incluido).
+        end (datetime): Fin del periodo (excluido).
+        cameras (list[str]): Cámaras a incluir (None = todas).
+
+    Returns:
+        pd.DataFrame: Columnas camera, start, end, total, frames, max_per_frame,
+        rate_per_min, partial e inferences, ordenadas por cámara e inicio.
+    """
+    match = {"window": window, "start": {"$gte": start, "$lt": end}}
+    if cameras is not None:
+        match["camera"] = {"$in": list(cameras)}
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {"camera": "$camera", "start": "$start"},
+            "end": {"$max": "$end"},
+            "total": {"$sum": "$total"},
+            "frames": {"$sum": "$frames"},
+            "max_per_frame": {"$max": "$max_per_frame"},
+            "rate_per_min": {"$sum": "$rate_per_min"},
+            "partial": {"$max": "$partial"},
+            "inferences": {"$sum": 1},
+        }},
+        {"$sort": {"_id.camera": 1, "_id.start": 1}},
+    ]
+    if not breaker.allow():
+        return pd.DataFrame()
+    try:
+        rows = list(window_stats.aggregate(pipeline))
+    except Exception as e:
+        breaker.record_failure()
+        st.error(f"Error al obtener las ventanas: {e}")
+        return pd.DataFrame()
+    if not rows:
+        return pd.DataFrame()
+    for row in rows:
+        row.update(row.pop("_id"))
+    columns = ["camera", "start", "end", "total", "frames", "max_per_frame", "rate_per_min", "partial", "inferences"]
+    return pd.DataFrame(rows)[columns]
+
+
 # Función para guardar los resultados de una inferencia de imagen en MongoDB
 def save_inference_result_image(data):
     """
@@ -26,13 +427,15 @@ def save_inference_result_image(data):
         data (dict): Contiene los datos de la inferencia.
             - type: Tipo de inferencia ('image')
             - inference_id: Identificador único
-            - detection_id: ID único de la detección
+            - detection_id: Clave de idempotencia (ver `detection_key`)
             - motorcycle_count: Conteo de motocicletas detectadas
             - timestamp: Fecha y hora de la inferencia
             - time: Tiempo de procesamiento de la inferencia
+            - camera: Cámara de origen (opcional, por defecto `DEFAULT_CAMERA`)
     """
     # Generar el campo 'time' si no está presente
     data["time"] = datetime.now(timezone.utc)
+    data.setdefault("camera", DEFAULT_CAMERA)
 
 
     # Añadir validación de campos necesarios
@@ -42,113 +445,169 @@ def save_inference_result_image(data):
             st.error(f"Falta el campo obligatorio: {field}")
             return
 
-    # Insertar en MongoDB
-    collection.insert_one(data)
+    # Guardar en el spool local; se escribe en MongoDB en segundo plano
+    spool_documents([data])
     # st.success(f"Resultado de inferencia guardado en MongoDB con ID {data.get('inference_id')}")
 
 
 # Función para guardar los resultados de una inferencia de un video en MongoDB
-def save_inference_result_video(inference_id, motorcycle_count_per_frame):
+def save_inference_result_video(inference_id, motorcycle_count_per_frame, camera=DEFAULT_CAMERA):
     """
     Guarda los resultados de inferencia de un video en MongoDB.
 
     Args:
         inference_id (str): Identificador único de la inferencia.
         motorcycle_count_per_frame (list[dict]): Lista de conteos por frame. Cada elemento debe incluir:
-            - "timestamp" (datetime): Fecha y hora del frame procesado.
+            - "timestamp" (datetime): Fecha y hora real del frame (inicio de la grabación + frame_idx / fps).
+            - "frame_idx" (int): Índice del frame en el video.
             - "motorcycle_count" (int): Conteo de motocicletas detectadas en ese frame.
             - "time" (float): Tiempo de procesamiento del frame.
+        camera (str): Cámara de origen.
+    """
+    # Se guardan en el spool local y se escriben en MongoDB por lotes en segundo plano
+    spool_documents(build_video_documents(inference_id, motorcycle_count_per_frame, camera))
+    # st.success(f"Resultados de inferencia guardados en MongoDB para inference_id {inference_id}")
+
+
+def build_video_documents(inference_id, motorcycle_count_per_frame, camera=DEFAULT_CAMERA):
+    """
+    Construye los documentos de MongoDB de los resultados por frame de un video.
+
+    Args:
+        inference_id (str): Identificador único de la inferencia.
+        motorcycle_count_per_frame (list[dict]): Lista de conteos por frame.
+        camera (str): Cámara de origen (campo meta de la serie temporal).
+
+    Returns:
+        list[dict]: Documentos listos para insertar.
     """
-    for frame_result in motorcycle_count_per_frame:
-        document = {
+    return [
+        {
             "type": "video",
             "inference_id": inference_id,
-            "detection_id": str(uuid4()),  # Generar un ID único para la detección
+            # Clave determinista por frame; sin índice de frame se genera una aleatoria
+            "detection_id": (
+                detection_key(inference_id, frame_result["frame_idx"])
+                if frame_result.get("frame_idx") is not None else str(uuid4())
+            ),
+            "camera": camera,
             "timestamp": frame_result["timestamp"],
+            "frame_idx": frame_result.get("frame_idx"),
             "motorcycle_count": frame_result["motorcycle_count"],
             "time": frame_result.get("time", None)  # Añadir el campo "time" si está disponible
         }
-        collection.insert_one(document)
-    # st.success(f"Resultados de inferencia guardados en MongoDB para inference_id {inference_id}")
+        for frame_result in motorcycle_count_per_frame
+    ]
+
+
+def time_range(filters):
+    """
+    Rango [inicio, fin) de fechas que cubren los filtros ({'year', 'month', 'day'}).
+
+    Returns:
+        tuple | None: (inicio, fin), o None si no hay filtro de año.
+    """
+    if not filters or "year" not in filters:
+        return None
+    year = int(filters["year"])
+    if "month" not in filters:
+        return datetime(year, 1, 1), datetime(year + 1, 1, 1)
+    month = int(filters["month"])
+    if "day" not in filters:
+        end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+        return datetime(year, month, 1), end
+    start = datetime(year, month, int(filters["day"]))
+    return start, start + timedelta(days=1)
+
+
+def _match_stage(filters=None, cameras=None):
+    """
+    Etapa $match por cámaras y rango de fechas: con el índice (camera, timestamp) el
+    coste de la consulta depende de las cámaras y el periodo seleccionados, no del
+    tamaño de la colección.
+    """
+    match = {}
+    if cameras is not None:
+        match["camera"] = {"$in": list(cameras)}
+    period = time_range(filters)
+    if period:
+        match["timestamp"] = {"$gte": period[0], "$lt": period[1]}
+    return {"$match": match}
 
 
 # Función para obtener las estadísticas de detección
-def get_inference_statistics(level, filters=None):
+def get_inference_statistics(level, filters=None, cameras=None, by_camera=False):
     """
     Obtiene estadísticas de detección agrupadas dinámicamente según el nivel seleccionado.
 
     Args:
         level (str): Nivel de análisis ('day', 'month', 'year').
         filters (dict): Filtros adicionales según el nivel ({'year': 2024, 'month': 11, 'day': 4}).
+        cameras (list[str]): Cámaras a incluir (None = todas; ver `resolve_cameras`).
+        by_camera (bool): Si es True, una fila por cámara y periodo (columna `camera`)
+            para comparar cámaras.
 
     Returns:
         pd.DataFrame: DataFrame procesado con las estadísticas.
     """
-    # Configuración de agrupación por nivel
-    group_stage = {
+    # Campos de agrupación por nivel
+    group_fields = {
         "day": {
-            "$group": {
-                "_id": {
-                    "year": {"$year": "$timestamp"},
-                    "month": {"$month": "$timestamp"},
-                    "day": {"$dayOfMonth": "$timestamp"},
-                    "hour": {"$hour": "$timestamp"}
-                },
-                "total_motos": {"$sum": "$motorcycle_count"}
-            }
+            "year": {"$year": "$timestamp"},
+            "month": {"$month": "$timestamp"},
+            "day": {"$dayOfMonth": "$timestamp"},
+            "hour": {"$hour": "$timestamp"}
         },
         "month": {
-            "$group": {
-                "_id": {
-                    "year": {"$year": "$timestamp"},
-                    "month": {"$month": "$timestamp"},
-                    "day": {"$dayOfMonth": "$timestamp"}
-                },
-                "total_motos": {"$sum": "$motorcycle_count"}
-            }
+            "year": {"$year": "$timestamp"},
+            "month": {"$month": "$timestamp"},
+            "day": {"$dayOfMonth": "$timestamp"}
         },
         "year": {
-            "$group": {
-                "_id": {
-                    "year": {"$year": "$timestamp"},
-                    "month": {"$month": "$timestamp"}
-                },
-                "total_motos": {"$sum": "$motorcycle_count"}
-            }
+            "year": {"$year": "$timestamp"},
+            "month": {"$month": "$timestamp"}
         },
     }
 
-    pipeline = [group_stage[level]]
+    group_id = dict(group_fields[level])
+    if by_camera:
+        group_id["camera"] = "$camera"
+    pipeline = [
+        _match_stage(filters, cameras),
+        {"$group": {"_id": group_id, "total_motos": {"$sum": "$motorcycle_count"}}},
+    ]
 
-    # Ejecutar consulta inicial
+    # Ejecutar consulta (sin esperar al timeout si MongoDB ya está marcado como caído)
+    if not breaker.allow():
+        st.warning("MongoDB no está disponible; los resultados nuevos se guardan localmente.")
+        return pd.DataFrame()
     try:
         raw_results = list(collection.aggregate(pipeline))
         # st.write("Resultados iniciales:", raw_results)
     except Exception as e:
+        breaker.record_failure()
         st.error(f"Error en la consulta inicial: {e}")
         return pd.DataFrame()
 
-    # Convertir resultados en DataFrame
-    data = pd.DataFrame(raw_results)
+    if not raw_results:
+        return pd.DataFrame()
 
-    if "_id" in data.columns:
-        # Descomponer la columna `_id` para facilitar filtros
-        data = pd.concat([data.drop(["_id"], axis=1), pd.json_normalize(data["_id"])], axis=1)
+    # Convertir resultados en DataFrame y descomponer la columna `_id`
+    data = pd.DataFrame(raw_results)
+    data = pd.concat([data.drop(["_id"], axis=1), pd.json_normalize(data["_id"])], axis=1)
 
-    # Aplicar filtros en pandas
-    if filters:
-        for key, value in filters.items():
-            if key in data:
-                data = data[data[key] == value]
+    # Reorganizar el DataFrame (etiquetas con operaciones de columna, sin recorrer filas)
+    def two_digits(column):
+        return data[column].astype(int).astype(str).str.zfill(2)
 
-    # Reorganizar el DataFrame
     if level == "day":
-        data["_id"] = data.apply(lambda x: f"{x['hour']:02}:00", axis=1)
+        data["_id"] = two_digits("hour") + ":00"
     elif level == "month":
-        data["_id"] = data.apply(lambda x: f"{x['day']:02}/{x['month']:02}", axis=1)
+        data["_id"] = two_digits("day") + "/" + two_digits("month")
     elif level == "year":
-        data["_id"] = data.apply(lambda x: f"{x['month']:02}/{x['year']}", axis=1)
+        data["_id"] = two_digits("month") + "/" + data["year"].astype(int).astype(str)
 
+    data = data.sort_values(list(group_fields[level]))
     data = data.rename(columns={"total_motos": "Cantidad de Motocicletas"})
     data = data.set_index("_id")
 
@@ -156,6 +615,47 @@ def get_inference_statistics(level, filters=None):
     # st.write("DataFrame procesado:", data)
 
     return data
+
+
+def get_source_totals(filters=None, cameras=None):
+    """
+    Totales por cámara en el periodo seleccionado, con su sitio.
+
+    Args:
+        filters (dict): Periodo ({'year', 'month', 'day'}).
+        cameras (list[str]): Cámaras a incluir (None = todas).
+
+    Returns:
+        pd.DataFrame: Columnas camera, site, Cantidad de Motocicletas, frames y
+        max_por_frame, ordenadas por total descendente.
+    """
+    pipeline = [
+        _match_stage(filters, cameras),
+        {"$group": {
+            "_id": "$camera",
+            "total_motos": {"$sum": "$motorcycle_count"},
+            # Los agregados de `utils.retention` representan varios frames
+            "frames": {"$sum": {"$ifNull": ["$frames", 1]}},
+            "max_por_frame": {"$max": {"$ifNull": ["$max_per_frame", "$motorcycle_count"]}},
+        }},
+        {"$sort": {"total_motos": -1}},
+    ]
+    if not breaker.allow():
+        return pd.DataFrame()
+    try:
+        rows = list(collection.aggregate(pipeline))
+    except Exception as e:
+        breaker.record_failure()
+        st.error(f"Error al obtener los totales por cámara: {e}")
+        return pd.DataFrame()
+    if not rows:
+        return pd.DataFrame()
+
+    registered = sources.find({"_id": {"$in": [row["_id"] for row in rows]}})
+    sites = {document["_id"]: document.get("site") for document in registered}
+    data = pd.DataFrame(rows).rename(columns={"_id": "camera", "total_motos": "Cantidad de Motocicletas"})
+    data.insert(1, "site", data["camera"].map(sites))
+    return data
             
 
 def inspect_mongodb_data(limit=10):
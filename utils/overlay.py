@@ -0,0 +1,171 @@
+import cv2
+import numpy as np
+
+APP_NAME = "AI-MotorCycle CrossCounter TalentoTECH"  # Nombre de la aplicación
+
+# Margen (px) alrededor de cada elemento dibujado para cubrir el grosor del trazo
+STROKE_MARGIN = 4
+
+
+class OverlayCompositor:
+    """
+    Compone el HUD (nombre de la aplicación y contador) y las últimas detecciones
+    sobre cada frame del video.
+
+    La capa (color + alfa) se rasteriza una sola vez cuando cambian las detecciones
+    o el contador. En cada frame solo se mezcla la capa dentro de los rectángulos
+    que contienen dibujo: los píxeles opacos con una copia enmascarada por
+    rectángulo (`cv2.copyTo`) y los semitransparentes (bordes del texto, dibujado
+    con antialiasing) con una única mezcla alfa vectorizada. Así las cajas
+    permanecen visibles hasta la siguiente inferencia y no se repite
+    `cv2.putText` en cada frame.
+
+    Args:
+        frame_size (tuple): (ancho, alto) de los frames.
+        hud_scale (float): Escala de la fuente del HUD.
+        color (tuple): Color BGR del dibujo.
+        app_name (str): Texto de la marca de agua.
+    """
+
+    def __init__(self, frame_size, hud_scale=0.7, color=(0, 255, 0), app_name=APP_NAME):
+        self.width, self.height = frame_size
+        self.hud_scale = hud_scale
+        self.color = color
+        self.app_name = app_name
+        self.renders = 0
+        self._key = None
+        self._color_layer = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        self._alpha = np.zeros((self.height, self.width), dtype=np.uint8)
+        self._regions = []
+        self._partial_indices = np.empty(0, dtype=np.intp)
+        self._partial_premultiplied = np.empty((0, 3), dtype=np.uint16)
+        self._partial_inverse_alpha = np.empty((0, 1), dtype=np.uint16)
+
+    def _draw_text(self, text, origin, scale):
+        # Con antialiasing sobre fondo negro el color queda premultiplicado por la cobertura
+        cv2.putText(self._color_layer, text, origin, cv2.FONT_HERSHEY_SIMPLEX, scale, self.color, 2, cv2.LINE_AA)
+        cv2.putText(self._alpha, text, origin, cv2.FONT_HERSHEY_SIMPLEX, scale, 255, 2, cv2.LINE_AA)
+        (text_width, text_height), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, 2)
+        x, y = origin
+        self._add_region(x, y - text_height, x + text_width, y + baseline)
+
+    def _draw_box(self, x_min, y_min, x_max, y_max):
+        cv2.rectangle(self._color_layer, (x_min, y_min), (x_max, y_max), self.color, 2)
+        cv2.rectangle(self._alpha, (x_min, y_min), (x_max, y_max), 255, 2)
+        self._add_region(x_min, y_min, x_max, y_max)
+
+    def _add_region(self, x_min, y_min, x_max, y_max):
+        x0 = max(x_min - STROKE_MARGIN, 0)
+        y0 = max(y_min - STROKE_MARGIN, 0)
+        x1 = min(x_max + STROKE_MARGIN, self.width)
+        y1 = min(y_max + STROKE_MARGIN, self.height)
+        if x0 < x1 and y0 < y1:
+            self._regions.append((slice(y0, y1), slice(x0, x1)))
+
+    def update(self, detections, total_count, hud_text=None):
+        """
+        Vuelve a rasterizar la capa si cambiaron las detecciones o el contador.
+
+        Args:
+            detections (list): Tuplas (nombre, confianza, xmin, ymin, xmax, ymax).
+            total_count (int): Conteo total de motocicletas mostrado en el HUD.
+            hud_text (str): Texto del contador; por defecto "Motos encontradas: N".
+
+        Returns:
+            bool: True si la capa se volvió a rasterizar.
+        """
+        hud_text = hud_text or f"Motos encontradas: {total_count}"
+        key = (tuple(detections), hud_text)
+        if key == self._key:
+            return False
+        self._key = key
+
+        self._color_layer[:] = 0
+        self._alpha[:] = 0
+        self._regions = []
+
+        for name, confidence, x_min, y_min, x_max, y_max in detections:
+            self._draw_box(x_min, y_min, x_max, y_max)
+            self._draw_text(f"{name} {confidence:.2f}", (x_min, y_min - 10), 0.5)
+
+        self._draw_text(self.app_name, (10, self.height - 50), self.hud_scale)
+        self._draw_text(hud_text, (10, self.height - 20), self.hud_scale)
+
+        # Máscara de píxeles opacos por rectángulo
+        opaque = (self._alpha == 255).astype(np.uint8)
+        self._regions = [(region, self._color_layer[region], opaque[region]) for region in self._regions]
+
+        # Píxeles semitransparentes: el color ya está premultiplicado por la cobertura
+        alpha = self._alpha.reshape(-1)
+        self._partial_indices = np.flatnonzero((alpha > 0) & (alpha < 255))
+        self._partial_premultiplied = self._color_layer.reshape(-1, 3)[self._partial_indices].astype(np.uint16) * 255
+        self._partial_inverse_alpha = 255 - alpha[self._partial_indices, None].astype(np.uint16)
+
+        self.renders += 1
+        return True
+
+    def apply(self, frame):
+        """
+        Mezcla la capa sobre el frame (in situ).
+
+        Args:
+            frame (numpy.ndarray): Frame BGR del mismo tamaño que la capa. Si es de solo
+                lectura (p. ej. una vista de `utils.frame_cache`) o no es contiguo en
+                memoria se anota una copia.
+
+        Returns:
+            numpy.ndarray: El frame anotado.
+        """
+        if not frame.flags.writeable:
+            frame = frame.copy()
+        elif not frame.flags.c_contiguous:
+            # La mezcla de los píxeles semitransparentes indexa el frame como un vector
+            frame = np.ascontiguousarray(frame)
+
+        for region, color_layer, opaque in self._regions:
+            cv2.copyTo(color_layer, opaque, frame[region])
+
+        if self._partial_indices.size:
+            pixels = frame.reshape(-1, 3)
+            pixels[self._partial_indices] = (
+                pixels[self._partial_indices] * self._partial_inverse_alpha + self._partial_premultiplied
+            ) // 255
+        return frame
+
+
+def render_title_card(frame_size, total_count, app_name=APP_NAME, color=(0, 255, 0)):
+    """
+    Tarjeta de cierre del video anotado: nombre de la aplicación y conteo total.
+
+    Se rasteriza una sola vez y el escritor la repite durante unos segundos al final
+    del video (ver `AnnotatedVideoWriter.write_title_card`), en lugar de volver a
+    codificar todo el video para estampar el total en cada frame.
+
+    Args:
+        frame_size (tuple): (ancho, alto) de los frames.
+        total_count (int): Conteo total de motocicletas.
+        app_name (str): Texto de la marca de agua.
+        color (tuple): Color BGR del texto.
+
+    Returns:
+        numpy.ndarray: Frame BGR de la tarjeta.
+    """
+    width, height = frame_size
+    card = np.zeros((height, width, 3), dtype=np.uint8)
+    lines = [(app_name, 1.0), (f"Motos encontradas: {total_count}", 1.4)]
+
+    # Escala común para que la línea más ancha ocupe como máximo el 90 % del ancho
+    widest = max(cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, 2)[0][0] for text, scale in lines)
+    fit = min(width * 0.9 / widest, height / 240, 2.0)
+
+    y = height // 2 - int(30 * fit)
+    for text, scale in lines:
+        scale *= fit
+        thickness = max(int(round(2 * fit)), 1)
+        (text_width, text_height), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, thickness)
+        cv2.putText(
+            card, text, ((width - text_width) // 2, y + text_height // 2),
+            cv2.FONT_HERSHEY_SIMPLEX, scale, color, thickness, cv2.LINE_AA,
+        )
+        y += int(70 * fit)
+    return card
@@ -0,0 +1,211 @@
+"""
+Gobernador de tiempo real: mantiene el procesamiento de un video al ritmo de la fuente.
+
+Si la inferencia tarda más que el presupuesto de tiempo por frame, el bucle de
+`process_video` se va retrasando y la latencia crece sin límite. El gobernador mide
+el coste de cada frame (decodificación, anotación, escritura) y la latencia de la
+inferencia, y decide sobre la marcha:
+
+1. El intervalo de muestreo: cuántos frames separan dos inferencias.
+2. El nivel de calidad de la inferencia cuando ni el intervalo máximo alcanza:
+   menor resolución de entrada (`imgsz`) y, si está configurado, el modelo ligero
+   (`CROSSCOUNTER_FAST_MODEL_PATH`).
+
+Cuando vuelve a sobrar tiempo recupera primero el nivel de calidad y después el
+intervalo original. La vista previa en Streamlit se limita a `display_fps`.
+
+Las decisiones y el compromiso resultante entre cobertura y velocidad se resumen en
+`stats` (frames inferidos y omitidos, nivel usado, FPS alcanzados, retraso máximo).
+"""
+import time
+
+# Resoluciones de entrada del modelo, de mayor a menor calidad
+REALTIME_RESOLUTIONS = (640, 480, 320)
+
+DEFAULT_REALTIME_OPTIONS = {
+    # FPS a sostener (None = los del video)
+    "target_fps": None,
+    # Intervalo de muestreo máximo antes de bajar la calidad de la inferencia
+    "max_interval": 300,
+    # Margen del presupuesto que se reserva para imprevistos
+    "headroom": 0.15,
+    # Peso de la última medida en las medias móviles exponenciales
+    "smoothing": 0.3,
+    # Inferencias mínimas entre dos cambios de nivel (evita oscilaciones)
+    "cooldown": 5,
+    # Frames por segundo (de reloj) de la vista previa en Streamlit
+    "display_fps": 5,
+}
+
+
+class RealtimeGovernor:
+    """
+    Ajusta el intervalo de muestreo y el nivel de inferencia para sostener unos FPS.
+
+    Uso:
+        governor = RealtimeGovernor(fps, frame_interval, model, fast_model=load_fast_model())
+        for frame_idx, frame in frames:
+            if governor.should_infer(frame_idx):
+                results = detector.detect(governor.model, img)
+                governor.record_inference(latency)
+            governor.end_frame(frame_idx)
+
+    Args:
+        fps (float): FPS del video.
+        frame_interval (int): Intervalo de muestreo deseado (el mínimo que se usa).
+        model: Modelo principal.
+        fast_model: Modelo ligero opcional (último recurso).
+        **options: Sobrescriben `DEFAULT_REALTIME_OPTIONS`.
+    """
+
+    def __init__(self, fps, frame_interval, model, fast_model=None, **options):
+        self.options = {**DEFAULT_REALTIME_OPTIONS, **{k: v for k, v in options.items() if v is not None}}
+        self.target_fps = float(self.options["target_fps"] or fps or 30)
+        self.base_interval = max(int(frame_interval), 1)
+        self.interval = self.base_interval
+
+        # Niveles de calidad: el modelo principal a cada resolución y después el ligero
+        self.levels = [("full", model, size) for size in REALTIME_RESOLUTIONS]
+        if fast_model is not None:
+            self.levels += [("fast", fast_model, size) for size in REALTIME_RESOLUTIONS]
+        self.level = 0
+
+        self._latency = {}  # nivel -> latencia media de inferencia (s)
+        self._frame_cost = None  # coste medio de un frame sin inferencia (s)
+        self._next_inference = 0
+        self._last_change = 0
+        self._last_display = 0.0
+        self._frame_started = None
+        self._inference_s = 0.0
+        self.started_at = None
+        self.frames = 0
+        self.frames_inferred = 0
+        self.inferences_per_level = {}
+        self.max_lag_s = 0.0
+        self.interval_sum = 0
+
+    @property
+    def model(self):
+        """
+        Modelo a usar en la inferencia actual (con la resolución del nivel).
+        """
+        name, model, size = self.levels[self.level]
+        if size == REALTIME_RESOLUTIONS[0]:
+            return model
+        return lambda images: model(images, imgsz=size, verbose=False)
+
+    @property
+    def level_name(self):
+        name, _, size = self.levels[self.level]
+        return f"{name}@{size}"
+
+    def should_infer(self, frame_idx):
+        """
+        Indica si se infiere este frame; marca el inicio de la medida del frame.
+        """
+        now = time.perf_counter()
+        if self.started_at is None:
+            self.started_at = now
+        self._frame_started = now
+        self._inference_s = 0.0
+        return frame_idx >= self._next_inference
+
+    def should_display(self):
+        """
+        Indica si se actualiza la vista previa (como máximo `display_fps` por segundo).
+        """
+        now = time.perf_counter()
+        if now - self._last_display < 1 / self.options["display_fps"]:
+            return False
+        self._last_display = now
+        return True
+
+    def record_inference(self, latency_s):
+        """
+        Registra la latencia de la inferencia del frame actual.
+        """
+        self._inference_s = latency_s
+        self._latency[self.level] = self._smooth(self._latency.get(self.level), latency_s)
+        self.frames_inferred += 1
+        self.interval_sum += self.interval
+        self.inferences_per_level[self.level_name] = self.inferences_per_level.get(self.level_name, 0) + 1
+
+    def end_frame(self, frame_idx):
+        """
+        Cierra la medida del frame y, si se infirió, decide el intervalo y el nivel siguientes.
+        """
+        now = time.perf_counter()
+        self.frames += 1
+        cost = now - self._frame_started - self._inference_s
+        self._frame_cost = self._smooth(self._frame_cost, cost)
+
+        # Retraso respecto al reloj de la fuente
+        lag = (now - self.started_at) - (frame_idx + 1) / self.target_fps
+        self.max_lag_s = max(self.max_lag_s, lag)
+
+        if frame_idx >= self._next_inference:
+            self._adapt(lag)
+            self._next_inference = frame_idx + self.interval
+
+    def _smooth(self, average, value):
+        if average is None:
+            return value
+        return average + self.options["smoothing"] * (value - average)
+
+    def _required_interval(self, level, lag):
+        """
+        Intervalo mínimo para que el coste por frame quepa en el presupuesto, o None si
+        ni sin inferencia cabe. Con retraso acumulado se pide además recuperarlo en
+        el próximo segundo de video.
+        """
+        latency = self._latency.get(level)
+        if latency is None:
+            return self.interval  # Nivel aún sin medir: se mantiene el intervalo actual
+        budget = (1 - self.options["headroom"]) / self.target_fps
+        spare = budget - self._frame_cost - max(lag, 0.0) / self.target_fps
+        if spare <= 0:
+            return None
+        return max(int(latency / spare) + 1, self.base_interval)
+
+    def _adapt(self, lag):
+        required = self._required_interval(self.level, lag)
+        can_change = self.frames_inferred - self._last_change >= self.options["cooldown"]
+
+        if (required is None or required > self.options["max_interval"]) and can_change:
+            # Ni el intervalo máximo alcanza: bajar la calidad de la inferencia
+            if self.level + 1 < len(self.levels):
+                self.level += 1
+                self._last_change = self.frames_inferred
+                required = self._required_interval(self.level, lag)
+        elif self.level > 0 and can_change:
+            # Recuperar calidad si el nivel anterior cabe holgadamente
+            better = self._required_interval(self.level - 1, lag)
+            if better is not None and better <= self.options["max_interval"] // 2:
+                self.level -= 1
+                self._last_change = self.frames_inferred
+                required = better
+
+        self.interval = min(required or self.options["max_interval"], self.options["max_interval"])
+
+    @property
+    def stats(self):
+        """
+        Resumen del compromiso entre cobertura y velocidad del procesamiento.
+        """
+        elapsed = time.perf_counter() - self.started_at if self.started_at else 0.0
+        baseline = -(-self.frames // self.base_interval)  # inferencias con el intervalo deseado
+        achieved_fps = self.frames / elapsed if elapsed else 0.0
+        return {
+            "target_fps": round(self.target_fps, 3),
+            "achieved_fps": round(achieved_fps, 3),
+            "realtime": achieved_fps >= self.target_fps,
+            "max_lag_s": round(self.max_lag_s, 3),
+            "frame_interval": self.base_interval,
+            "mean_interval": round(self.interval_sum / self.frames_inferred, 2) if self.frames_inferred else 0,
+            "frames_inferred": self.frames_inferred,
+            "inferences_skipped": max(baseline - self.frames_inferred, 0),
+            # Fracción de las inferencias deseadas que se hicieron (medida de la pérdida de precisión)
+            "coverage": round(min(self.frames_inferred / baseline, 1.0), 3) if baseline else 1.0,
+            "inferences_per_level": self.inferences_per_level,
+            "final_level": self.level_name,
+        }
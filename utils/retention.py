@@ -0,0 +1,411 @@
+"""
+Retención de las detecciones por frame: compactación en agregados por hora.
+
+La colección de detecciones guarda un documento por frame muestreado y crece sin
+límite. La compactación sustituye los documentos con más de `older_than` de
+antigüedad por un documento por cámara y hora (`type: "hourly"`) con el total de
+motocicletas, los frames y el máximo por frame. Las estadísticas suman
+`motorcycle_count`, de modo que los totales por hora, día, mes y año no cambian.
+
+Los documentos originales se archivan antes de borrarlos en archivos locales
+comprimidos (NDJSON con gzip, JSON extendido de BSON; se leen con
+`bson.json_util.loads` línea a línea), uno por lote, o se borran sin archivar.
+
+Cada lote se registra en un diario (`pending/`) antes de archivarlo y aplicarlo, con
+la ruta de su archivo: el archivo se escribe de forma atómica y solo si aún no
+existe, los agregados se guardan con su valor final (no incrementos) y los originales
+se borran por `_id`, así que si el proceso se interrumpe, la siguiente ejecución
+vuelve a aplicar el lote sin contar ni archivar nada dos veces. Los documentos que llegan tarde a una hora ya compactada se
+suman a su agregado en la siguiente ejecución.
+
+- Simulación (`dry_run`): informe por cámara de lo que se compactaría, sin escribir.
+- Ritmo limitado (`max_docs_per_s`) y pausa creciente si las escrituras se vuelven
+  lentas, para no competir con las escrituras en vivo.
+- Verificación: totales por cámara y día antes y después de compactar.
+
+La réplica analítica (`utils.analytics`) conserva los documentos originales que ya
+había sincronizado; tras una reconstrucción completa solo ve los agregados, con los
+mismos totales pero sin percentiles por frame en las horas compactadas. En colecciones
+de series temporales, borrar por `_id` requiere MongoDB 7.0 o superior. No deben
+ejecutarse dos compactaciones a la vez.
+
+Uso desde la línea de comandos:
+    python -m utils.retention --older-than-days 90 --dry-run
+    python -m utils.retention --older-than-days 90 --mode archive
+"""
+import argparse
+import glob
+import gzip
+import os
+import time
+from datetime import datetime, timedelta
+
+import bson
+from bson import json_util
+from pymongo import ReplaceOne
+
+from utils import mongodb
+
+RETENTION_DAYS = int(os.environ.get("CROSSCOUNTER_RETENTION_DAYS", "90"))
+ARCHIVE_DIR = os.environ.get("CROSSCOUNTER_ARCHIVE_DIR", "archive")
+
+# archive: guardar los originales en archivos comprimidos; delete: solo borrarlos
+RETENTION_MODES = ("archive", "delete")
+
+# Tipo de los documentos agregados por cámara y hora
+HOURLY_TYPE = "hourly"
+
+COMPACTION_BATCH_SIZE = 5000
+# Documentos originales por segundo como máximo
+MAX_DOCS_PER_S = 2000
+# Un lote más lento que esto duplica la pausa entre lotes
+SLOW_BATCH_S = 2.0
+MAX_PAUSE_S = 30.0
+
+
+def hourly_key(camera, hour):
+    """
+    Clave (`detection_id`) del agregado de una cámara y hora.
+    """
+    return f"{HOURLY_TYPE}:{camera}:{hour:%Y-%m-%dT%H}"
+
+
+def _pending_dir():
+    return os.path.join(ARCHIVE_DIR, "pending")
+
+
+def _raw_query(cutoff, start=None):
+    """
+    Documentos por frame anteriores a `cutoff` (los agregados no se vuelven a compactar).
+    """
+    query = {"timestamp": {"$lt": cutoff}, "type": {"$ne": HOURLY_TYPE}}
+    if start is not None:
+        query["timestamp"]["$gte"] = start
+    return query
+
+
+def _cutoff(older_than):
+    """
+    Límite de la compactación, redondeado a la hora: solo se compactan horas completas.
+    """
+    return (datetime.now() - older_than).replace(minute=0, second=0, microsecond=0)
+
+
+def daily_totals(cutoff, start=None):
+    """
+    Motocicletas y frames por cámara y día anteriores a `cutoff`, contando los frames
+    que representa cada agregado.
+
+    Returns:
+        dict: {(camera, año, mes, día): (total_motos, frames)}.
+    """
+    query = {"timestamp": {"$lt": cutoff}}
+    if start is not None:
+        query["timestamp"]["$gte"] = start
+    pipeline = [
+        {"$match": query},
+        {"$group": {
+            "_id": {
+                "camera": "$camera",
+                "year": {"$year": "$timestamp"},
+                "month": {"$month": "$timestamp"},
+                "day": {"$dayOfMonth": "$timestamp"},
+            },
+            "total_motos": {"$sum": "$motorcycle_count"},
+            "frames": {"$sum": {"$ifNull": ["$frames", 1]}},
+        }},
+    ]
+    return {
+        (row["_id"]["camera"], row["_id"]["year"], row["_id"]["month"], row["_id"]["day"]):
+            (row["total_motos"], row["frames"])
+        for row in mongodb.collection.aggregate(pipeline, allowDiskUse=True)
+    }
+
+
+def dry_run(older_than=timedelta(days=RETENTION_DAYS), start=None):
+    """
+    Informe de lo que haría la compactación, sin escribir nada.
+
+    Args:
+        older_than (timedelta): Antigüedad mínima de los documentos a compactar.
+        start (datetime): Compactar solo desde esta fecha (None = desde el principio).
+
+    Returns:
+        dict: Límite, documentos, agregados resultantes, reducción y detalle por cámara.
+    """
+    cutoff = _cutoff(older_than)
+    pipeline = [
+        {"$match": _raw_query(cutoff, start)},
+        {"$group": {
+            "_id": {
+                "camera": "$camera",
+                "year": {"$year": "$timestamp"},
+                "month": {"$month": "$timestamp"},
+                "day": {"$dayOfMonth": "$timestamp"},
+                "hour": {"$hour": "$timestamp"},
+            },
+            "documents": {"$sum": 1},
+            "total_motos": {"$sum": "$motorcycle_count"},
+            "oldest": {"$min": "$timestamp"},
+            "newest": {"$max": "$timestamp"},
+        }},
+    ]
+    cameras = {}
+    for row in mongodb.collection.aggregate(pipeline, allowDiskUse=True):
+        camera = cameras.setdefault(row["_id"]["camera"], {
+            "camera": row["_id"]["camera"], "documents": 0, "hours": 0, "total_motos": 0,
+            "oldest": row["oldest"], "newest": row["newest"],
+        })
+        camera["documents"] += row["documents"]
+        camera["hours"] += 1
+        camera["total_motos"] += row["total_motos"]
+        camera["oldest"] = min(camera["oldest"], row["oldest"])
+        camera["newest"] = max(camera["newest"], row["newest"])
+
+    documents = sum(camera["documents"] for camera in cameras.values())
+    aggregates = sum(camera["hours"] for camera in cameras.values())
+    return {
+        "cutoff": cutoff,
+        "documents": documents,
+        "aggregates": aggregates,
+        "reduction": round(1 - aggregates / documents, 4) if documents else 0.0,
+        "cameras": [cameras[camera] for camera in sorted(cameras, key=str)],
+    }
+
+
+def _fold(documents, existing):
+    """
+    Agregados por cámara y hora de un lote, sumados a los agregados ya guardados.
+
+    Returns:
+        list[dict]: Documentos agregados con su valor final.
+    """
+    aggregates = {}
+    for document in existing:
+        aggregates[document["detection_id"]] = {k: v for k, v in document.items() if k != "_id"}
+    for document in documents:
+        camera = document.get("camera")
+        hour = document["timestamp"].replace(minute=0, second=0, microsecond=0)
+        key = hourly_key(camera, hour)
+        count = document.get("motorcycle_count") or 0
+        aggregate = aggregates.setdefault(key, {
+            "type": HOURLY_TYPE,
+            "inference_id": None,
+            "detection_id": key,
+            "camera": camera,
+            "timestamp": hour,
+            "motorcycle_count": 0,
+            "frames": 0,
+            "max_per_frame": 0,
+        })
+        aggregate["motorcycle_count"] += count
+        aggregate["frames"] += 1
+        aggregate["max_per_frame"] = max(aggregate["max_per_frame"], count)
+    return list(aggregates.values())
+
+
+def _archive_path(documents, batch_id, directory):
+    first = documents[0]
+    return os.path.join(directory, f"{first.get('camera')}-{first['timestamp']:%Y%m%dT%H}-{batch_id}.ndjson.gz")
+
+
+def _archive(documents, path):
+    """
+    Escribe los documentos originales en un archivo NDJSON comprimido. El archivo
+    aparece completo o no aparece (se escribe aparte y se renombra).
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lines = "".join(json_util.dumps(d, json_options=json_util.RELAXED_JSON_OPTIONS) + "\n" for d in documents)
+    with open(path + ".tmp", "wb") as file:
+        with gzip.GzipFile(fileobj=file, mode="wb") as compressed:
+            compressed.write(lines.encode("utf-8"))
+        # El archivo debe estar en disco antes de borrar los originales
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def _apply(manifest):
+    """
+    Aplica un lote del diario: guarda los agregados con su valor final y borra los
+    originales. Repetirlo no cambia el resultado.
+    """
+    aggregates, ids = manifest["aggregates"], manifest["delete_ids"]
+    mongodb.ensure_timeseries_collection()
+    if aggregates:
+        if mongodb._is_timeseries:
+            # Sin upserts en series temporales: se reemplaza borrando e insertando
+            mongodb.collection.delete_many({"detection_id": {"$in": [a["detection_id"] for a in aggregates]}})
+            mongodb.collection.insert_many([dict(aggregate) for aggregate in aggregates], ordered=False)
+        else:
+            mongodb.collection.bulk_write(
+                [ReplaceOne({"detection_id": a["detection_id"]}, dict(a), upsert=True) for a in aggregates],
+                ordered=False,
+            )
+    if ids:
+        mongodb.collection.delete_many({"_id": {"$in": ids}})
+
+
+def _commit(manifest, documents=None):
+    """
+    Archiva los originales del lote si su archivo aún no existe (leyéndolos de MongoDB
+    si no se indican) y aplica el lote.
+    """
+    path = manifest.get("archive")
+    if path and not os.path.exists(path):
+        if documents is None:
+            documents = list(
+                mongodb.collection.find({"_id": {"$in": manifest["delete_ids"]}})
+                .sort([("camera", 1), ("timestamp", 1)])
+            )
+        if documents:
+            _archive(documents, path)
+    _apply(manifest)
+
+
+def _journal(manifest, batch_id):
+    os.makedirs(_pending_dir(), exist_ok=True)
+    path = os.path.join(_pending_dir(), f"{batch_id}.bson")
+    with open(path + ".tmp", "wb") as file:
+        file.write(bson.encode(manifest))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def resume_pending():
+    """
+    Vuelve a archivar (si falta su archivo) y aplicar los lotes del diario que quedaron a medias.
+
+    Returns:
+        int: Lotes aplicados.
+    """
+    paths = sorted(glob.glob(os.path.join(_pending_dir(), "*.bson")))
+    for path in paths:
+        with open(path, "rb") as file:
+            _commit(bson.decode(file.read()))
+        os.remove(path)
+    return len(paths)
+
+
+def compact(older_than=timedelta(days=RETENTION_DAYS), mode="archive", start=None,
+            batch_size=COMPACTION_BATCH_SIZE, max_docs_per_s=MAX_DOCS_PER_S, verify=True):
+    """
+    Compacta los documentos por frame anteriores a `older_than` en agregados por hora.
+
+    Args:
+        older_than (timedelta): Antigüedad mínima de los documentos a compactar.
+        mode (str): Qué hacer con los originales (ver `RETENTION_MODES`).
+        start (datetime): Compactar solo desde esta fecha (None = desde el principio).
+        batch_size (int): Documentos originales por lote.
+        max_docs_per_s (float): Ritmo máximo de documentos compactados (0 = sin límite).
+        verify (bool): Comparar los totales por cámara y día antes y después.
+
+    Returns:
+        dict: Documentos compactados, agregados escritos, archivos, pausas y verificación.
+    """
+    if mode not in RETENTION_MODES:
+        raise ValueError(f"Modo de retención no soportado: {mode}")
+    started = time.perf_counter()
+    resumed = resume_pending()
+    cutoff = _cutoff(older_than)
+    before = daily_totals(cutoff, start) if verify else None
+
+    query = _raw_query(cutoff, start)
+    documents_total = aggregates_total = batches = 0
+    archives = []
+    pause = 0.0
+    throttled_s = 0.0
+    while True:
+        batch_start = time.perf_counter()
+        # Tras borrar cada lote, la consulta devuelve el siguiente (orden del índice (camera, timestamp))
+        documents = list(
+            mongodb.collection.find(query).sort([("camera", 1), ("timestamp", 1)]).limit(batch_size)
+        )
+        if not documents:
+            break
+        keys = {
+            hourly_key(d.get("camera"), d["timestamp"].replace(minute=0, second=0, microsecond=0))
+            for d in documents
+        }
+        existing = list(mongodb.collection.find({"detection_id": {"$in": sorted(keys)}, "type": HOURLY_TYPE}))
+        aggregates = _fold(documents, existing)
+
+        # Primero el diario (con la ruta del archivo); después el archivo y el lote
+        batch_id = time.time_ns()
+        archive = _archive_path(documents, batch_id, ARCHIVE_DIR) if mode == "archive" else None
+        manifest = {"aggregates": aggregates, "delete_ids": [d["_id"] for d in documents], "archive": archive}
+        path = _journal(manifest, batch_id)
+        _commit(manifest, documents)
+        os.remove(path)
+        if archive:
+            archives.append(archive)
+
+        batches += 1
+        documents_total += len(documents)
+        aggregates_total += len(aggregates)
+
+        # Pausa creciente si el servidor responde despacio, y ritmo máximo de documentos
+        elapsed = time.perf_counter() - batch_start
+        pause = min(max(pause * 2, 0.5), MAX_PAUSE_S) if elapsed > SLOW_BATCH_S else pause / 2
+        wait = pause
+        if max_docs_per_s:
+            wait = max(wait, len(documents) / max_docs_per_s - elapsed)
+        if wait > 0:
+            throttled_s += wait
+            time.sleep(wait)
+
+    report = {
+        "cutoff": cutoff,
+        "mode": mode,
+        "resumed_batches": resumed,
+        "batches": batches,
+        "documents": documents_total,
+        "aggregates_written": aggregates_total,
+        "archives": archives,
+        "throttled_s": round(throttled_s, 3),
+        "elapsed_s": round(time.perf_counter() - started, 3),
+    }
+    if verify:
+        after = daily_totals(cutoff, start)
+        # Los documentos que lleguen tarde al periodo durante la compactación también aparecen aquí
+        report["mismatches"] = [
+            {"camera": key[0], "date": datetime(*key[1:]), "before": before.get(key), "after": after.get(key)}
+            for key in sorted(set(before) | set(after), key=str)
+            if before.get(key) != after.get(key)
+        ]
+        report["verified"] = not report["mismatches"]
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compacta las detecciones antiguas en agregados por hora")
+    parser.add_argument("--older-than-days", type=float, default=RETENTION_DAYS)
+    parser.add_argument("--mode", choices=RETENTION_MODES, default="archive")
+    parser.add_argument("--start", type=datetime.fromisoformat, default=None, help="Fecha inicial (AAAA-MM-DD)")
+    parser.add_argument("--batch-size", type=int, default=COMPACTION_BATCH_SIZE)
+    parser.add_argument("--max-docs-per-s", type=float, default=MAX_DOCS_PER_S)
+    parser.add_argument("--dry-run", action="store_true", help="Solo informar, sin escribir")
+    parser.add_argument("--no-verify", action="store_true", help="No comparar los totales")
+    args = parser.parse_args(argv)
+
+    older_than = timedelta(days=args.older_than_days)
+    if args.dry_run:
+        report = dry_run(older_than, args.start)
+        print(f"Límite: {report['cutoff']}; {report['documents']} documentos -> {report['aggregates']} agregados"
+              f" ({report['reduction']:.1%} menos)")
+        for camera in report["cameras"]:
+            print(f"  {camera['camera']}: {camera['documents']} documentos, {camera['hours']} horas,"
+                  f" {camera['total_motos']} motocicletas, {camera['oldest']} - {camera['newest']}")
+        return
+
+    report = compact(older_than, args.mode, args.start, args.batch_size, args.max_docs_per_s, not args.no_verify)
+    print(f"{report['documents']} documentos compactados en {report['batches']} lotes;"
+          f" {report['aggregates_written']} agregados escritos; {len(report['archives'])} archivos")
+    if "verified" in report:
+        print("Totales verificados" if report["verified"] else f"Diferencias en los totales: {report['mismatches']}")
+
+
+if __name__ == "__main__":
+    main()
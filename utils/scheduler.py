@@ -0,0 +1,454 @@
+"""
+Planificador de inferencia multi-video con un pool fijo de procesos.
+
+Cada sesión de Streamlit que ejecuta PyTorch en su propio hilo usa por defecto todos
+los núcleos, y con varios videos a la vez los hilos compiten y todos van más lento.
+El planificador es dueño de un número fijo de procesos de inferencia, cada uno con
+un número de hilos fijo (y afinidad de CPU en Linux) y el modelo ya cargado. Los
+videos envían frames desde cualquier sesión; un despachador reparte el trabajo por
+turnos entre videos (round-robin), para que un video largo no acapare el pool.
+
+Los núcleos se reparten entre los procesos sin solaparse. El compromiso entre
+latencia por video y throughput total se ajusta con el número de procesos y el
+perfil de lote:
+
+- latency: lotes de una petición; con pocos procesos de muchos hilos cada frame
+  termina antes.
+- balanced: punto intermedio.
+- throughput: lotes grandes que agrupan peticiones de varios videos; con muchos
+  procesos de pocos hilos se procesan más frames por segundo en total.
+
+Si un proceso termina de forma inesperada (falta de memoria, fallo en PyTorch), las
+peticiones de su lote fallan con `RuntimeError` y el proceso se vuelve a crear; si no
+consigue cargar el modelo, el pool sigue con un proceso menos.
+
+Se activa con CROSSCOUNTER_INFERENCE_WORKERS > 0; si no, la inferencia se ejecuta
+en el proceso de Streamlit como hasta ahora.
+"""
+import atexit
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+import numpy as np
+
+# Número de procesos de inferencia (0 = inferencia en el propio proceso)
+INFERENCE_WORKERS = int(os.environ.get("CROSSCOUNTER_INFERENCE_WORKERS", "0"))
+SCHEDULER_PROFILE = os.environ.get("CROSSCOUNTER_SCHEDULER_PROFILE", "balanced")
+
+# Perfiles: imágenes por llamada al modelo como máximo
+SCHEDULER_PROFILES = {
+    "latency": {"max_batch_size": 1},
+    "balanced": {"max_batch_size": 4},
+    "throughput": {"max_batch_size": 16},
+}
+
+# Cada cuántos segundos se comprueba que los procesos de inferencia siguen vivos
+WORKER_CHECK_INTERVAL_S = 1.0
+
+
+class Detections:
+    """
+    Resultado de una imagen devuelto por un proceso de inferencia, con la misma forma
+    que usan `utils.tiling.results_to_arrays` y el resto del pipeline
+    (`names` y `boxes.xyxy`, `boxes.conf`, `boxes.cls`).
+    """
+
+    class Boxes:
+        def __init__(self, xyxy, conf, cls):
+            self.xyxy = xyxy
+            self.conf = conf
+            self.cls = cls
+
+        def __len__(self):
+            return len(self.xyxy)
+
+    def __init__(self, names, xyxy, conf, cls):
+        self.names = names
+        self.boxes = Detections.Boxes(xyxy, conf, cls)
+
+
+def _worker_main(worker_index, model_path, threads, cores, requests, responses):
+    """
+    Bucle de un proceso de inferencia: fija hilos y afinidad, carga el modelo una vez
+    y atiende lotes hasta recibir None.
+    """
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[variable] = str(threads)
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+
+    try:
+        import torch
+        from ultralytics import YOLO
+
+        torch.set_num_threads(threads)
+        model = YOLO(model_path, verbose=False)
+    except Exception as e:
+        responses.put((worker_index, None, f"Error al cargar el modelo: {e}"))
+        return
+    responses.put((worker_index, None, None))
+
+    while True:
+        batch = requests.get()
+        if batch is None:
+            return
+        batch_id, images, options = batch
+        try:
+            results = model(images, **{"verbose": False, **options})
+            payload = [
+                (
+                    result.boxes.xyxy.cpu().numpy().astype(np.float32),
+                    result.boxes.conf.cpu().numpy().astype(np.float32),
+                    result.boxes.cls.cpu().numpy().astype(np.int64),
+                )
+                for result in results
+            ]
+            responses.put((worker_index, batch_id, (results[0].names if results else {}, payload)))
+        except Exception as e:
+            responses.put((worker_index, batch_id, f"Error en la inferencia: {e}"))
+
+
+class InferenceScheduler:
+    """
+    Pool fijo de procesos de inferencia con cola justa por video.
+
+    Uso:
+        scheduler = InferenceScheduler(workers=4, profile="throughput")
+        future = scheduler.submit(job_id, [pil_image], imgsz=640)
+        results = future.result()  # lista de `Detections`
+
+    Args:
+        workers (int): Número de procesos.
+        profile (str): Perfil de `SCHEDULER_PROFILES`.
+        model_path (str): Ruta del modelo (por defecto la de `utils.helpers`).
+        threads_per_worker (int): Hilos de PyTorch por proceso; por defecto los núcleos
+            repartidos entre los procesos.
+        max_batch_size (int): Imágenes por llamada al modelo; por defecto según el perfil.
+    """
+
+    def __init__(self, workers, profile="balanced", model_path=None, threads_per_worker=None, max_batch_size=None):
+        if profile not in SCHEDULER_PROFILES:
+            raise ValueError(f"Perfil de planificador no soportado: {profile}")
+        if model_path is None:
+            from utils import helpers
+
+            model_path = helpers.model_path
+
+        cpu_count = os.cpu_count() or 1
+        self.workers = max(int(workers), 1)
+        self.profile = profile
+        self.threads_per_worker = threads_per_worker or max(cpu_count // self.workers, 1)
+        self.max_batch_size = max_batch_size or SCHEDULER_PROFILES[profile]["max_batch_size"]
+        self.model_path = model_path
+        self.batches = 0
+        self.images = 0
+        self.restarts = 0
+
+        self._lock = threading.Condition()
+        self._pending = OrderedDict()  # job_id -> deque[(imágenes, opciones, Future)]
+        self._idle = deque(range(self.workers))
+        self._in_flight = {}  # batch_id -> (proceso, [(número de imágenes, Future)])
+        self._batch_ids = itertools.count()
+        self._restarting = set()  # Procesos recreados que aún cargan el modelo
+        self._closed = False
+
+        self._context = multiprocessing.get_context("spawn")
+        self._responses = self._context.Queue()
+        self._requests = [None] * self.workers
+        self._processes = [None] * self.workers
+        self._cores = []
+        for index in range(self.workers):
+            first_core = index * self.threads_per_worker
+            # Afinidad solo si los núcleos alcanzan para todos los procesos sin solaparse
+            cores = None
+            if first_core + self.threads_per_worker <= cpu_count:
+                cores = set(range(first_core, first_core + self.threads_per_worker))
+            self._cores.append(cores)
+            self._start_worker(index)
+
+        # Esperar a que todos los procesos tengan el modelo cargado
+        for _ in range(self.workers):
+            _, _, error = self._responses.get()
+            if error:
+                self.close()
+                raise RuntimeError(error)
+
+        threading.Thread(target=self._dispatch, name="crosscounter-scheduler", daemon=True).start()
+        threading.Thread(target=self._collect, name="crosscounter-scheduler-results", daemon=True).start()
+
+    def _start_worker(self, index):
+        """
+        Crea (o vuelve a crear) el proceso `index` con una cola de peticiones nueva.
+        """
+        self._requests[index] = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(
+                index, self.model_path, self.threads_per_worker, self._cores[index],
+                self._requests[index], self._responses,
+            ),
+            name=f"crosscounter-inference-{index}",
+            daemon=True,
+        )
+        process.start()
+        self._processes[index] = process
+
+    def submit(self, job_id, images, **options):
+        """
+        Encola imágenes de un video.
+
+        Args:
+            job_id (str): Identificador del video (la cola es justa entre videos).
+            images (list): Imágenes PIL RGB o arrays BGR.
+            **options: Argumentos de la llamada al modelo (p. ej. `imgsz`); solo se
+                agrupan en un lote peticiones con las mismas opciones.
+
+        Returns:
+            concurrent.futures.Future: Lista de `Detections`, una por imagen.
+        """
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("El planificador de inferencia está cerrado.")
+            self._pending.setdefault(job_id, deque()).append((list(images), options, future))
+            self._lock.notify()
+        return future
+
+    def _next_batch(self):
+        """
+        Toma peticiones por turnos entre videos hasta llenar un lote.
+        """
+        batch = []
+        batch_options = None
+        size = 0
+        while self._pending:
+            job_id, requests = next(iter(self._pending.items()))
+            images, options, future = requests[0]
+            if batch and (size + len(images) > self.max_batch_size or options != batch_options):
+                break
+            requests.popleft()
+            batch.append((images, future))
+            batch_options = options
+            size += len(images)
+            # El video pasa al final de la cola de turnos
+            del self._pending[job_id]
+            if requests:
+                self._pending[job_id] = requests
+        return batch, batch_options or {}
+
+    def _dispatch(self):
+        while True:
+            with self._lock:
+                while not self._closed and not (self._pending and self._idle):
+                    self._lock.wait()
+                if self._closed:
+                    return
+                worker = self._idle.popleft()
+                batch, options = self._next_batch()
+                batch_id = next(self._batch_ids)
+                self._in_flight[batch_id] = (worker, [(len(images), future) for images, future in batch])
+                requests = self._requests[worker]
+            images = [image for request_images, _ in batch for image in request_images]
+            self.batches += 1
+            self.images += len(images)
+            requests.put((batch_id, images, options))
+
+    def _fail(self, futures, message):
+        for future in futures:
+            if not future.done():
+                future.set_exception(RuntimeError(message))
+
+    def _check_workers(self):
+        """
+        Falla los lotes de los procesos que terminaron y los vuelve a crear. Un proceso
+        recreado que termina antes de cargar el modelo ya no se recrea.
+        """
+        failed = []
+        with self._lock:
+            if self._closed:
+                return
+            for index, process in enumerate(self._processes):
+                if process is None or process.is_alive():
+                    continue
+                message = f"El proceso de inferencia {index} terminó (código {process.exitcode})."
+                for batch_id, (worker, requests) in list(self._in_flight.items()):
+                    if worker == index:
+                        del self._in_flight[batch_id]
+                        failed.append(([future for _, future in requests], message))
+                if index in self._idle:
+                    self._idle.remove(index)
+                if index in self._restarting:
+                    self._restarting.discard(index)
+                    self._processes[index] = None
+                    failed.extend(self._lose_capacity())
+                else:
+                    self._restarting.add(index)
+                    self.restarts += 1
+                    self._start_worker(index)
+        for futures, message in failed:
+            self._fail(futures, message)
+
+    def _lose_capacity(self):
+        """
+        Con el lock tomado: si ya no queda ningún proceso, cierra el planificador y
+        devuelve las peticiones pendientes para fallarlas.
+        """
+        if any(process is not None for process in self._processes):
+            return []
+        self._closed = True
+        futures = [future for requests in self._pending.values() for _, _, future in requests]
+        self._pending.clear()
+        self._lock.notify_all()
+        return [(futures, "No queda ningún proceso de inferencia.")]
+
+    def _worker_ready(self, worker, error):
+        """
+        Un proceso recreado terminó de cargar el modelo (o no pudo cargarlo).
+        """
+        failed = []
+        with self._lock:
+            self._restarting.discard(worker)
+            if error:
+                self._processes[worker] = None
+                failed = self._lose_capacity()
+            else:
+                self._idle.append(worker)
+                self._lock.notify()
+        for futures, message in failed:
+            self._fail(futures, message)
+
+    def _collect(self):
+        checked_at = time.monotonic()
+        while True:
+            try:
+                message = self._responses.get(timeout=WORKER_CHECK_INTERVAL_S)
+            except queue.Empty:
+                message = ()
+            if time.monotonic() - checked_at >= WORKER_CHECK_INTERVAL_S:
+                self._check_workers()
+                checked_at = time.monotonic()
+            if message is None:
+                return
+            if not message:
+                continue
+            worker, batch_id, payload = message
+            if batch_id is None:
+                self._worker_ready(worker, payload)
+                continue
+            with self._lock:
+                entry = self._in_flight.pop(batch_id, None)
+                if entry is None:
+                    continue  # Lote de un proceso que ya se dio por terminado
+                _, requests = entry
+                self._idle.append(worker)
+                self._lock.notify()
+
+            if isinstance(payload, str):
+                self._fail([future for _, future in requests], payload)
+                continue
+
+            names, results = payload
+            offset = 0
+            for count, future in requests:
+                future.set_result([Detections(names, *result) for result in results[offset:offset + count]])
+                offset += count
+
+    @property
+    def stats(self):
+        """
+        Configuración y uso del pool: procesos, hilos por proceso, lotes, imágenes y
+        procesos recreados.
+        """
+        return {
+            "profile": self.profile,
+            "workers": self.workers,
+            "workers_alive": sum(process is not None for process in self._processes),
+            "restarts": self.restarts,
+            "threads_per_worker": self.threads_per_worker,
+            "max_batch_size": self.max_batch_size,
+            "batches": self.batches,
+            "images": self.images,
+            "mean_batch_size": round(self.images / self.batches, 2) if self.batches else 0,
+        }
+
+    def close(self):
+        """
+        Detiene los procesos de inferencia; las peticiones pendientes fallan.
+        """
+        with self._lock:
+            self._closed = True
+            for requests in self._pending.values():
+                for _, _, future in requests:
+                    future.set_exception(RuntimeError("El planificador de inferencia se cerró."))
+            self._pending.clear()
+            self._lock.notify_all()
+        for requests, process in zip(self._requests, self._processes):
+            if process is not None:
+                requests.put(None)
+        for process in self._processes:
+            if process is not None:
+                process.join(timeout=5)
+        self._responses.put(None)
+
+
+class ScheduledModel:
+    """
+    Sustituto del modelo YOLO que envía las imágenes de un video al planificador.
+
+    Se llama igual que el modelo (`model(imagen)` o `model([imágenes], imgsz=320)`) y
+    devuelve una lista de `Detections`; los argumentos se envían al modelo del proceso.
+
+    Args:
+        scheduler (InferenceScheduler): Planificador compartido.
+        job_id (str): Identificador del video.
+    """
+
+    def __init__(self, scheduler, job_id):
+        self.scheduler = scheduler
+        self.job_id = job_id
+
+    def __call__(self, images, **kwargs):
+        if not isinstance(images, list):
+            images = [images]
+        return self.scheduler.submit(self.job_id, images, **kwargs).result()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """
+    Devuelve el planificador del proceso, creándolo la primera vez (None si
+    CROSSCOUNTER_INFERENCE_WORKERS es 0).
+    """
+    global _scheduler
+    if INFERENCE_WORKERS <= 0:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = InferenceScheduler(INFERENCE_WORKERS, SCHEDULER_PROFILE)
+            atexit.register(_scheduler.close)
+    return _scheduler
+
+
+def get_inference_model(job_id):
+    """
+    Modelo a usar para un video: el planificador compartido si está activo o el
+    pool de instancias del modelo de este proceso (ver `utils.model_pool`).
+
+    Args:
+        job_id (str): Identificador del video (p. ej. el `inference_id`).
+    """
+    scheduler = get_scheduler()
+    if scheduler is None:
+        from utils.helpers import load_model
+
+        return load_model()
+    return ScheduledModel(scheduler, job_id)
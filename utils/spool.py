@@ -0,0 +1,348 @@
+"""
+Cola local persistente (spool) de resultados pendientes de escribir en MongoDB.
+
+Los resultados se escriben primero en una base SQLite local (modo WAL), a la
+velocidad del disco, y un hilo de vaciado los envía a MongoDB por lotes. Si MongoDB
+está lento o caído la inferencia no se detiene y los resultados no se pierden: se
+quedan en el spool hasta que el servidor vuelve, también entre reinicios del proceso.
+
+- Idempotencia: cada documento se guarda con una clave determinista (`detection_id`,
+  una por inferencia y frame). Si un lote falla de forma ambigua (p. ej. un timeout
+  después de que el servidor lo escribiera), al reintentarlo MongoDB no vuelve a
+  guardar las claves que ya tiene (ver `utils.mongodb.write_documents`), de modo que
+  cada resultado se escribe una sola vez. En colecciones de series temporales esto
+  solo está garantizado si un único proceso vacía cada archivo de spool.
+- Reintentos con espera exponencial y jitter.
+- Cortacircuitos (`CircuitBreaker`): tras varios fallos seguidos deja de intentar
+  durante `reset_timeout_s` y después prueba con un único lote. Solo lo abren los
+  errores transitorios (`TRANSIENT_ERRORS`: caída, red, timeouts).
+- Documentos rechazados: si MongoDB rechaza un lote por otro motivo (validación,
+  documento demasiado grande) el lote se divide por mitades para escribir los demás
+  documentos y aislar los rechazados. Un documento rechazado `max_attempts` veces pasa
+  a la tabla `dead_letter` del mismo archivo, para no bloquear los siguientes.
+
+El spool se guarda por defecto en `data/` dentro de la aplicación (no en el
+directorio temporal, que puede vaciarse al reiniciar).
+"""
+import os
+import random
+import sqlite3
+import threading
+import time
+
+import bson
+from pymongo.errors import ConnectionFailure, ExecutionTimeout, WTimeoutError
+
+SPOOL_PATH = os.environ.get(
+    "CROSSCOUNTER_SPOOL_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "crosscounter-spool.sqlite3"),
+)
+
+# Errores de los que MongoDB se recupera solo: se reintenta el lote entero sin contar
+# intentos. Cualquier otro error se atribuye a los documentos del lote.
+TRANSIENT_ERRORS = (ConnectionError, TimeoutError, ConnectionFailure, ExecutionTimeout, WTimeoutError)
+
+
+class CircuitBreaker:
+    """
+    Cortacircuitos para un servicio remoto.
+
+    Estados: closed (normal), open (sin intentos hasta `reset_timeout_s`) y half_open
+    (se permite un intento de prueba; si falla vuelve a open).
+
+    Args:
+        failure_threshold (int): Fallos seguidos que abren el circuito.
+        reset_timeout_s (float): Segundos abierto antes de permitir un intento de prueba.
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout_s=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout_s:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        """
+        Indica si se puede intentar una operación.
+        """
+        return self.state != "open"
+
+    def retry_in(self):
+        """
+        Segundos hasta el próximo intento permitido.
+        """
+        if self.opened_at is None:
+            return 0.0
+        return max(self.reset_timeout_s - (time.monotonic() - self.opened_at), 0.0)
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                # Un fallo en half_open vuelve a abrir el circuito durante otro periodo
+                self.opened_at = time.monotonic()
+
+
+class ResultSpool:
+    """
+    Cola persistente de documentos en SQLite.
+
+    Args:
+        path (str): Archivo SQLite.
+    """
+
+    def __init__(self, path=SPOOL_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS pending ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " key TEXT UNIQUE NOT NULL,"
+            " document BLOB NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letter ("
+            " id INTEGER PRIMARY KEY,"
+            " key TEXT NOT NULL,"
+            " document BLOB NOT NULL,"
+            " attempts INTEGER NOT NULL,"
+            " error TEXT,"
+            " failed_at REAL NOT NULL)"
+        )
+
+    def append(self, documents, key_field="detection_id"):
+        """
+        Guarda documentos en el spool (una transacción). Las claves repetidas se ignoran.
+
+        Returns:
+            int: Documentos recibidos.
+        """
+        rows = [(str(document[key_field]), bson.encode(document)) for document in documents]
+        with self._lock:
+            self._connection.execute("BEGIN")
+            self._connection.executemany("INSERT OR IGNORE INTO pending (key, document) VALUES (?, ?)", rows)
+            self._connection.execute("COMMIT")
+        return len(rows)
+
+    def peek(self, limit):
+        """
+        Documentos más antiguos del spool.
+
+        Returns:
+            list[tuple]: (id, documento, intentos previos).
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, document, attempts FROM pending ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+        return [(row_id, bson.decode(document), attempts) for row_id, document, attempts in rows]
+
+    def remove(self, ids):
+        with self._lock:
+            self._connection.executemany("DELETE FROM pending WHERE id = ?", [(row_id,) for row_id in ids])
+
+    def mark_failed(self, ids):
+        with self._lock:
+            self._connection.executemany(
+                "UPDATE pending SET attempts = attempts + 1 WHERE id = ?", [(row_id,) for row_id in ids]
+            )
+
+    def dead_letter(self, row_id, error):
+        """
+        Mueve un documento rechazado a la tabla `dead_letter` (una transacción).
+
+        Args:
+            row_id (int): Documento pendiente.
+            error (str): Último error de MongoDB.
+        """
+        with self._lock:
+            self._connection.execute("BEGIN")
+            self._connection.execute(
+                "INSERT OR REPLACE INTO dead_letter (id, key, document, attempts, error, failed_at)"
+                " SELECT id, key, document, attempts + 1, ?, ? FROM pending WHERE id = ?",
+                (error, time.time(), row_id),
+            )
+            self._connection.execute("DELETE FROM pending WHERE id = ?", (row_id,))
+            self._connection.execute("COMMIT")
+
+    def pending(self):
+        """
+        Número de documentos pendientes.
+        """
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+
+    def dead_letters(self):
+        """
+        Número de documentos descartados en `dead_letter`.
+        """
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM dead_letter").fetchone()[0]
+
+
+class SpoolDrainer:
+    """
+    Hilo que vacía el spool en MongoDB por lotes, con reintentos y cortacircuitos.
+
+    Args:
+        spool (ResultSpool): Spool a vaciar.
+        write (callable): Recibe los documentos y los escribe en MongoDB omitiendo los
+            que ya existan (un reintento no debe duplicarlos).
+        breaker (CircuitBreaker): Cortacircuitos compartido con el resto del cliente.
+        batch_size (int): Documentos por escritura.
+        min_backoff_s (float): Espera tras el primer fallo.
+        max_backoff_s (float): Espera máxima entre reintentos.
+        max_attempts (int): Rechazos de un documento antes de moverlo a `dead_letter`.
+    """
+
+    def __init__(self, spool, write, breaker, batch_size=500, min_backoff_s=0.5, max_backoff_s=60.0, max_attempts=5):
+        self.spool = spool
+        self.write = write
+        self.breaker = breaker
+        self.batch_size = batch_size
+        self.min_backoff_s = min_backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.max_attempts = max_attempts
+        self.drained = 0
+        self.failures = 0
+        self.rejected = 0
+        self.dead_lettered = 0
+        self.last_error = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="crosscounter-spool", daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        """
+        Avisa de que hay documentos nuevos.
+        """
+        self._wake.set()
+
+    def _sleep(self, seconds):
+        self._wake.clear()
+        self._wake.wait(seconds)
+
+    def _run(self):
+        backoff = 0.0
+        while not self._stop.is_set():
+            if not self.breaker.allow():
+                # Circuito abierto: no se intenta nada hasta el periodo de prueba
+                self._stop.wait(self.breaker.retry_in())
+                continue
+
+            batch = self.spool.peek(self.batch_size)
+            if not batch:
+                self._sleep(1.0)
+                continue
+
+            try:
+                retrying = self._write(batch)
+            except TRANSIENT_ERRORS as e:
+                self.breaker.record_failure()
+                self.failures += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                retrying = True
+            else:
+                # El servidor respondió, aunque rechazara algún documento
+                self.breaker.record_success()
+
+            if retrying:
+                # Espera exponencial con jitter
+                backoff = min(max(backoff * 2, self.min_backoff_s), self.max_backoff_s)
+                self._stop.wait(backoff * random.uniform(0.5, 1.5))
+            else:
+                backoff = 0.0
+
+    def _write(self, batch):
+        """
+        Escribe un lote y lo quita del spool. Si MongoDB lo rechaza con un error no
+        transitorio, escribe cada mitad por separado hasta aislar los documentos
+        rechazados.
+
+        Returns:
+            bool: True si queda algún documento rechazado pendiente de reintentar.
+
+        Raises:
+            TRANSIENT_ERRORS: Si MongoDB no está disponible (el lote se reintenta entero).
+        """
+        try:
+            self.write([document for _, document, _ in batch])
+        except TRANSIENT_ERRORS:
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if len(batch) > 1:
+                middle = len(batch) // 2
+                # Se evalúan las dos mitades aunque la primera tenga rechazos
+                first = self._write(batch[:middle])
+                return self._write(batch[middle:]) or first
+            row_id, _, attempts = batch[0]
+            self.rejected += 1
+            self.last_error = error
+            if attempts + 1 >= self.max_attempts:
+                self.spool.dead_letter(row_id, error)
+                self.dead_lettered += 1
+                return False
+            self.spool.mark_failed([row_id])
+            return True
+
+        ids = [row_id for row_id, _, _ in batch]
+        self.spool.remove(ids)
+        self.drained += len(ids)
+        return False
+
+    def flush(self, timeout=None):
+        """
+        Espera a que el spool quede vacío.
+
+        Returns:
+            bool: True si se vació antes de `timeout`.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.spool.pending():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            self.wake()
+            time.sleep(0.05)
+        return True
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=5)
+
+    @property
+    def stats(self):
+        """
+        Estado del vaciado: pendientes, escritos, fallos, rechazos, descartados, estado
+        del circuito y último error.
+        """
+        return {
+            "pending": self.spool.pending(),
+            "drained": self.drained,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "dead_letter": self.spool.dead_letters(),
+            "circuit": self.breaker.state,
+            "last_error": self.last_error,
+        }
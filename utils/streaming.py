@@ -0,0 +1,305 @@
+"""
+Agregación en streaming de los conteos por frame: tasas por ventana de tiempo y alertas
+en vivo, sin consultar la base de datos.
+
+Cada resultado de frame (`motorcycle_count_per_frame`) se suma a varias ventanas de
+tiempo sobre el timestamp real del frame:
+
+- Ventanas fijas (tumbling): `slide_s == size_s`, p. ej. totales por minuto.
+- Ventanas deslizantes: `slide_s < size_s`, p. ej. los últimos 15 minutos cada minuto.
+  Se guardan como un anillo de `size_s / slide_s` paneles (suma, frames y máximo por
+  panel), de modo que la memoria de cada ventana es constante y cada evento cuesta O(1).
+
+Al cerrarse cada ventana se evalúan dos alertas: un umbral de motocicletas por minuto
+y una anomalía respecto a la media móvil exponencial (EWMA) de esa ventana, por su
+puntuación z. Los resultados cerrados se escriben en MongoDB (`window_stats`) cada
+`flush_interval_s` segundos, en un único `bulk_write` idempotente, identificados por
+la inferencia que los produjo: trabajos que se solapan en la misma cámara y ventana no
+se reemplazan entre sí, y `mongodb.get_window_stats` los suma al leer. Sin inferencia
+(análisis cuyos conteos no se guardan) las ventanas solo se muestran en vivo.
+"""
+import math
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from utils import mongodb
+
+# Ventanas por defecto: nombre -> (duración, desplazamiento) en segundos
+DEFAULT_WINDOWS = {
+    "1m": (60, 60),
+    "15m": (900, 900),
+    "15m_sliding": (900, 60),
+}
+
+DEFAULT_STREAMING_OPTIONS = {
+    # Motocicletas por minuto a partir de las cuales se avisa (None = sin umbral)
+    "rate_threshold": None,
+    # Anomalías: peso de la última ventana en la EWMA, umbral de |z| y ventanas de calentamiento
+    "ewma_alpha": 0.3,
+    "z_threshold": 3.0,
+    "warmup": 5,
+    # Segundos (de reloj) entre escrituras de las ventanas cerradas
+    "flush_interval_s": 60.0,
+}
+
+# Ventanas cerradas pendientes de escribir como máximo (si MongoDB no responde)
+MAX_UNFLUSHED = 10000
+
+
+def _epoch(timestamp):
+    return (timestamp - datetime(1970, 1, 1, tzinfo=timestamp.tzinfo)).total_seconds()
+
+
+class WindowAggregate:
+    """
+    Ventana de tiempo fija o deslizante sobre los conteos por frame.
+
+    Args:
+        name (str): Nombre de la ventana.
+        size_s (int): Duración de la ventana en segundos.
+        slide_s (int): Cada cuántos segundos se cierra una ventana (= size_s en ventanas fijas).
+    """
+
+    def __init__(self, name, size_s, slide_s=None):
+        slide_s = slide_s or size_s
+        if size_s % slide_s:
+            raise ValueError(f"La duración de la ventana {name} debe ser múltiplo de su desplazamiento.")
+        self.name = name
+        self.size_s = size_s
+        self.slide_s = slide_s
+        self._panes = size_s // slide_s
+        # Anillo de paneles: motocicletas, frames y máximo por frame
+        self._total = [0] * self._panes
+        self._frames = [0] * self._panes
+        self._max = [0] * self._panes
+        self._pane = None  # Índice absoluto (inicio / slide_s) del panel en curso
+
+    def _result(self, end_pane, partial=False):
+        total = sum(self._total)
+        frames = sum(self._frames)
+        end = datetime(1970, 1, 1) + timedelta(seconds=end_pane * self.slide_s)
+        return {
+            "window": self.name,
+            "start": end - timedelta(seconds=self.size_s),
+            "end": end,
+            "total": total,
+            "frames": frames,
+            "max_per_frame": max(self._max),
+            "rate_per_min": round(total * 60 / self.size_s, 3),
+            "partial": partial,
+        }
+
+    def add(self, timestamp, count):
+        """
+        Suma el conteo de un frame.
+
+        Returns:
+            list[dict]: Ventanas que se cierran antes de este frame.
+        """
+        pane = int(_epoch(timestamp) // self.slide_s)
+        closed = []
+        if self._pane is None:
+            self._pane = pane
+        elif pane > self._pane:
+            # Cerrar la ventana que termina en cada límite de panel; tras un hueco más
+            # largo que la ventana solo quedan ventanas vacías, que no se emiten
+            for boundary in range(self._pane + 1, min(pane, self._pane + self._panes) + 1):
+                closed.append(self._result(boundary))
+                slot = boundary % self._panes
+                self._total[slot] = self._frames[slot] = self._max[slot] = 0
+            if pane - self._pane > self._panes:
+                self._total = [0] * self._panes
+                self._frames = [0] * self._panes
+                self._max = [0] * self._panes
+            self._pane = pane
+        elif pane < self._pane:
+            return closed  # Frame fuera de orden anterior al panel en curso: se ignora
+
+        slot = pane % self._panes
+        self._total[slot] += count
+        self._frames[slot] += 1
+        self._max[slot] = max(self._max[slot], count)
+        return [result for result in closed if result["frames"]]
+
+    def current(self):
+        """
+        Ventana en curso (parcial), o None si aún no hay frames.
+        """
+        if self._pane is None:
+            return None
+        return self._result(self._pane + 1, partial=True)
+
+
+class EWMADetector:
+    """
+    Detector de anomalías por puntuación z respecto a una media y varianza móviles
+    exponenciales.
+
+    Args:
+        alpha (float): Peso de la última observación.
+        z_threshold (float): |z| a partir del cual una observación es anómala.
+        warmup (int): Observaciones antes de evaluar.
+    """
+
+    def __init__(self, alpha=0.3, z_threshold=3.0, warmup=5):
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.warmup = warmup
+        self.mean = None
+        self.variance = 0.0
+        self.count = 0
+
+    def update(self, value):
+        """
+        Evalúa una observación y la incorpora a la media.
+
+        Returns:
+            float | None: Puntuación z si la observación es anómala, si no None.
+        """
+        anomaly = None
+        if self.mean is None:
+            self.mean = float(value)
+        else:
+            deviation = value - self.mean
+            if self.count >= self.warmup:
+                # Sin varianza (serie constante) cualquier cambio es anómalo
+                std = math.sqrt(self.variance)
+                z = deviation / std if std > 0 else (math.inf if deviation else 0.0)
+                if abs(z) >= self.z_threshold:
+                    anomaly = z
+            self.mean += self.alpha * deviation
+            self.variance = (1 - self.alpha) * (self.variance + self.alpha * deviation ** 2)
+        self.count += 1
+        return anomaly
+
+
+class StreamAggregator:
+    """
+    Motor de agregación en streaming de un trabajo (video o transmisión) de una cámara.
+
+    Uso:
+        stream = StreamAggregator("cam-0", inference_id, rate_threshold=40)
+        for frame_result in frames:
+            alerts = stream.add(frame_result)
+        stream.close()
+
+    Args:
+        camera (str): Cámara de los frames.
+        inference_id (str): Inferencia del trabajo (None = las ventanas no se guardan).
+        windows (dict): Nombre -> (duración, desplazamiento) en segundos.
+        sink (callable): Recibe las ventanas cerradas al escribirlas (por defecto MongoDB).
+        **options: Sobrescriben `DEFAULT_STREAMING_OPTIONS`.
+    """
+
+    def __init__(self, camera=mongodb.DEFAULT_CAMERA, inference_id=None, windows=None, sink=None, **options):
+        self.camera = camera
+        self.inference_id = inference_id
+        self.options = {**DEFAULT_STREAMING_OPTIONS, **{k: v for k, v in options.items() if v is not None}}
+        self.windows = [
+            WindowAggregate(name, size_s, slide_s) for name, (size_s, slide_s) in (windows or DEFAULT_WINDOWS).items()
+        ]
+        self.sink = sink or (mongodb.save_window_results if inference_id is not None else None)
+        self.events = 0
+        self.flushed = 0
+        self.flush_errors = 0
+        self.alert_count = 0
+        # Últimas alertas (para el panel en vivo)
+        self.alerts = deque(maxlen=100)
+        self.last_closed = {}
+        self._detectors = {
+            window.name: EWMADetector(self.options["ewma_alpha"], self.options["z_threshold"], self.options["warmup"])
+            for window in self.windows
+        }
+        self._unflushed = deque(maxlen=MAX_UNFLUSHED)
+        self._last_flush = time.monotonic()
+
+    def _check(self, result):
+        alerts = []
+        threshold = self.options["rate_threshold"]
+        if threshold is not None and result["rate_per_min"] >= threshold:
+            alerts.append({**result, "kind": "threshold", "value": result["rate_per_min"]})
+        z = self._detectors[result["window"]].update(result["total"])
+        if z is not None:
+            alerts.append({**result, "kind": "anomaly", "value": z})
+        return alerts
+
+    def add(self, frame_result):
+        """
+        Procesa el resultado de un frame muestreado.
+
+        Args:
+            frame_result (dict): Con "timestamp" y "motorcycle_count".
+
+        Returns:
+            list[dict]: Alertas nuevas (ventana, tipo "threshold" o "anomaly" y valor).
+        """
+        self.events += 1
+        alerts = []
+        for window in self.windows:
+            for result in window.add(frame_result["timestamp"], frame_result["motorcycle_count"]):
+                result["camera"] = self.camera
+                result["inference_id"] = self.inference_id
+                self.last_closed[window.name] = result
+                self._unflushed.append(result)
+                alerts.extend(self._check(result))
+        self.alerts.extend(alerts)
+        self.alert_count += len(alerts)
+        if time.monotonic() - self._last_flush >= self.options["flush_interval_s"]:
+            self.flush()
+        return alerts
+
+    def flush(self):
+        """
+        Escribe las ventanas cerradas pendientes. Si falla, se reintentan en la siguiente.
+        """
+        self._last_flush = time.monotonic()
+        if not self._unflushed:
+            return
+        if self.sink is None:
+            self._unflushed.clear()
+            return
+        results = list(self._unflushed)
+        try:
+            self.sink(results)
+        except Exception:
+            self.flush_errors += 1
+            return
+        self._unflushed.clear()
+        self.flushed += len(results)
+
+    def snapshot(self):
+        """
+        Estado en vivo: por ventana, la última ventana cerrada y la parcial en curso.
+
+        Returns:
+            dict: {nombre: {"closed": dict | None, "current": dict | None}}.
+        """
+        return {
+            window.name: {"closed": self.last_closed.get(window.name), "current": window.current()}
+            for window in self.windows
+        }
+
+    def close(self):
+        """
+        Escribe las ventanas cerradas y las parciales en curso (marcadas `partial`).
+        """
+        for window in self.windows:
+            current = window.current()
+            if current is not None and current["frames"]:
+                self._unflushed.append({**current, "camera": self.camera, "inference_id": self.inference_id})
+        self.flush()
+
+    @property
+    def stats(self):
+        """
+        Eventos procesados, ventanas escritas, errores de escritura y alertas.
+        """
+        return {
+            "events": self.events,
+            "windows": [window.name for window in self.windows],
+            "flushed": self.flushed,
+            "flush_errors": self.flush_errors,
+            "pending": len(self._unflushed),
+            "alerts": self.alert_count,
+        }
@@ -0,0 +1,289 @@
+"""
+Inferencia por mosaicos (tiles) para detectar motocicletas pequeñas y lejanas en
+frames de alta resolución.
+
+Al reducir un frame 4K al tamaño de entrada del modelo (640 px), una motocicleta de
+unas decenas de píxeles queda casi invisible. El frame se divide en mosaicos
+solapados a resolución nativa, que se infieren en un único lote, y sus detecciones
+se unen a las del frame completo con una NMS por clase vectorizada en NumPy. Las cajas
+del frame completo se conservan siempre: los mosaicos solo añaden detecciones.
+
+Está desactivada por defecto (`mode: off`, solo el frame completo) y se activa con
+los modos `auto` o `always`. Para no multiplicar el cómputo, en modo `auto` los
+mosaicos solo se usan cuando ayudan: en frames bastante mayores que la entrada del
+modelo y, dentro de ellos, solo en las regiones con detecciones pequeñas (del frame
+completo o del frame inferido anterior), más un sondeo de todo el frame cada
+`probe_interval` frames inferidos para descubrir motocicletas que el frame completo
+no ve. El primer sondeo
+llega tras `probe_interval` frames, de modo que una imagen suelta solo usa mosaicos
+donde el frame completo ya encontró cajas pequeñas.
+"""
+import numpy as np
+
+# Modos: off (solo frame completo), auto (adaptativo), always (todos los mosaicos)
+TILING_MODES = ("off", "auto", "always")
+
+DEFAULT_TILING_OPTIONS = {
+    "mode": "off",
+    "tile_size": 640,
+    "overlap": 0.2,
+    # Tamaño de entrada del modelo: decide cuánto se reduce el frame completo
+    "model_input_size": 640,
+    # Solo se usan mosaicos si el frame es al menos este factor mayor que la entrada
+    "min_downscale": 1.5,
+    # Una caja es pequeña si mide menos de estos píxeles a la escala del modelo
+    "small_box_px": 24,
+    # Cada cuántos frames inferidos se sondea el frame completo con mosaicos
+    "probe_interval": 10,
+    "nms_threshold": 0.5,
+    # "ios" (intersección sobre la menor) une los fragmentos cortados por el borde de un mosaico
+    "nms_metric": "ios",
+}
+
+
+def make_tiles(width, height, tile_size=640, overlap=0.2):
+    """
+    Calcula mosaicos solapados que cubren todo el frame.
+
+    Args:
+        width (int): Ancho del frame.
+        height (int): Alto del frame.
+        tile_size (int): Lado de cada mosaico en píxeles.
+        overlap (float): Fracción de solapamiento entre mosaicos vecinos.
+
+    Returns:
+        numpy.ndarray: Matriz (N, 4) con (xmin, ymin, xmax, ymax) de cada mosaico.
+    """
+    def starts(length):
+        if length <= tile_size:
+            return np.array([0])
+        stride = max(int(tile_size * (1 - overlap)), 1)
+        count = int(np.ceil((length - tile_size) / stride)) + 1
+        # El último mosaico se alinea con el borde en lugar de salirse del frame
+        return np.minimum(np.arange(count) * stride, length - tile_size)
+
+    xs, ys = np.meshgrid(starts(width), starts(height))
+    x0 = xs.ravel()
+    y0 = ys.ravel()
+    return np.stack(
+        [x0, y0, np.minimum(x0 + tile_size, width), np.minimum(y0 + tile_size, height)], axis=1
+    )
+
+
+def pairwise_overlap(boxes, metric="iou"):
+    """
+    Matriz de solapamiento entre todas las cajas.
+
+    Args:
+        boxes (numpy.ndarray): Cajas (N, 4) en formato xyxy.
+        metric (str): "iou" (intersección sobre unión) o "ios" (intersección sobre la caja menor).
+
+    Returns:
+        numpy.ndarray: Matriz (N, N).
+    """
+    x0 = np.maximum(boxes[:, None, 0], boxes[None, :, 0])
+    y0 = np.maximum(boxes[:, None, 1], boxes[None, :, 1])
+    x1 = np.minimum(boxes[:, None, 2], boxes[None, :, 2])
+    y1 = np.minimum(boxes[:, None, 3], boxes[None, :, 3])
+    intersection = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    if metric == "ios":
+        denominator = np.minimum(areas[:, None], areas[None, :])
+    else:
+        denominator = areas[:, None] + areas[None, :] - intersection
+    return intersection / np.maximum(denominator, 1e-9)
+
+
+def non_max_suppression(boxes, scores, classes, threshold=0.5, metric="iou", fixed=None):
+    """
+    NMS por clase: una caja solo suprime a otras de su misma clase.
+
+    Args:
+        boxes (numpy.ndarray): Cajas (N, 4) en formato xyxy.
+        scores (numpy.ndarray): Confianzas (N,).
+        classes (numpy.ndarray): Índices de clase (N,).
+        threshold (float): Solapamiento a partir del cual se suprime una caja.
+        metric (str): Ver `pairwise_overlap`.
+        fixed (numpy.ndarray): Máscara (N,) de cajas que se conservan siempre (p. ej. las
+            del frame completo); solo suprimen a las demás.
+
+    Returns:
+        numpy.ndarray: Índices de las cajas conservadas: primero las fijas y después
+        el resto, cada grupo por confianza descendente.
+    """
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.intp)
+
+    if fixed is None:
+        fixed = np.zeros(len(boxes), dtype=bool)
+    order = np.lexsort((-scores, ~fixed))
+    overlap = pairwise_overlap(boxes[order], metric)
+    # Pares que se suprimen: misma clase, solapamiento alto y la otra caja con más confianza
+    # (o fija); una caja fija nunca se suprime
+    suppresses = (overlap > threshold) & (classes[order][:, None] == classes[order][None, :])
+    suppresses &= ~fixed[order][None, :]
+    suppresses = np.triu(suppresses, k=1)
+
+    keep = np.ones(len(order), dtype=bool)
+    for i in range(len(order)):
+        if keep[i]:
+            keep &= ~suppresses[i]
+    return order[keep]
+
+
+def _to_numpy(values):
+    # Tensores de PyTorch (resultados de YOLO) o arrays de NumPy (utils.scheduler)
+    return values.cpu().numpy() if hasattr(values, "cpu") else np.asarray(values)
+
+
+def results_to_arrays(results, offsets=None):
+    """
+    Convierte resultados de YOLO en matrices de cajas, confianzas y clases.
+
+    Args:
+        results (list): Resultados del modelo (uno por imagen) o `utils.scheduler.Detections`.
+        offsets (numpy.ndarray): Desplazamiento (x, y) de cada imagen dentro del frame.
+
+    Returns:
+        tuple: (cajas (N, 4), confianzas (N,), clases (N,), nombres de clase).
+    """
+    boxes, scores, classes = [], [], []
+    names = {}
+    for index, result in enumerate(results):
+        names = result.names
+        if len(result.boxes) == 0:
+            continue
+        xyxy = _to_numpy(result.boxes.xyxy).astype(np.float32)
+        if offsets is not None:
+            xyxy = xyxy + np.tile(offsets[index], 2)
+        boxes.append(xyxy)
+        scores.append(_to_numpy(result.boxes.conf).astype(np.float32))
+        classes.append(_to_numpy(result.boxes.cls).astype(np.int64))
+
+    if not boxes:
+        return np.empty((0, 4), np.float32), np.empty(0, np.float32), np.empty(0, np.int64), names
+    return np.concatenate(boxes), np.concatenate(scores), np.concatenate(classes), names
+
+
+class TiledDetector:
+    """
+    Ejecuta el modelo sobre el frame completo y, cuando ayuda, sobre mosaicos.
+
+    Guarda estado entre frames (sondeo periódico y detecciones del frame anterior),
+    por lo que debe crearse un detector por video.
+
+    Uso:
+        detector = TiledDetector(mode="auto")
+        detections = detector.detect(model, pil_image)
+
+    Args:
+        **options: Sobrescriben `DEFAULT_TILING_OPTIONS`.
+    """
+
+    def __init__(self, **options):
+        self.options = {**DEFAULT_TILING_OPTIONS, **{k: v for k, v in options.items() if v is not None}}
+        if self.options["mode"] not in TILING_MODES:
+            raise ValueError(f"Modo de mosaicos no soportado: {self.options['mode']}")
+        self.frames = 0
+        self.tiled_frames = 0
+        self.tiles_run = 0
+        self.detections_gained = 0
+        self._previous_boxes = np.empty((0, 4), np.float32)
+        self._tiles = None
+        self._tiles_size = None
+
+    def _frame_tiles(self, width, height):
+        if self._tiles_size != (width, height):
+            self._tiles = make_tiles(width, height, self.options["tile_size"], self.options["overlap"])
+            self._tiles_size = (width, height)
+        return self._tiles
+
+    def _select_tiles(self, width, height, boxes):
+        """
+        Elige los mosaicos a inferir para este frame (vacío si no compensa).
+        """
+        mode = self.options["mode"]
+        if mode == "off":
+            return np.empty((0, 4), dtype=np.int64)
+
+        tiles = self._frame_tiles(width, height)
+        downscale = max(width, height) / self.options["model_input_size"]
+        if mode == "always":
+            return tiles
+        if downscale < self.options["min_downscale"] or len(tiles) < 2:
+            return tiles[:0]
+
+        # Sondeo periódico de todo el frame (no en el primero: una imagen suelta no se sondea)
+        if self.frames % self.options["probe_interval"] == 0:
+            return tiles
+
+        # Solo las regiones con cajas que el modelo ve con pocos píxeles, en este frame
+        # o en el anterior (los mosaicos las encuentran aunque el frame completo no)
+        boxes = np.concatenate([boxes, self._previous_boxes])
+        sizes = np.minimum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]) / downscale
+        small = boxes[sizes < self.options["small_box_px"]]
+        if len(small) == 0:
+            return tiles[:0]
+        touches = (
+            (small[None, :, 0] < tiles[:, None, 2]) & (small[None, :, 2] > tiles[:, None, 0])
+            & (small[None, :, 1] < tiles[:, None, 3]) & (small[None, :, 3] > tiles[:, None, 1])
+        )
+        return tiles[touches.any(axis=1)]
+
+    def detect(self, model, image):
+        """
+        Detecta objetos en una imagen combinando frame completo y mosaicos.
+
+        Args:
+            model: Modelo YOLO.
+            image (PIL.Image.Image): Imagen RGB.
+
+        Returns:
+            list: Tuplas (nombre, confianza, xmin, ymin, xmax, ymax) con coordenadas float.
+        """
+        self.frames += 1
+        width, height = image.size
+        boxes, scores, classes, names = results_to_arrays(model(image))
+
+        tiles = self._select_tiles(width, height, boxes)
+        if len(tiles):
+            # Todos los mosaicos en un único lote
+            crops = [image.crop(tuple(int(v) for v in tile)) for tile in tiles]
+            tile_boxes, tile_scores, tile_classes, names = results_to_arrays(model(crops), tiles[:, :2])
+
+            full_count = len(boxes)
+            fixed = np.arange(full_count + len(tile_boxes)) < full_count
+            boxes = np.concatenate([boxes, tile_boxes])
+            scores = np.concatenate([scores, tile_scores])
+            classes = np.concatenate([classes, tile_classes])
+            # Solo se filtran las cajas de los mosaicos (duplicadas entre sí o con el frame
+            # completo); las del frame completo, ya filtradas por el modelo, se conservan
+            keep = non_max_suppression(
+                boxes, scores, classes, self.options["nms_threshold"], self.options["nms_metric"], fixed
+            )
+            boxes, scores, classes = boxes[keep], scores[keep], classes[keep]
+
+            self.detections_gained += max(len(keep) - full_count, 0)
+            self.tiled_frames += 1
+            self.tiles_run += len(tiles)
+        self._previous_boxes = boxes
+
+        return [
+            (names[int(cls)], score, *box)
+            for box, score, cls in zip(boxes.tolist(), scores.tolist(), classes.tolist())
+        ]
+
+    @property
+    def stats(self):
+        """
+        Resumen del uso de mosaicos: frames inferidos, frames con mosaicos, mosaicos
+        ejecutados y detecciones añadidas respecto al frame completo.
+        """
+        return {
+            "mode": self.options["mode"],
+            "frames": self.frames,
+            "tiled_frames": self.tiled_frames,
+            "tiles_run": self.tiles_run,
+            "detections_gained": self.detections_gained,
+        }
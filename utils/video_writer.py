@@ -0,0 +1,467 @@
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+import cv2
+
+# Codificadores disponibles para el video anotado
+ENCODERS = ("h264", "mp4v")
+
+# Modos de salida:
+#   - full: todos los frames a resolución original.
+#   - keyframes: solo los frames muestreados (con detecciones actualizadas).
+#   - preview: todos los frames a baja resolución.
+OUTPUT_MODES = ("full", "keyframes", "preview")
+
+# Contenedores de salida:
+#   - mp4: un único archivo, disponible al terminar.
+#   - hls: segmentos fMP4 + lista HLS escritos durante el procesamiento; se pueden
+#     reproducir y descargar antes de que termine (requiere ffmpeg).
+CONTAINERS = ("mp4", "hls")
+
+DEFAULT_OUTPUT_OPTIONS = {
+    "encoder": "h264",
+    "mode": "full",
+    "preset": "superfast",
+    "crf": 28,
+    "preview_width": 640,
+    "threaded": True,
+    # Segundos de la tarjeta final con el conteo total (0 = sin tarjeta)
+    "title_card_s": 2.0,
+    "container": "mp4",
+    # HLS: duración de cada segmento y segmentos conservados en disco (0 = todos; con
+    # ventana deslizante el video final solo contiene los últimos, p. ej. en transmisiones)
+    "segment_s": 2.0,
+    "segment_window": 0,
+    # HLS: segmentos más recientes incluidos en la vista previa durante el procesamiento
+    "preview_segments": 5,
+}
+
+
+def ffmpeg_path():
+    """
+    Devuelve la ruta del ejecutable de ffmpeg o None si no está instalado.
+    """
+    return shutil.which("ffmpeg")
+
+
+class OpenCVWriter:
+    """
+    Escritor basado en `cv2.VideoWriter` con el fourcc `mp4v` (sin dependencias externas).
+    """
+
+    encoder = "mp4v"
+
+    def __init__(self, output_path, fps, frame_size):
+        self._writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, frame_size)
+
+    def write(self, frame):
+        self._writer.write(frame)
+
+    def release(self):
+        self._writer.release()
+
+
+class FFmpegWriter:
+    """
+    Escritor que envía frames BGR crudos por tubería a ffmpeg y codifica en H.264.
+
+    El resultado usa `yuv420p` y `+faststart`, por lo que los navegadores pueden
+    reproducirlo directamente con `st.video`.
+
+    Args:
+        output_path (str): Ruta del archivo de salida.
+        fps (float): Frames por segundo del video de salida.
+        frame_size (tuple): (ancho, alto) de los frames de entrada.
+        preset (str): Preset de x264 (ultrafast ... veryslow); más rápido implica archivos mayores.
+        crf (int): Calidad constante de x264 (0-51); mayor valor implica archivos menores.
+    """
+
+    encoder = "h264"
+
+    def __init__(self, output_path, fps, frame_size, preset="superfast", crf=28):
+        width, height = frame_size
+        command = [
+            ffmpeg_path(), "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", f"{fps}",
+            "-i", "-",
+            "-an",
+            # yuv420p exige dimensiones pares
+            "-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2",
+            "-c:v", "libx264", "-preset", preset, "-crf", str(crf),
+            "-pix_fmt", "yuv420p", "-movflags", "+faststart",
+            output_path,
+        ]
+        self._stderr = tempfile.TemporaryFile()
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=self._stderr)
+
+    def write(self, frame):
+        self._process.stdin.write(frame.tobytes())
+
+    def release(self):
+        self._process.stdin.close()
+        returncode = self._process.wait()
+        self._stderr.seek(0)
+        error = self._stderr.read().decode(errors="replace").strip()
+        self._stderr.close()
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg terminó con código {returncode}: {error}")
+
+
+class HLSWriter:
+    """
+    Escritor que codifica en H.264 con ffmpeg y escribe segmentos fMP4 con una lista
+    HLS (`index.m3u8`) a medida que avanza el video.
+
+    Cada segmento empieza en un fotograma clave forzado, así que el segmento de
+    inicialización seguido de cualquier serie de segmentos consecutivos es un MP4
+    fragmentado reproducible: el video se puede ver y descargar mientras se procesan
+    los siguientes. Con `window` > 0 ffmpeg borra los segmentos que salen de la lista
+    y el disco usado no crece con la duración. Al cerrar, los segmentos de la lista se
+    unen (sin recodificar) en `output_path`.
+
+    Args:
+        output_path (str): Archivo MP4 final.
+        fps (float): Frames por segundo del video de salida.
+        frame_size (tuple): (ancho, alto) de los frames de entrada.
+        preset (str): Preset de x264.
+        crf (int): Calidad constante de x264.
+        segment_s (float): Duración de cada segmento en segundos.
+        window (int): Segmentos conservados (0 = todos).
+    """
+
+    encoder = "h264"
+
+    def __init__(self, output_path, fps, frame_size, preset="superfast", crf=28, segment_s=2.0, window=0):
+        width, height = frame_size
+        self.output_path = output_path
+        self.directory = tempfile.mkdtemp(prefix="crosscounter-hls-")
+        self.playlist_path = os.path.join(self.directory, "index.m3u8")
+        self.init_path = os.path.join(self.directory, "init.mp4")
+        flags = "independent_segments+delete_segments" if window else "independent_segments"
+        command = [
+            ffmpeg_path(), "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", f"{fps}",
+            "-i", "-",
+            "-an",
+            "-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2",
+            "-c:v", "libx264", "-preset", preset, "-crf", str(crf), "-pix_fmt", "yuv420p",
+            # Un fotograma clave al inicio de cada segmento: los segmentos duran exactamente `segment_s`
+            "-force_key_frames", f"expr:gte(t,n_forced*{segment_s})",
+            "-f", "hls", "-hls_time", str(segment_s), "-hls_list_size", str(int(window)),
+            "-hls_segment_type", "fmp4", "-hls_fmp4_init_filename", "init.mp4",
+            "-hls_segment_filename", os.path.join(self.directory, "segment-%05d.m4s"),
+            "-hls_flags", flags,
+        ]
+        if not window:
+            command += ["-hls_playlist_type", "event"]
+        command.append(self.playlist_path)
+        self._stderr = tempfile.TemporaryFile()
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=self._stderr)
+
+    def write(self, frame):
+        self._process.stdin.write(frame.tobytes())
+
+    def playlist(self):
+        """
+        Segmentos terminados que figuran en la lista.
+
+        Returns:
+            tuple: (segmentos producidos hasta ahora, rutas de los segmentos de la lista).
+        """
+        try:
+            with open(self.playlist_path, encoding="utf-8") as file:
+                lines = file.read().splitlines()
+        except OSError:
+            return 0, []
+        sequence = 0
+        paths = []
+        for line in lines:
+            if line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+                sequence = int(line.split(":", 1)[1])
+            elif line and not line.startswith("#"):
+                paths.append(os.path.join(self.directory, line))
+        return sequence + len(paths), paths
+
+    def read(self, last=None):
+        """
+        MP4 fragmentado con el segmento de inicialización y los últimos `last` segmentos
+        de la lista (todos si es None).
+
+        Returns:
+            bytes: Video reproducible, o b"" si aún no hay segmentos.
+        """
+        _, paths = self.playlist()
+        if last:
+            paths = paths[-last:]
+        chunks = []
+        try:
+            with open(self.init_path, "rb") as file:
+                chunks.append(file.read())
+        except OSError:
+            return b""
+        for path in paths:
+            try:
+                with open(path, "rb") as file:
+                    chunks.append(file.read())
+            except OSError:
+                continue  # Borrado por la ventana deslizante entre la lectura de la lista y la del segmento
+        return b"".join(chunks) if len(chunks) > 1 else b""
+
+    def release(self):
+        self._process.stdin.close()
+        returncode = self._process.wait()
+        self._stderr.seek(0)
+        error = self._stderr.read().decode(errors="replace").strip()
+        self._stderr.close()
+        if returncode != 0:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            raise RuntimeError(f"ffmpeg terminó con código {returncode}: {error}")
+        self.segments, paths = self.playlist()
+        # Segmento de inicialización + segmentos, por bloques: sin cargar el video en memoria
+        with open(self.output_path, "wb") as output:
+            for path in [self.init_path] + paths:
+                with open(path, "rb") as file:
+                    shutil.copyfileobj(file, output)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class ThreadedWriter:
+    """
+    Ejecuta la codificación en un hilo dedicado para que no bloquee la inferencia.
+
+    Args:
+        writer: Escritor subyacente (`OpenCVWriter` o `FFmpegWriter`).
+        max_queued_frames (int): Frames en cola como máximo; limita la memoria usada.
+    """
+
+    def __init__(self, writer, max_queued_frames=64):
+        self.encoder = writer.encoder
+        self.encode_s = 0.0
+        self._writer = writer
+        self._queue = queue.Queue(maxsize=max_queued_frames)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="video-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            frame = self._queue.get()
+            if frame is None:
+                break
+            if self._error is not None:
+                continue
+            start = time.perf_counter()
+            try:
+                self._writer.write(frame)
+            except Exception as e:
+                self._error = e
+            self.encode_s += time.perf_counter() - start
+
+    def write(self, frame):
+        if self._error is not None:
+            raise RuntimeError(f"Error al codificar el video: {self._error}")
+        # Copia: el llamador reutiliza y modifica el buffer del frame
+        self._queue.put(frame.copy())
+
+    def release(self):
+        self._queue.put(None)
+        self._thread.join()
+        start = time.perf_counter()
+        self._writer.release()
+        self.encode_s += time.perf_counter() - start
+        if self._error is not None:
+            raise RuntimeError(f"Error al codificar el video: {self._error}")
+
+
+class AnnotatedVideoWriter:
+    """
+    Escritor del video anotado que aplica el modo de salida y el codificador elegidos.
+
+    Uso:
+        writer = create_video_writer(output_path, fps, (width, height), frame_interval=30)
+        writer.write(frame, keyframe=frame_count % frame_interval == 0)
+        writer.write_title_card(render_title_card((width, height), total_count))
+        writer.release()
+    """
+
+    def __init__(self, backend, mode, output_size, fps=30.0, title_card_s=0.0, segmenter=None, preview_segments=5,
+                 fallback=None):
+        self.mode = mode
+        # Motivo por el que no se usa la salida pedida (p. ej. HLS sin ffmpeg), o None
+        self.fallback = fallback
+        self.output_size = output_size
+        self.fps = fps
+        self.title_card_s = title_card_s
+        self.preview_segments = preview_segments
+        self.frames_written = 0
+        self.title_card_frames = 0
+        self._backend = backend
+        self._segmenter = segmenter
+        self._segments_seen = 0
+        self._encode_s = 0.0
+
+    @property
+    def encoder(self):
+        return self._backend.encoder
+
+    @property
+    def progressive(self):
+        """
+        True si la salida se escribe por segmentos HLS (reproducible antes de terminar).
+        """
+        return self._segmenter is not None
+
+    def new_segments(self):
+        """
+        Segmentos terminados desde la última llamada (0 sin salida progresiva).
+        """
+        if self._segmenter is None:
+            return 0
+        produced = self._segmenter.playlist()[0]
+        new = produced - self._segments_seen
+        self._segments_seen = produced
+        return new
+
+    def preview(self):
+        """
+        MP4 fragmentado con los `preview_segments` segmentos más recientes, para ver y
+        descargar el resultado durante el procesamiento con memoria acotada.
+
+        Returns:
+            bytes: Video reproducible, o b"" si aún no hay segmentos.
+        """
+        if self._segmenter is None:
+            return b""
+        return self._segmenter.read(self.preview_segments)
+
+    def write(self, frame, keyframe=True):
+        """
+        Escribe un frame según el modo de salida.
+
+        Args:
+            frame (numpy.ndarray): Frame BGR anotado.
+            keyframe (bool): True si el frame fue muestreado para inferencia.
+        """
+        if self.mode == "keyframes" and not keyframe:
+            return
+        if (frame.shape[1], frame.shape[0]) != self.output_size:
+            frame = cv2.resize(frame, self.output_size, interpolation=cv2.INTER_AREA)
+
+        start = time.perf_counter()
+        self._backend.write(frame)
+        self._encode_s += time.perf_counter() - start
+        self.frames_written += 1
+
+    def write_title_card(self, card):
+        """
+        Añade al final del video la tarjeta de cierre durante `title_card_s` segundos.
+
+        Los frames repetidos son idénticos, por lo que el codificador los comprime casi
+        sin coste: el total queda en el video sin una segunda pasada de codificación.
+
+        Args:
+            card (numpy.ndarray): Frame BGR de la tarjeta (ver `utils.overlay.render_title_card`).
+        """
+        frames = int(round(self.title_card_s * self.fps))
+        for _ in range(frames):
+            self.write(card, keyframe=True)
+        self.title_card_frames += frames
+
+    def release(self):
+        """
+        Cierra el video y espera a que termine la codificación.
+        """
+        start = time.perf_counter()
+        self._backend.release()
+        self._encode_s += time.perf_counter() - start
+
+    @property
+    def stats(self):
+        """
+        Resumen de la salida: codificador, modo, frames escritos y tiempo de codificación.
+        """
+        encode_s = getattr(self._backend, "encode_s", None)
+        return {
+            "encoder": self.encoder,
+            "mode": self.mode,
+            "container": "hls" if self._segmenter is not None else "mp4",
+            "segments": getattr(self._segmenter, "segments", None),
+            "fallback": self.fallback,
+            "output_size": list(self.output_size),
+            "frames_written": self.frames_written,
+            "title_card_frames": self.title_card_frames,
+            # Con hilo dedicado, tiempo real de codificación; sin él, tiempo bloqueante
+            "encode_s": round(encode_s if encode_s is not None else self._encode_s, 6),
+        }
+
+
+def create_video_writer(output_path, fps, frame_size, frame_interval=1, **options):
+    """
+    Crea el escritor del video anotado.
+
+    Args:
+        output_path (str): Ruta del archivo de salida.
+        fps (float): Frames por segundo del video de entrada.
+        frame_size (tuple): (ancho, alto) de los frames de entrada.
+        frame_interval (int): Intervalo de muestreo; en modo `keyframes` fija los fps de salida.
+        **options: Sobrescriben `DEFAULT_OUTPUT_OPTIONS` (encoder, mode, preset, crf,
+            preview_width, threaded, title_card_s, container, segment_s, segment_window,
+            preview_segments).
+
+    Returns:
+        AnnotatedVideoWriter: Escritor listo para usar. Si la salida pedida no está
+        disponible, su atributo `fallback` explica qué se usa en su lugar.
+    """
+    options = {**DEFAULT_OUTPUT_OPTIONS, **{k: v for k, v in options.items() if v is not None}}
+    if options["encoder"] not in ENCODERS:
+        raise ValueError(f"Codificador no soportado: {options['encoder']}")
+    if options["mode"] not in OUTPUT_MODES:
+        raise ValueError(f"Modo de salida no soportado: {options['mode']}")
+    if options["container"] not in CONTAINERS:
+        raise ValueError(f"Contenedor de salida no soportado: {options['container']}")
+
+    fps = fps if fps and fps > 0 else 30.0
+    width, height = frame_size
+
+    output_size = (width, height)
+    if options["mode"] == "preview" and width > options["preview_width"]:
+        scale = options["preview_width"] / width
+        output_size = (options["preview_width"], int(height * scale) // 2 * 2)
+
+    # En modo keyframes cada frame escrito representa un intervalo de muestreo
+    output_fps = max(fps / frame_interval, 1.0) if options["mode"] == "keyframes" else fps
+
+    # H.264 y HLS requieren ffmpeg; si no está instalado se usa un único archivo mp4v
+    segmenter = None
+    fallback = None
+    if options["container"] == "hls" and options["encoder"] != "h264":
+        fallback = "La reproducción progresiva (HLS) requiere el codificador H.264: se genera un único archivo MP4."
+    elif options["encoder"] == "h264" and not ffmpeg_path():
+        fallback = (
+            "La reproducción progresiva (HLS) requiere ffmpeg, que no está instalado: se genera un único archivo MP4."
+            if options["container"] == "hls" else
+            "El codificador H.264 requiere ffmpeg, que no está instalado: se usa mp4v."
+        )
+    if options["encoder"] == "h264" and ffmpeg_path():
+        if options["container"] == "hls":
+            backend = segmenter = HLSWriter(
+                output_path, output_fps, output_size, options["preset"], options["crf"],
+                options["segment_s"], options["segment_window"],
+            )
+        else:
+            backend = FFmpegWriter(output_path, output_fps, output_size, options["preset"], options["crf"])
+    else:
+        backend = OpenCVWriter(output_path, output_fps, output_size)
+
+    if options["threaded"]:
+        backend = ThreadedWriter(backend)
+
+    return AnnotatedVideoWriter(
+        backend, options["mode"], output_size, output_fps, options["title_card_s"],
+        segmenter=segmenter, preview_segments=options["preview_segments"], fallback=fallback,
+    )
@@ -1,10 +1,25 @@
 import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
-from utils.mongodb import get_inference_statistics, inspect_mongodb_data  # Importar desde mongodb.py
+from utils.mongodb import (  # Importar desde mongodb.py
+    get_inference_statistics,
+    get_source_totals,
+    inspect_mongodb_data,
+    list_sources,
+    resolve_cameras,
+    time_range,
+)
+from utils import analytics
+from utils.heatmap import list_heatmap_cameras, load_heatmap, render_heatmap
+from utils.export import EXPORT_FORMATS, EXPORT_KINDS, export_results
 from PIL import Image, ImageDraw
-from datetime import datetime
+import os
+import tempfile
+from datetime import datetime, timedelta
 
+# Tamaño máximo de una exportación descargable desde la aplicación (el archivo se
+# envía al navegador desde memoria); las mayores se hacen con `python -m utils.export`
+EXPORT_DOWNLOAD_MAX_MB = int(os.environ.get("CROSSCOUNTER_EXPORT_DOWNLOAD_MAX_MB", "200"))
 
 
 def show_statistics():
@@ -58,8 +73,19 @@ def show_statistics():
         filters = {"year": selected_year}
         level = "year"
 
+    # Selección de cámaras y sitios (sin selección se incluyen todas)
+    source_list = list_sources()
+    site_options = sorted({source["site"] for source in source_list if source["site"]})
+    selected_sites = st.sidebar.multiselect("Sitios", site_options) if site_options else []
+    camera_names = {source["camera"]: source["name"] for source in source_list}
+    selected_cameras = st.sidebar.multiselect(
+        "Cámaras", list(camera_names), format_func=lambda camera: camera_names.get(camera, camera)
+    )
+    cameras = resolve_cameras(selected_cameras, selected_sites)
+    compare = st.sidebar.checkbox("Comparar cámaras", value=False)
+
     # Obtener datos del pipeline
-    pipeline_results = get_inference_statistics(level, filters)
+    pipeline_results = get_inference_statistics(level, filters, cameras=cameras, by_camera=compare)
 
     if pipeline_results is None or len(pipeline_results) == 0:
         st.write("No hay datos de estadísticas disponibles.")
@@ -91,22 +117,162 @@ def show_statistics():
         st.write("DataFrame Generado:", data)
 
         # Mostrar gráficos
-        if level == "day":
-            st.subheader("Estadísticas por Hora")
-            st.bar_chart(data.set_index("Hora")["Cantidad de Motocicletas"])
-
-        elif level == "month":
-            st.subheader("Estadísticas por Día")
-            st.bar_chart(data.set_index("Día")["Cantidad de Motocicletas"])
+        period, title = {
+            "day": ("Hora", "Estadísticas por Hora"),
+            "month": ("Día", "Estadísticas por Día"),
+            "year": ("Mes", "Estadísticas por Mes"),
+        }[level]
+        st.subheader(title)
+        if compare:
+            # Una serie de barras por cámara
+            figure = go.Figure([
+                go.Bar(
+                    name=camera_names.get(camera, camera),
+                    x=camera_data[period],
+                    y=camera_data["Cantidad de Motocicletas"],
+                )
+                for camera, camera_data in data.groupby("camera")
+            ])
+            figure.update_layout(barmode="group", xaxis_title=period, yaxis_title="Cantidad de Motocicletas")
+            st.plotly_chart(figure, use_container_width=True)
+        else:
+            st.bar_chart(data.set_index(period)["Cantidad de Motocicletas"])
 
-        elif level == "year":
-            st.subheader("Estadísticas por Mes")
-            st.bar_chart(data.set_index("Mes")["Cantidad de Motocicletas"])
+        # Totales por cámara del periodo seleccionado
+        totals = get_source_totals(filters, cameras)
+        if len(totals) > 1 or compare:
+            st.subheader("Totales por Cámara")
+            st.dataframe(totals, hide_index=True)
 
     except Exception as e:
         st.error(f"Error procesando los datos: {e}")
         return
 
+    show_advanced_statistics(filters, cameras)
+    show_heatmap(filters, cameras)
+
+
+def show_advanced_statistics(filters, cameras=None):
+    """
+    Perfil por hora del día (media y percentiles), horas pico y variación semanal,
+    calculados con DuckDB sobre la réplica local (ver `utils.analytics`), sin consultar
+    MongoDB.
+
+    Args:
+        filters (dict): Periodo seleccionado ({'year', 'month', 'day'}).
+        cameras (list[str]): Cámaras a incluir (None = todas).
+    """
+    with st.expander("Análisis avanzado (réplica local)"):
+        try:
+            if st.button("Reconstruir réplica"):
+                with st.spinner("Reconstruyendo la réplica local..."):
+                    analytics.sync_mirror(full=True)
+            else:
+                analytics.sync_if_stale()
+        except ImportError:
+            st.info("El análisis avanzado requiere duckdb y pyarrow.")
+            return
+        except Exception as e:
+            st.warning(f"No se pudo sincronizar la réplica local: {e}")
+
+        status = analytics.mirror_status()
+        st.caption(f"Réplica local: {status['rows']} filas, datos hasta {status['watermark']}.")
+
+        start, end = time_range(filters) or (None, None)
+        profile = analytics.hourly_profile(start, end, cameras)
+        if profile.empty:
+            st.write("No hay datos en la réplica para el periodo seleccionado.")
+            return
+
+        st.subheader("Motocicletas por Frame según la Hora del Día")
+        st.line_chart(profile.set_index("hora")[["media", "p50", "p95"]])
+
+        st.subheader("Horas Pico")
+        st.dataframe(analytics.peak_hours(start, end, cameras), hide_index=True)
+
+        st.subheader("Semana a Semana")
+        st.dataframe(analytics.week_over_week(end=min(end, datetime.now()) if end else None, cameras=cameras), hide_index=True)
+
+
+def show_heatmap(filters, cameras=None):
+    """
+    Mapa de calor de las posiciones de las motocicletas en el periodo seleccionado,
+    sobre un frame de referencia de la cámara (ver `utils.heatmap`).
+
+    Args:
+        filters (dict): Periodo seleccionado ({'year', 'month', 'day'}).
+        cameras (list[str]): Cámaras a incluir (None = todas).
+    """
+    with st.expander("Mapa de calor"):
+        available = list_heatmap_cameras()
+        options = [camera for camera in available if cameras is None or camera in cameras]
+        if not options:
+            st.write("No hay mapas de calor guardados para las cámaras seleccionadas.")
+            return
+        # Cada cámara tiene su propia vista: los mapas solo se suman dentro de una cámara
+        camera = st.selectbox("Cámara", options, key="heatmap_camera")
+        start, end = time_range(filters) or (None, None)
+        counts, frames, background = load_heatmap([camera], start, end)
+        if counts is None:
+            st.write("No hay datos de posiciones en el periodo seleccionado.")
+            return
+        st.image(
+            render_heatmap(counts, background), channels="BGR", use_container_width=True,
+            caption=f"{frames} frames muestreados",
+        )
+
+
+def show_export():
+    """
+    Exporta detecciones o totales por hora a CSV, Parquet o NDJSON.
+
+    El archivo se escribe lote a lote con un cursor de MongoDB (ver `utils.export`)
+    en un directorio temporal que se borra en cuanto se lee para la descarga. Las
+    exportaciones de más de `EXPORT_DOWNLOAD_MAX_MB` no se descargan: se indica el
+    comando equivalente de la línea de comandos.
+    """
+    with st.expander("Exportar datos"):
+        current_date = datetime.now().date()
+        export_format = st.selectbox("Formato", EXPORT_FORMATS, key="export_format")
+        kind = st.selectbox(
+            "Datos", EXPORT_KINDS, key="export_kind",
+            format_func=lambda kind: {"detections": "Conteos por frame", "hourly": "Totales por cámara y hora"}[kind],
+        )
+        date_range = st.date_input(
+            "Rango de fechas", value=(current_date.replace(day=1), current_date), key="export_dates"
+        )
+        source_list = list_sources()
+        cameras = st.multiselect("Cámaras", [source["camera"] for source in source_list], key="export_cameras")
+
+        if st.button("Preparar exportación"):
+            start = datetime.combine(date_range[0], datetime.min.time()) if date_range else None
+            end = datetime.combine(date_range[-1], datetime.min.time()) + timedelta(days=1) if date_range else None
+            file_name = f"crosscounter-{kind}-{datetime.now():%Y%m%d-%H%M%S}.{export_format}"
+            with tempfile.TemporaryDirectory(prefix="crosscounter-export-") as directory:
+                path = os.path.join(directory, file_name)
+                with st.spinner("Exportando..."):
+                    rows = export_results(path, export_format, kind, start, end, cameras or None)
+                size_mb = os.path.getsize(path) / 2 ** 20
+                data = None
+                if size_mb <= EXPORT_DOWNLOAD_MAX_MB:
+                    with open(path, "rb") as file:
+                        data = file.read()
+
+            if data is None:
+                command = f"python -m utils.export --kind {kind} --format {export_format}"
+                if start:
+                    command += f" --start {start:%Y-%m-%d} --end {end:%Y-%m-%d}"
+                command += "".join(f" --camera {camera}" for camera in cameras)
+                st.warning(
+                    f"La exportación ({rows} filas, {size_mb:.0f} MB) supera el límite de descarga de "
+                    f"{EXPORT_DOWNLOAD_MAX_MB} MB. Exporta desde la línea de comandos:"
+                )
+                st.code(f"{command} --output {file_name}", language="bash")
+            else:
+                st.success(f"{rows} filas exportadas.")
+                # Sin relanzar el script al descargar: el archivo solo existe en esta ejecución
+                st.download_button("Descargar", data=data, file_name=file_name, on_click="ignore")
+
 
 def draw_detections(image, detections):
     """
@@ -1,9 +1,11 @@
 import os
 import base64
 import qrcode
+import streamlit as st
 from io import BytesIO
 
-# Convertir imágenes a Base64
+# Convertir imágenes a Base64 (una sola vez por proceso, no en cada rerun)
+@st.cache_resource(show_spinner=False)
 def get_base64_image(image_path):
     """
     Convierte una imagen a Base64.
@@ -17,22 +19,14 @@ def get_base64_image(image_path):
     with open(image_path, "rb") as img_file:
         return base64.b64encode(img_file.read()).decode("utf-8")
 
-# Generar imágenes Base64 desde la carpeta /media
+# Imágenes de la carpeta /media
 logo_path = os.path.join(os.path.dirname(__file__), "../media/logox512.jpg")
-logo_base64 = get_base64_image(logo_path)
-
 Enrique_path = os.path.join(os.path.dirname(__file__), "../media/Enrique.jpg")
-Enrique_base64 = get_base64_image(Enrique_path)
-
 Alex_path = os.path.join(os.path.dirname(__file__), "../media/Alex.jpg")
-Alex_base64 = get_base64_image(Alex_path)
-
 Adriana_path = os.path.join(os.path.dirname(__file__), "../media/Adriana.jpg")
-Adriana_base64 = get_base64_image(Adriana_path)
-
 Jeisson_path = os.path.join(os.path.dirname(__file__), "../media/Jeisson.jpg")
-Jeisson_base64 = get_base64_image(Jeisson_path)
 
+@st.cache_resource(show_spinner=False)
 def generate_qr_code(video_url):
     """
     Genera un código QR en Base64 para un enlace.
@@ -88,13 +82,14 @@ def anchor_html():
     <div id="inicio"></div>
     """
 
+@st.cache_resource(show_spinner=False)
 def header_html():
     """
     Encabezado principal con logo y navegación.
     """
     return f"""
     <div class="header">
-        <img src="data:image/jpeg;base64,{logo_base64}" alt="Logo">
+        <img src="data:image/jpeg;base64,{get_base64_image(logo_path)}" alt="Logo">
         <h1>AI·MotorCycle CrossCounter TalentoTECH</h1>
         <div class="nav">
             <a href="#inicio">Inicio</a>
@@ -104,13 +99,14 @@ def header_html():
     </div>
     """
 
+@st.cache_resource(show_spinner=False)
 def logo_separator_html():
     """
     Separador con el logo en el centro.
     """
     return f"""
     <div style="text-align: center; margin: 20px 0;">
-        <img src="data:image/jpeg;base64,{logo_base64}" alt="Logo" style="width: 150px;">
+        <img src="data:image/jpeg;base64,{get_base64_image(logo_path)}" alt="Logo" style="width: 150px;">
     </div>
     """
 
@@ -144,6 +140,7 @@ def about_section_html():
     </div>
     """
 
+@st.cache_resource(show_spinner=False)
 def team_section_html():
     """
     Sección del equipo con tarjetas de presentación.
@@ -151,22 +148,22 @@ def team_section_html():
     return f"""
     <div class="team-container">
         <div class="team-card">
-            <img src="data:image/jpeg;base64,{Enrique_base64}" alt="Luis Enrique Guerrero">
+            <img src="data:image/jpeg;base64,{get_base64_image(Enrique_path)}" alt="Luis Enrique Guerrero">
             <h3>Luis Enrique Guerrero<br></h3>
             <p>Ingeniero de Infraestructura<br>Desarrollo Fullstack</p>
         </div>
         <div class="team-card">
-            <img src="data:image/jpeg;base64,{Alex_base64}" alt="Alex García">
+            <img src="data:image/jpeg;base64,{get_base64_image(Alex_path)}" alt="Alex García">
             <h3>Alex García<br></h3>
             <p>Líder de Proyecto<br>Especialista en Machine Learning</p>
         </div>
         <div class="team-card">
-            <img src="data:image/jpeg;base64,{Adriana_base64}" alt="Adriana Garay">
+            <img src="data:image/jpeg;base64,{get_base64_image(Adriana_path)}" alt="Adriana Garay">
             <h3>Adriana Garay<br></h3>
             <p>Coordinadora de Presentaciones<br>Gestión de Datos</p>
         </div>
         <div class="team-card">
-            <img src="data:image/jpeg;base64,{Jeisson_base64}" alt="Jeisson Poveda">
+            <img src="data:image/jpeg;base64,{get_base64_image(Jeisson_path)}" alt="Jeisson Poveda">
             <h3>Jeisson Poveda<br></h3>
             <p>Gestor de Recursos<br>Analista de Datos</p>
         </div>